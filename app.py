@@ -1,11 +1,13 @@
 ﻿import os
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, request, jsonify, render_template, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
 from pathlib import Path
+import json
 import time
 from functools import wraps
+from contextlib import nullcontext
 
 # Load environment variables
 load_dotenv()
@@ -42,13 +44,49 @@ def monitor_performance(route_name):
         return wrapped
     return decorator
 
+# Pagination for list endpoints
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def pagination_args():
+    """Read ?limit=, ?cursor= and ?fields= from the query string
+    
+    Returns (limit, cursor, fields). Without limit or cursor the whole list
+    is returned, so existing clients keep working.
+    """
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor') or None
+    if limit is not None and limit < 1:
+        raise ValueError('limit must be a positive integer')
+    if limit is None and cursor:
+        limit = DEFAULT_PAGE_SIZE
+    if limit is not None:
+        limit = min(limit, MAX_PAGE_SIZE)
+    
+    fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+    return limit, cursor, fields or None
+
+# Admission control in front of the LLM client: bounded concurrency and queue
+from models.scheduler import LLMScheduler, SchedulerBusy, INTERACTIVE, BATCH
+from models.llm_client import LLMError
+from models.map_reduce import (split_text, document_text, map_parallel, map_completions, reduce_texts,
+                               allocate, merge_flashcards)
+from models.flashcards import FLASHCARD_SCHEMA, FlashcardStreamParser, parse_flashcards_json, validate_flashcard
+
 # Import components (with graceful fallback for development)
 try:
     from models.llm_client import LLMClient
-    llm_client = LLMClient()
+    completion_cache = None
+    if os.getenv("LLM_CACHE", "1") != "0":
+        from models.completion_cache import CompletionCache
+        completion_cache = CompletionCache()
+    llm_client = LLMClient(cache=completion_cache)
+    llm_scheduler = LLMScheduler()
     print("âœ“ LLM client initialized successfully")
 except Exception as e:
     print(f"âš  Warning: Could not initialize LLM client: {e}")
+    llm_client = None
+    llm_scheduler = None
 
 # Initialize Bookmarks Database
 try:
@@ -72,6 +110,18 @@ except Exception as e:
     print(f"⚠ Warning: Could not initialize Chat history database: {e}")
     chat_db = None
 
+# Chat history sent to the LLM is rebuilt server-side within a token budget
+CHAT_HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", "2000"))
+try:
+    from models.conversation import ConversationContext, trim_history
+    conversation = None
+    if chat_db and llm_client:
+        conversation = ConversationContext(chat_db, llm_client, token_budget=CHAT_HISTORY_TOKENS)
+except Exception as e:
+    print(f"⚠ Warning: Could not initialize conversation context: {e}")
+    conversation = None
+    trim_history = None
+
 # Initialize Notes Database
 try:
     from app.notes_db import NotesDatabase
@@ -89,6 +139,15 @@ except Exception as e:
     print(f"âš  Warning: Could not initialize Todo database: {e}")
     todo_db = None
 
+# Initialize background ingestion jobs
+try:
+    from app.jobs_db import JobsDatabase
+    from models.ingest_jobs import IngestionJobQueue
+    ingest_queue = IngestionJobQueue(JobsDatabase(), data_dir=UPLOAD_FOLDER)
+except Exception as e:
+    print(f"⚠ Warning: Could not initialize ingestion job queue: {e}")
+    ingest_queue = None
+
 # Retriever is optional - will work without it
 # Temporarily disabled due to sentence-transformers compatibility issues
 retriever = None
@@ -123,44 +182,24 @@ def health():
     return jsonify({
         'status': 'ok',
         'ollama_connected': llm_client is not None,
-        'pinecone_connected': retriever is not None
+        'pinecone_connected': retriever is not None,
+        'llm_queue': llm_scheduler.stats() if llm_scheduler else None,
+        'llm_coalesced': llm_client.coalesced if llm_client else 0
     })
 
-@app.route('/chat', methods=['POST'])
-@monitor_performance('POST /chat')
-def chat():
-    """Handle chat requests"""
-    try:
-        data = request.json
-        user_message = data.get('message', '')
-        history = data.get('history', [])
-        chat_id = data.get('chat_id')  # Optional: ID of current chat
-        
-        if not user_message:
-            return jsonify({'error': 'No message provided'}), 400
-        
-        # Create a new chat if chat_id not provided
-        if chat_db and not chat_id:
-            # Generate a title from the first message (first 50 chars)
-            title = user_message[:50] + ('...' if len(user_message) > 50 else '')
-            chat_id = chat_db.create_chat(title)
-        
-        # Save user message to database
-        if chat_db and chat_id:
-            chat_db.add_message(chat_id, 'user', user_message)
-        
-        # Get relevant context from Pinecone (if available)
-        context = ""
-        if retriever:
-            try:
-                relevant_docs = retriever.get_relevant_documents(user_message)
-                if relevant_docs:
-                    context = "\n\nRelevant information from your documents:\n" + "\n".join(relevant_docs)
-            except Exception as e:
-                print(f"Warning: Could not retrieve context: {e}")
-        
-        # Prepare system prompt with context
-        system_prompt = """You are Jarvis, a study notes assistant. 
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters for the in-process caches"""
+    stats = {}
+    if retriever:
+        stats['retrieval'] = retriever.cache_stats()
+    if llm_client and llm_client.cache:
+        stats['completions'] = llm_client.cache.stats()
+    return jsonify({'caches': stats, 'status': 'success'})
+
+# ============= CHAT HELPERS =============
+
+CHAT_SYSTEM_PROMPT = """You are Jarvis, a study notes assistant. 
 
 IMPORTANT FORMATTING RULES:
 - Start with a clear heading
@@ -187,98 +226,231 @@ Example response format:
 â€¢ Odd: ends in 1, 3, 5, 7, 9
 
 Keep it simple, clean, and well-spaced."""
-        if context:
-            system_prompt += "\n\n" + context
-        
-        # Get response from LLM
-        if llm_client:
-            response = llm_client.get_completion_sync(
-                user_message,
-                history=history,
-                system_prompt=system_prompt
-            )
-            
-            # Post-process response to ensure proper line breaks
-            # Add line breaks after bullet points and numbers
-            response = response.replace('â€¢ ', '\nâ€¢ ')
-            response = response.replace('1ï¸âƒ£', '\n\n1ï¸âƒ£')
-            response = response.replace('2ï¸âƒ£', '\n\n2ï¸âƒ£')
-            response = response.replace('3ï¸âƒ£', '\n\n3ï¸âƒ£')
-            response = response.replace('4ï¸âƒ£', '\n\n4ï¸âƒ£')
-            response = response.replace('5ï¸âƒ£', '\n\n5ï¸âƒ£')
-            response = response.replace('6ï¸âƒ£', '\n\n6ï¸âƒ£')
-            response = response.replace('7ï¸âƒ£', '\n\n7ï¸âƒ£')
-            response = response.replace('8ï¸âƒ£', '\n\n8ï¸âƒ£')
-            response = response.replace('9ï¸âƒ£', '\n\n9ï¸âƒ£')
-            response = response.strip()  # Remove leading/trailing whitespace
-            
-            # Save assistant response to database
-            if chat_db and chat_id:
-                chat_db.add_message(chat_id, 'assistant', response)
-            
-            return jsonify({
-                'response': response,
-                'chat_id': chat_id,
-                'status': 'success'
-            })
-        else:
-            return jsonify({
-                'response': "I'm not fully initialized yet. Please check that Ollama is running.",
-                'status': 'warning'
-            })
-            
-    except Exception as e:
-        print(f"Error in chat endpoint: {e}")
-        return jsonify({'error': str(e)}), 500
 
-@app.route('/summarize', methods=['POST'])
-def summarize():
-    """Generate a summary of provided text"""
-    try:
-        data = request.json
-        text = data.get('text', '')
-        
-        if not text:
-            return jsonify({'error': 'No text provided'}), 400
-        
-        if not llm_client:
-            return jsonify({'error': 'LLM not available'}), 503
-        
-        # Create summary prompt
-        prompt = f"""Please provide a concise summary of the following text. 
+# Markers the chat post-processor moves onto their own lines
+RESPONSE_LINE_BREAKS = [('â€¢ ', '\nâ€¢ ')] + [
+    (f'{n}ï¸âƒ£', f'\n\n{n}ï¸âƒ£') for n in range(1, 10)
+]
+
+def format_chat_response(response):
+    """Post-process a response to ensure proper line breaks"""
+    # Add line breaks after bullet points and numbers
+    for marker, replacement in RESPONSE_LINE_BREAKS:
+        response = response.replace(marker, replacement)
+    return response.strip()  # Remove leading/trailing whitespace
+
+class StreamingResponseFormatter:
+    """Apply format_chat_response incrementally to a token stream"""
+    
+    def __init__(self):
+        self.markers = [marker for marker, _ in RESPONSE_LINE_BREAKS]
+        self.pending = ''      # Text that may still be the start of a marker
+        self.whitespace = ''   # Trailing whitespace held back for strip()
+        self.started = False   # Leading whitespace is dropped until True
+    
+    def _safe_cut(self):
+        """Index up to which pending text can be formatted without splitting a marker"""
+        cut = len(self.pending)
+        # Hold back the longest suffix that could still grow into a marker
+        for marker in self.markers:
+            for size in range(min(len(marker) - 1, len(self.pending)), 0, -1):
+                if self.pending.endswith(marker[:size]):
+                    cut = min(cut, len(self.pending) - size)
+                    break
+        # Never cut through a complete marker
+        moved = True
+        while moved:
+            moved = False
+            for marker in self.markers:
+                start = self.pending.find(marker, max(0, cut - len(marker) + 1))
+                if start != -1 and start < cut < start + len(marker):
+                    cut = start
+                    moved = True
+        return cut
+    
+    def _emit(self, text):
+        text = self.whitespace + text
+        if not self.started:
+            text = text.lstrip()
+            self.started = bool(text)
+        stripped = text.rstrip()
+        self.whitespace = text[len(stripped):]
+        return stripped
+    
+    def feed(self, token):
+        """Add a token and return the formatted text that is safe to send"""
+        self.pending += token
+        cut = self._safe_cut()
+        ready, self.pending = self.pending[:cut], self.pending[cut:]
+        for marker, replacement in RESPONSE_LINE_BREAKS:
+            ready = ready.replace(marker, replacement)
+        return self._emit(ready)
+    
+    def flush(self):
+        """Return whatever formatted text remains at the end of the stream"""
+        ready, self.pending = self.pending, ''
+        for marker, replacement in RESPONSE_LINE_BREAKS:
+            ready = ready.replace(marker, replacement)
+        text = self._emit(ready)
+        self.whitespace = ''
+        return text
+
+def use_completion_cache(data, headers):
+    """Whether a request allows cached LLM responses (opt out with no_cache or Cache-Control)"""
+    if data.get('no_cache'):
+        return False
+    return 'no-cache' not in headers.get('Cache-Control', '')
+
+def chat_history(data):
+    """History to send with a chat request
+    
+    Stored chats are rebuilt from the database (with older turns summarized);
+    otherwise the client-supplied history is trimmed to the token budget.
+    """
+    chat_id = data.get('chat_id')
+    if conversation and chat_id and chat_db.get_chat(chat_id):
+        return conversation.build_history(chat_id)
+    
+    history = data.get('history', [])
+    return trim_history(history, CHAT_HISTORY_TOKENS) if trim_history else history
+
+def prepare_chat_turn(data):
+    """Build the system prompt for a chat request"""
+    user_message = data.get('message', '')
+    
+    # Get relevant context from the vector store (if available)
+    context = ""
+    if retriever:
+        try:
+            relevant_docs = retriever.get_relevant_documents(user_message)
+            if relevant_docs:
+                context = "\n\nRelevant information from your documents:\n" + "\n".join(relevant_docs)
+        except Exception as e:
+            print(f"Warning: Could not retrieve context: {e}")
+    
+    # Prepare system prompt with context
+    system_prompt = CHAT_SYSTEM_PROMPT
+    if context:
+        system_prompt += "\n\n" + context
+    
+    return system_prompt
+
+def save_chat_turn(data, response):
+    """Save the user message and assistant response in one transaction
+    
+    A new chat is created when the request has no chat_id. Returns the
+    chat ID, or the requested one if chat history is unavailable.
+    """
+    chat_id = data.get('chat_id')  # Optional: ID of current chat
+    if not chat_db:
+        return chat_id
+    
+    # Generate a title from the first message (first 50 chars)
+    user_message = data.get('message', '')
+    title = user_message[:50] + ('...' if len(user_message) > 50 else '')
+    return chat_db.record_turn(chat_id, user_message, response, title=title)
+
+# ============= LLM ROUTES =============
+# Each LLM route is split into a task (request parsing and prompt) and a
+# finish step (response payload). The Flask views below run tasks with the
+# blocking client; asgi.py runs the same tasks on the async client.
+
+class RequestError(Exception):
+    """A request that cannot be served, answered with {'error': message}"""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+class LLMTask:
+    """A prompt for the LLM and how to turn its answer into a response payload"""
+    def __init__(self, prompt, finish, history=None, system_prompt=None, use_cache=True, pipeline=None,
+                 format=None):
+        self.prompt = prompt  # None when the route answers without the LLM
+        self.finish = finish
+        self.history = history
+        self.system_prompt = system_prompt
+        self.use_cache = use_cache
+        self.format = format  # JSON schema for structured output
+        # Blocking callable run instead of a single prompt; it is passed a
+        # completion function (prompt, **kwargs) for each LLM call it makes
+        self.pipeline = pipeline
+    
+    def completion_args(self):
+        """Keyword arguments for the LLMClient completion methods"""
+        return {
+            'prompt': self.prompt,
+            'history': self.history,
+            'system_prompt': self.system_prompt,
+            'use_cache': self.use_cache,
+            'format': self.format
+        }
+
+def chat_task(data, headers, stream=False):
+    """LLM task for /chat, or /chat/stream when stream is set"""
+    user_message = data.get('message', '')
+    
+    if not user_message:
+        raise RequestError('No message provided')
+    
+    if not llm_client:
+        if stream:
+            raise RequestError('LLM not available', 503)
+        return LLMTask(None, lambda response: {
+            'response': "I'm not fully initialized yet. Please check that Ollama is running.",
+            'status': 'warning'
+        })
+    
+    def finish(response):
+        # Streamed responses are formatted token by token as they are sent
+        if not stream:
+            response = format_chat_response(response)
+        
+        # Save the user message and response to the database
+        chat_id = save_chat_turn(data, response)
+        
+        payload = {'response': response, 'chat_id': chat_id, 'status': 'success'}
+        if stream:
+            payload['done'] = True
+        return payload
+    
+    system_prompt = prepare_chat_turn(data)
+    history = chat_history(data)
+    return LLMTask(user_message, finish, history=history, system_prompt=system_prompt,
+                   use_cache=use_completion_cache(data, headers))
+
+# Map steps run in parallel up to the scheduler's concurrency limit
+LLM_MAP_WORKERS = int(os.getenv('LLM_MAP_WORKERS', '0')) or (llm_scheduler.max_in_flight if llm_scheduler else 2)
+
+# Texts or documents accepted by one /batch call
+BATCH_MAX_ITEMS = 20
+
+# Flashcards generated for one text, at most
+MAX_FLASHCARDS = 50
+
+# Flashcards are generated against a JSON schema (needs Ollama 0.5+; set
+# LLM_JSON_SCHEMA=0 for older servers to fall back to prompt-only JSON)
+FLASHCARD_FORMAT = FLASHCARD_SCHEMA if os.getenv('LLM_JSON_SCHEMA', '1') != '0' else None
+
+def summary_prompt(text):
+    return f"""Please provide a concise summary of the following text. 
 Focus on the key points and main ideas:
 
 {text}
 
 Summary:"""
-        
-        summary = llm_client.get_completion_sync(prompt)
-        
-        return jsonify({
-            'summary': summary,
-            'status': 'success'
-        })
-        
-    except Exception as e:
-        print(f"Error in summarize endpoint: {e}")
-        return jsonify({'error': str(e)}), 500
 
-@app.route('/generate-flashcards', methods=['POST'])
-def generate_flashcards():
-    """Generate flashcards from provided text"""
-    try:
-        data = request.json
-        text = data.get('text', '')
-        num_cards = data.get('num_cards', 5)
-        
-        if not text:
-            return jsonify({'error': 'No text provided'}), 400
-        
-        if not llm_client:
-            return jsonify({'error': 'LLM not available'}), 503
-        
-        # Create flashcard generation prompt
-        prompt = f"""Generate {num_cards} flashcards from the following text. 
+def combine_summaries_prompt(summaries):
+    sections = "\n\n".join(summaries)
+    return f"""The following are summaries of consecutive sections of one text.
+Combine them into a single concise summary. Focus on the key points and main ideas:
+
+{sections}
+
+Summary:"""
+
+def flashcards_prompt(text, num_cards):
+    return f"""Generate {num_cards} flashcards from the following text. 
 Each flashcard should have a clear question and a concise answer.
 Format as JSON array with "question" and "answer" fields.
 
@@ -290,61 +462,195 @@ Generate flashcards in this exact JSON format:
   {{"question": "Question 1?", "answer": "Answer 1"}},
   {{"question": "Question 2?", "answer": "Answer 2"}}
 ]"""
-        
-        response = llm_client.get_completion_sync(prompt)
-        
-        # Try to parse JSON response
-        import json
-        try:
-            # Extract JSON from response
-            start = response.find('[')
-            end = response.rfind(']') + 1
-            if start != -1 and end > start:
-                flashcards_json = response[start:end]
-                flashcards = json.loads(flashcards_json)
-            else:
-                # Fallback: create simple flashcards
-                flashcards = [{"question": "Summary", "answer": response}]
-        except:
-            flashcards = [{"question": "Generated Content", "answer": response}]
-        
-        return jsonify({
-            'flashcards': flashcards,
-            'status': 'success'
-        })
-        
-    except Exception as e:
-        print(f"Error in generate-flashcards endpoint: {e}")
-        return jsonify({'error': str(e)}), 500
 
-@app.route('/explain', methods=['POST'])
-def explain_topic():
-    """Generate detailed explanation with enhanced context retrieval"""
+def parse_flashcards(response):
+    """Validated flashcards from an LLM response, with single-card fallbacks"""
+    # Schema-constrained responses are plain JSON
+    cards = parse_flashcards_json(response)
+    if cards:
+        return cards
     try:
-        data = request.json
-        topic = data.get('topic', '')
-        
-        if not topic:
-            return jsonify({'error': 'No topic provided'}), 400
-        
-        if not llm_client:
-            return jsonify({'error': 'LLM not available'}), 503
-        
-        # Enhanced context retrieval from Pinecone
-        context_docs = []
-        if retriever:
+        # Extract JSON from response
+        start = response.find('[')
+        end = response.rfind(']') + 1
+        if start != -1 and end > start:
+            flashcards_json = response[start:end]
+            cards = [card for card in map(validate_flashcard, json.loads(flashcards_json)) if card]
+            if cards:
+                return cards
+        # Fallback: create simple flashcards
+        return [{"question": "Summary", "answer": response}]
+    except:
+        return [{"question": "Generated Content", "answer": response}]
+
+def summarize_text(text, complete, use_cache=True):
+    """Summarize a text of any length: summaries of each chunk, then reduced"""
+    chunks = split_text(text)
+    summaries = map_completions(lambda chunk: complete(summary_prompt(chunk), use_cache=use_cache),
+                                chunks, LLM_MAP_WORKERS)
+    return reduce_texts(summaries, lambda group: complete(combine_summaries_prompt(group), use_cache=use_cache),
+                        LLM_MAP_WORKERS)
+
+def generate_flashcards_text(text, num_cards, complete, use_cache=True):
+    """Flashcards for a text of any length: cards per chunk, merged and deduplicated"""
+    chunks = split_text(text)
+    counts = allocate(num_cards, [len(chunk) for chunk in chunks])
+    # Only chunks that were given cards are sent to the LLM
+    work = [(chunk, count) for chunk, count in zip(chunks, counts) if count]
+    if not work:
+        return []
+    responses = map_completions(lambda item: complete(flashcards_prompt(*item), use_cache=use_cache,
+                                                      format=FLASHCARD_FORMAT),
+                                work, LLM_MAP_WORKERS)
+    return merge_flashcards([parse_flashcards(response) for response in responses], num_cards)
+
+def num_cards_arg(data):
+    """num_cards from a request body (default 5), capped at MAX_FLASHCARDS"""
+    try:
+        num_cards = int(data.get('num_cards', 5))
+    except (TypeError, ValueError):
+        num_cards = 0
+    if num_cards < 1:
+        raise RequestError('num_cards must be a positive integer')
+    return min(num_cards, MAX_FLASHCARDS)
+
+def document_source(document_id):
+    """Path of an uploaded document; raises RequestError if it is unknown"""
+    document = doc_manager.get_document(int(document_id)) if doc_manager else None
+    if not document:
+        raise RequestError(f'Document not found: {document_id}', 404)
+    return document['path']
+
+def summarize_task(data, headers):
+    """LLM task for /summarize (text, or document_id of an uploaded file)"""
+    text = data.get('text', '')
+    document_id = data.get('document_id')
+    
+    if not text and document_id is None:
+        raise RequestError('No text provided')
+    
+    if not llm_client:
+        raise RequestError('LLM not available', 503)
+    
+    use_cache = use_completion_cache(data, headers)
+    finish = lambda summary: {
+        'summary': summary,
+        'status': 'success'
+    }
+    
+    # Long texts and documents are summarized chunk by chunk
+    if document_id is not None or len(split_text(text)) > 1:
+        path = document_source(document_id) if document_id is not None else None
+        return LLMTask(None, finish, pipeline=lambda complete: summarize_text(
+            text or document_text(path), complete, use_cache))
+    
+    return LLMTask(summary_prompt(text), finish, use_cache=use_cache)
+
+def flashcards_task(data, headers, stream=False):
+    """LLM task for /generate-flashcards (text, or document_id of an uploaded file)
+    
+    With stream set (/generate-flashcards/stream) the cards were already sent
+    one by one, so finish only reports the full set.
+    """
+    text = data.get('text', '')
+    document_id = data.get('document_id')
+    num_cards = num_cards_arg(data)
+    
+    if not text and document_id is None:
+        raise RequestError('No text provided')
+    
+    if not llm_client:
+        raise RequestError('LLM not available', 503)
+    
+    def finish(response):
+        # Chunked generation returns cards that are already merged
+        flashcards = response if isinstance(response, list) else parse_flashcards(response)
+        payload = {
+            'flashcards': flashcards,
+            'status': 'success'
+        }
+        if stream:
+            payload['done'] = True
+        return payload
+    
+    use_cache = use_completion_cache(data, headers)
+    if document_id is not None or len(split_text(text)) > 1:
+        path = document_source(document_id) if document_id is not None else None
+        return LLMTask(None, finish, pipeline=lambda complete: generate_flashcards_text(
+            text or document_text(path), num_cards, complete, use_cache))
+    
+    return LLMTask(flashcards_prompt(text, num_cards), finish, use_cache=use_cache, format=FLASHCARD_FORMAT)
+
+def batch_task(data, headers):
+    """LLM task for /batch: summaries or flashcards for several texts and documents"""
+    kind = data.get('task', 'summarize')
+    texts = data.get('texts') or []
+    document_ids = data.get('document_ids') or []
+    num_cards = num_cards_arg(data)
+    
+    if kind not in ('summarize', 'flashcards'):
+        raise RequestError("task must be 'summarize' or 'flashcards'")
+    if not texts and not document_ids:
+        raise RequestError('No texts or document_ids provided')
+    if len(texts) + len(document_ids) > BATCH_MAX_ITEMS:
+        raise RequestError(f'At most {BATCH_MAX_ITEMS} texts and documents per batch')
+    
+    if not llm_client:
+        raise RequestError('LLM not available', 503)
+    
+    # Unknown documents fail the whole call before any generation starts
+    sources = [({'index': i}, text, None) for i, text in enumerate(texts)]
+    sources += [({'document_id': document_id}, None, document_source(document_id)) for document_id in document_ids]
+    use_cache = use_completion_cache(data, headers)
+    
+    def pipeline(complete):
+        def run(source):
+            result, text, path = source
             try:
-                # Retrieve MORE context for detailed explanation (top_k=5 instead of 3)
-                context_docs = retriever.retrieve(topic, top_k=5)
+                text = text if path is None else document_text(path)
+                if not text:
+                    raise ValueError('No text provided')
+                if kind == 'summarize':
+                    result['summary'] = summarize_text(text, complete, use_cache)
+                else:
+                    result['flashcards'] = generate_flashcards_text(text, num_cards, complete, use_cache)
             except Exception as e:
-                print(f"Error retrieving context: {e}")
-        
-        # Build context string
-        context = "\n\n".join([doc['text'] for doc in context_docs]) if context_docs else ""
+                result['error'] = str(e)
+            return result
         
-        # Create detailed explanation prompt
-        if context:
-            prompt = f"""Based on the following reference materials, provide a comprehensive and detailed explanation of: {topic}
+        # Items run side by side; the scheduler bounds the LLM calls they make
+        return map_parallel(run, sources, len(sources))
+    
+    return LLMTask(None, lambda results: {
+        'results': results,
+        'status': 'success'
+    }, pipeline=pipeline)
+
+def explain_task(data, headers):
+    """LLM task for /explain, with enhanced context retrieval"""
+    topic = data.get('topic', '')
+    
+    if not topic:
+        raise RequestError('No topic provided')
+    
+    if not llm_client:
+        raise RequestError('LLM not available', 503)
+    
+    # Enhanced context retrieval from the vector store
+    context_docs = []
+    if retriever:
+        try:
+            # Retrieve MORE context for detailed explanation (top_k=5 instead of 3)
+            context_docs = retriever.retrieve(topic, top_k=5)
+        except Exception as e:
+            print(f"Error retrieving context: {e}")
+    
+    # Build context string
+    context = "\n\n".join([doc['text'] for doc in context_docs]) if context_docs else ""
+    
+    # Create detailed explanation prompt
+    if context:
+        prompt = f"""Based on the following reference materials, provide a comprehensive and detailed explanation of: {topic}
 
 Reference Materials:
 {context}
@@ -357,8 +663,8 @@ Instructions:
 - Structure the explanation logically
 
 Detailed Explanation:"""
-        else:
-            prompt = f"""Provide a comprehensive and detailed explanation of: {topic}
+    else:
+        prompt = f"""Provide a comprehensive and detailed explanation of: {topic}
 
 Instructions:
 - Explain the topic thoroughly with examples
@@ -368,31 +674,238 @@ Instructions:
 - Structure the explanation logically
 
 Detailed Explanation:"""
-        
-        explanation = llm_client.get_completion_sync(prompt)
-        
-        return jsonify({
-            'explanation': explanation,
-            'context_found': len(context_docs) > 0,
-            'sources': len(context_docs),
-            'status': 'success'
-        })
-        
+    
+    return LLMTask(prompt, lambda explanation: {
+        'explanation': explanation,
+        'context_found': len(context_docs) > 0,
+        'sources': len(context_docs),
+        'status': 'success'
+    }, use_cache=use_completion_cache(data, headers))
+
+# Routes served by LLM tasks (asgi.py serves these with async handlers)
+LLM_TASKS = {
+    '/chat': chat_task,
+    '/summarize': summarize_task,
+    '/generate-flashcards': flashcards_task,
+    '/explain': explain_task,
+    '/batch': batch_task
+}
+
+# Scheduler priority per route: a user waiting on a chat goes before batch jobs
+LLM_PRIORITIES = {
+    'chat': INTERACTIVE,
+    'explain': INTERACTIVE,
+    'summarize': BATCH,
+    'generate-flashcards': BATCH,
+    'batch': BATCH
+}
+
+def llm_slot(name, client, admitted=False):
+    """Scheduler slot for an LLM route (a no-op when the LLM is unavailable)"""
+    if not llm_scheduler:
+        return nullcontext()
+    return llm_scheduler.slot(LLM_PRIORITIES[name], client, admitted)
+
+def pipeline_completion(name, client):
+    """Completion function for task pipelines; each call takes its own slot"""
+    def complete(prompt, **kwargs):
+        with llm_slot(name, client, admitted=True):
+            return llm_client.get_completion_sync(prompt, **kwargs)
+    return complete
+
+def busy_response(e):
+    """429/503 with Retry-After for a request the scheduler refused"""
+    response = jsonify({'error': e.message, 'retry_after': e.retry_after})
+    response.status_code = e.status
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+def run_llm_task(build_task, name):
+    """Run an LLM task in a Flask view, blocking until the LLM answers"""
+    try:
+        # Building a chat task can call the LLM too (history summaries)
+        with llm_slot(name, request.remote_addr) as ticket:
+            task = build_task(request.json, request.headers)
+            response = None
+            if task.pipeline:
+                # Pipeline steps take slots of their own
+                if ticket:
+                    llm_scheduler.release(ticket)
+                response = task.pipeline(pipeline_completion(name, request.remote_addr))
+            elif task.prompt is not None:
+                if ticket and llm_client.is_generating(**task.completion_args()):
+                    # Joining an identical generation in progress needs no slot
+                    llm_scheduler.release(ticket)
+                response = llm_client.get_completion_sync(**task.completion_args())
+        return jsonify(task.finish(response))
+    except SchedulerBusy as e:
+        return busy_response(e)
+    except RequestError as e:
+        return jsonify({'error': e.message}), e.status
+    except LLMError as e:
+        # Ollama failed; nothing is saved or cached for a failed generation
+        return jsonify({'error': str(e)}), 502
     except Exception as e:
-        print(f"Error in explain endpoint: {e}")
+        print(f"Error in {name} endpoint: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/chat', methods=['POST'])
+@monitor_performance('POST /chat')
+def chat():
+    """Handle chat requests"""
+    return run_llm_task(chat_task, 'chat')
+
+def sse_event(payload):
+    """Encode a payload as a server-sent event"""
+    return f"data: {json.dumps(payload)}\n\n"
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Handle chat requests, streaming tokens as server-sent events"""
+    ticket = None
+    try:
+        if llm_scheduler:
+            ticket = llm_scheduler.acquire(INTERACTIVE, request.remote_addr)
+        data = request.json
+        task = chat_task(data, request.headers, stream=True)
+        if ticket and llm_client.is_generating(**task.completion_args()):
+            llm_scheduler.release(ticket)
+            ticket = None
+    except SchedulerBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        if ticket:
+            llm_scheduler.release(ticket)
+        if isinstance(e, RequestError):
+            return jsonify({'error': e.message}), e.status
+        print(f"Error in chat stream endpoint: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+    def generate():
+        formatter = StreamingResponseFormatter()
+        parts = []
+        try:
+            if data.get('chat_id'):
+                yield sse_event({'chat_id': data['chat_id']})
+            for token in llm_client.stream_completion(**task.completion_args()):
+                text = formatter.feed(token)
+                if text:
+                    parts.append(text)
+                    yield sse_event({'token': text})
+            text = formatter.flush()
+            if text:
+                parts.append(text)
+                yield sse_event({'token': text})
+            
+            # Save the whole turn to the database once generation completes
+            yield sse_event(task.finish(''.join(parts)))
+        except LLMError as e:
+            # A failed or cut-off generation is reported, never saved
+            yield sse_event({'error': str(e)})
+        except Exception as e:
+            print(f"Error in chat stream endpoint: {e}")
+            yield sse_event({'error': str(e)})
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    if ticket:
+        # The slot is held until the stream ends or the client disconnects
+        response.call_on_close(lambda: llm_scheduler.release(ticket))
+    return response
+
+@app.route('/summarize', methods=['POST'])
+def summarize():
+    """Generate a summary of provided text"""
+    return run_llm_task(summarize_task, 'summarize')
+
+@app.route('/generate-flashcards', methods=['POST'])
+def generate_flashcards():
+    """Generate flashcards from provided text"""
+    return run_llm_task(flashcards_task, 'generate-flashcards')
+
+@app.route('/generate-flashcards/stream', methods=['POST'])
+def generate_flashcards_stream():
+    """Generate flashcards, sending each card as a server-sent event once it is complete"""
+    ticket = None
+    try:
+        if llm_scheduler:
+            ticket = llm_scheduler.acquire(BATCH, request.remote_addr)
+        task = flashcards_task(request.json, request.headers, stream=True)
+        if ticket and (task.pipeline or llm_client.is_generating(**task.completion_args())):
+            llm_scheduler.release(ticket)
+            ticket = None
+    except SchedulerBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        if ticket:
+            llm_scheduler.release(ticket)
+        if isinstance(e, RequestError):
+            return jsonify({'error': e.message}), e.status
+        print(f"Error in flashcards stream endpoint: {e}")
+        return jsonify({'error': str(e)}), 500
+    
+    def generate():
+        try:
+            if task.pipeline:
+                # Chunked generation: cards are merged before any is sent
+                cards = task.pipeline(pipeline_completion('generate-flashcards', request.remote_addr))
+                for card in cards:
+                    yield sse_event({'flashcard': card})
+                yield sse_event(task.finish(cards))
+                return
+            
+            parser = FlashcardStreamParser()
+            parts = []
+            for token in llm_client.stream_completion(**task.completion_args()):
+                parts.append(token)
+                for card in parser.feed(token):
+                    yield sse_event({'flashcard': card})
+            
+            # Responses that were not schema JSON are parsed as a whole
+            cards = parser.cards or parse_flashcards(''.join(parts))
+            if not parser.cards:
+                for card in cards:
+                    yield sse_event({'flashcard': card})
+            yield sse_event(task.finish(cards))
+        except Exception as e:
+            print(f"Error in flashcards stream endpoint: {e}")
+            yield sse_event({'error': str(e)})
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    if ticket:
+        response.call_on_close(lambda: llm_scheduler.release(ticket))
+    return response
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    """Summaries or flashcards for several texts and uploaded documents in one call"""
+    return run_llm_task(batch_task, 'batch')
+
+@app.route('/explain', methods=['POST'])
+def explain_topic():
+    """Generate detailed explanation with enhanced context retrieval"""
+    return run_llm_task(explain_task, 'explain')
+
 # ============= CHAT HISTORY API ENDPOINTS =============
 
 @app.route('/chat-history', methods=['GET'])
 def get_chat_history():
-    """Get all chat conversations"""
+    """Get chat conversations (paginated with ?limit=&cursor=, projected with ?fields=)"""
     try:
         if not chat_db:
             return jsonify({'error': 'Chat history not available'}), 503
         
-        chats = chat_db.get_all_chats()
-        return jsonify({'chats': chats, 'status': 'success'})
+        chats, next_cursor = chat_db.get_chats_page(*pagination_args())
+        return jsonify({'chats': chats, 'next_cursor': next_cursor, 'status': 'success'})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Error getting chat history: {e}")
         return jsonify({'error': str(e)}), 500
@@ -489,7 +1002,7 @@ def clear_chat_history():
 
 @app.route('/chat-history/search', methods=['POST'])
 def search_chat_history():
-    """Search through chat messages"""
+    """Full-text search through chat messages (supports "phrases" and prefix*)"""
     try:
         if not chat_db:
             return jsonify({'error': 'Chat history not available'}), 503
@@ -500,7 +1013,8 @@ def search_chat_history():
         if not query:
             return jsonify({'error': 'Search query is required'}), 400
         
-        results = chat_db.search_messages(query)
+        limit = min(int(data.get('limit', 50)), 200)
+        results = chat_db.search_messages(query, limit=limit)
         
         return jsonify({
             'results': results,
@@ -564,6 +1078,11 @@ def upload_file():
         except Exception as save_error:
             return jsonify({'error': f'Failed to save file: {str(save_error)}'}), 500
         
+        # Ingest just the new file in the background (on by default when document search is enabled)
+        job_id = None
+        if ingest_queue and request.form.get('ingest', '1' if retriever else '0') == '1':
+            job_id = ingest_queue.submit(paths=[filepath])
+        
         # Add to document manager
         if doc_manager:
             file_size = os.path.getsize(filepath)
@@ -571,10 +1090,11 @@ def upload_file():
             
             return jsonify({
                 'message': 'File uploaded successfully',
-                'document': doc_info
+                'document': doc_info,
+                'job_id': job_id
             })
         
-        return jsonify({'message': 'File uploaded but metadata not saved'}), 201
+        return jsonify({'message': 'File uploaded but metadata not saved', 'job_id': job_id}), 201
         
     except Exception as e:
         print(f"Error uploading file: {e}")
@@ -593,53 +1113,67 @@ def delete_document(doc_id):
 
 @app.route('/ingest-all', methods=['POST'])
 def ingest_all_documents():
-    """Re-ingest all documents into Pinecone"""
+    """Queue a background job that re-ingests all documents into the vector store"""
     try:
-        from models.ingest import DocumentIngestor
+        if not ingest_queue:
+            return jsonify({'error': 'Ingestion jobs not available', 'status': 'error'}), 503
         
-        print("Starting document ingestion...")
-        ingestor = DocumentIngestor()
-        ingestor.ingest_documents(data_dir='data')
+        data = request.get_json(silent=True) or {}
+        job_id = ingest_queue.submit(force=bool(data.get('force', False)))
         
         return jsonify({
-            'message': 'All documents have been re-ingested successfully!',
-            'status': 'success'
-        })
-    except ValueError as ve:
-        # Handle missing API key
-        error_msg = str(ve)
-        print(f"ValueError during ingestion: {error_msg}")
-        if "PINECONE_API_KEY" in error_msg:
-            return jsonify({
-                'error': 'Pinecone API key not configured. Add PINECONE_API_KEY to your .env file.',
-                'status': 'error'
-            }), 503
-        return jsonify({'error': error_msg, 'status': 'error'}), 400
-    except ImportError as ie:
-        # Handle missing dependencies
-        print(f"ImportError during ingestion: {ie}")
-        return jsonify({
-            'error': f'Required libraries not installed: {str(ie)}',
-            'status': 'error'
-        }), 503
+            'message': 'Document ingestion started',
+            'job_id': job_id,
+            'status': 'queued'
+        }), 202
     except Exception as e:
-        print(f"Error ingesting documents: {e}")
-        import traceback
-        traceback.print_exc()
+        print(f"Error queueing ingestion: {e}")
         return jsonify({'error': str(e), 'status': 'error'}), 500
 
+@app.route('/jobs', methods=['GET'])
+def get_jobs():
+    """Get recent background jobs"""
+    try:
+        if not ingest_queue:
+            return jsonify({'error': 'Ingestion jobs not available'}), 503
+        
+        limit = request.args.get('limit', 20, type=int)
+        jobs = ingest_queue.jobs_db.get_recent_jobs(limit)
+        return jsonify({'jobs': jobs, 'status': 'success'})
+    except Exception as e:
+        print(f"Error getting jobs: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get a background job's status and progress"""
+    try:
+        if not ingest_queue:
+            return jsonify({'error': 'Ingestion jobs not available'}), 503
+        
+        job = ingest_queue.get_job(job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        return jsonify({'job': job, 'status': 'success'})
+    except Exception as e:
+        print(f"Error getting job: {e}")
+        return jsonify({'error': str(e)}), 500
+
 # ============= NOTES API ENDPOINTS =============
 
 @app.route('/notes', methods=['GET'])
 @monitor_performance('GET /notes')
 def get_notes():
-    """Get all notes"""
+    """Get notes (paginated with ?limit=&cursor=, projected with ?fields=)"""
     try:
         if not notes_db:
             return jsonify({'error': 'Notes database not available'}), 503
         
-        notes = notes_db.get_all_notes()
-        return jsonify({'notes': notes, 'status': 'success'})
+        notes, next_cursor = notes_db.get_notes_page(*pagination_args())
+        return jsonify({'notes': notes, 'next_cursor': next_cursor, 'status': 'success'})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Error getting notes: {e}")
         return jsonify({'error': str(e)}), 500
@@ -724,25 +1258,39 @@ def delete_note(note_id):
         print(f"Error deleting note: {e}")
         return jsonify({'error': str(e)}), 500
 
-"""
 @app.route('/notes/search', methods=['GET'])
 def search_notes():
-    # DEPRECATED: Use /bookmarks/search instead
-    pass
-"""
+    """Full-text search over note titles, content and categories"""
+    try:
+        if not notes_db:
+            return jsonify({'error': 'Notes database not available'}), 503
+        
+        query = request.args.get('q', '')
+        if not query:
+            return jsonify({'error': 'Search query is required'}), 400
+        
+        limit = min(request.args.get('limit', 50, type=int), 200)
+        notes = notes_db.search_notes(query, limit=limit)
+        
+        return jsonify({'notes': notes, 'count': len(notes), 'status': 'success'})
+    except Exception as e:
+        print(f"Error searching notes: {e}")
+        return jsonify({'error': str(e)}), 500
 
 # ============= TODO API ENDPOINTS =============
 
 @app.route('/todos', methods=['GET'])
 @monitor_performance('GET /todos')
 def get_todos():
-    """Get all todos"""
+    """Get todos (paginated with ?limit=&cursor=, projected with ?fields=)"""
     try:
         if not todo_db:
             return jsonify({'error': 'Todo database not available'}), 503
         
-        todos = todo_db.get_all_todos()
-        return jsonify({'todos': todos, 'status': 'success'})
+        todos, next_cursor = todo_db.get_todos_page(*pagination_args())
+        return jsonify({'todos': todos, 'next_cursor': next_cursor, 'status': 'success'})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Error getting todos: {e}")
         return jsonify({'error': str(e)}), 500
@@ -963,15 +1511,18 @@ def delete_pomodoro_session(session_id):
 @app.route('/bookmarks', methods=['GET'])
 @monitor_performance('GET /bookmarks')
 def get_bookmarks():
-    """Get all bookmarks"""
+    """Get bookmarks (paginated with ?limit=&cursor=, projected with ?fields=)"""
     try:
         from app import bookmarks_db
-        bookmarks = bookmarks_db.get_all_bookmarks()
+        bookmarks, next_cursor = bookmarks_db.get_bookmarks_page(*pagination_args())
         
         return jsonify({
             'status': 'success',
-            'bookmarks': bookmarks
+            'bookmarks': bookmarks,
+            'next_cursor': next_cursor
         })
+    except ValueError as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 400
     except Exception as e:
         print(f"Error getting bookmarks: {e}")
         return jsonify({'status': 'error', 'error': str(e)}), 500
@@ -1064,7 +1615,7 @@ def delete_bookmark(bookmark_id):
 
 @app.route('/bookmarks/search', methods=['GET'])
 def search_bookmarks():
-    """Search bookmarks"""
+    """Full-text search over bookmark titles, URLs, descriptions and tags"""
     try:
         from app import bookmarks_db
         query = request.args.get('q', '')
@@ -1072,7 +1623,8 @@ def search_bookmarks():
         if not query:
             return jsonify({'status': 'error', 'error': 'Search query is required'}), 400
         
-        bookmarks = bookmarks_db.search_bookmarks(query)
+        limit = min(request.args.get('limit', 50, type=int), 200)
+        bookmarks = bookmarks_db.search_bookmarks(query, limit=limit)
         
         return jsonify({
             'status': 'success',
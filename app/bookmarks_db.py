@@ -1,102 +1,100 @@
 import sqlite3
 from datetime import datetime
 
+from app.db import get_connection, fetch_page, fts_match_query, init_fts_index
+
 DB_PATH = 'jarvis_bookmarks.db'
 
+# BM25 column weights for search: title, url, description, tags
+SEARCH_WEIGHTS = (10.0, 3.0, 1.0, 5.0)
+
+# Fields available to list queries, and their keyset order (newest first)
+LIST_COLUMNS = {name: name for name in ('id', 'title', 'url', 'description', 'category', 'tags',
+                                        'created_at', 'updated_at')}
+LIST_ORDER = [('created_at', True), ('id', True)]
+
 def init_db():
     """Initialize bookmarks database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS bookmarks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            url TEXT NOT NULL,
-            description TEXT,
-            category TEXT DEFAULT 'General',
-            tags TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Add indexes for better query performance
-    cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_bookmarks_category 
-        ON bookmarks(category)
-    ''')
-    
-    cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_bookmarks_updated_at 
-        ON bookmarks(updated_at DESC)
-    ''')
-    
-    cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_bookmarks_title 
-        ON bookmarks(title)
-    ''')
-    
-    conn.commit()
-    conn.close()
+    with get_connection(DB_PATH) as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS bookmarks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                url TEXT NOT NULL,
+                description TEXT,
+                category TEXT DEFAULT 'General',
+                tags TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Add indexes for better query performance
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_bookmarks_category 
+            ON bookmarks(category)
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_bookmarks_updated_at 
+            ON bookmarks(updated_at DESC)
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_bookmarks_title 
+            ON bookmarks(title)
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_bookmarks_created_at 
+            ON bookmarks(created_at DESC)
+        ''')
+        
+        # Full-text index for search_bookmarks
+        init_fts_index(cursor, 'bookmarks', ['title', 'url', 'description', 'tags'])
     print(f"✓ Bookmarks database initialized: {DB_PATH}")
 
 def add_bookmark(title, url, description='', category='General', tags=''):
     """Add a new bookmark"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        INSERT INTO bookmarks (title, url, description, category, tags)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (title, url, description, category, tags))
-    
-    bookmark_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    with get_connection(DB_PATH) as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            INSERT INTO bookmarks (title, url, description, category, tags)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (title, url, description, category, tags))
+        
+        bookmark_id = cursor.lastrowid
     
     return bookmark_id
 
 def get_all_bookmarks():
     """Get all bookmarks"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT id, title, url, description, category, tags, created_at, updated_at
-        FROM bookmarks
-        ORDER BY created_at DESC
-    ''')
-    
-    bookmarks = []
-    for row in cursor.fetchall():
-        bookmarks.append({
-            'id': row[0],
-            'title': row[1],
-            'url': row[2],
-            'description': row[3],
-            'category': row[4],
-            'tags': row[5],
-            'created_at': row[6],
-            'updated_at': row[7]
-        })
-    
-    conn.close()
-    return bookmarks
+    return get_bookmarks_page()[0]
+
+def get_bookmarks_page(limit=None, cursor=None, fields=None):
+    """Get bookmarks newest first, one page at a time
+    
+    Returns (bookmarks, next_cursor); next_cursor is None on the last page.
+    """
+    with get_connection(DB_PATH) as conn:
+        return fetch_page(conn.cursor(), LIST_COLUMNS, 'bookmarks', LIST_ORDER,
+                          limit=limit, after=cursor, fields=fields)
 
 def get_bookmark(bookmark_id):
     """Get a specific bookmark by ID"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT id, title, url, description, category, tags, created_at, updated_at
-        FROM bookmarks
-        WHERE id = ?
-    ''', (bookmark_id,))
-    
-    row = cursor.fetchone()
-    conn.close()
+    with get_connection(DB_PATH) as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT id, title, url, description, category, tags, created_at, updated_at
+            FROM bookmarks
+            WHERE id = ?
+        ''', (bookmark_id,))
+        
+        row = cursor.fetchone()
     
     if row:
         return {
@@ -113,53 +111,66 @@ def get_bookmark(bookmark_id):
 
 def update_bookmark(bookmark_id, title, url, description, category, tags):
     """Update an existing bookmark"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        UPDATE bookmarks
-        SET title = ?, url = ?, description = ?, category = ?, tags = ?, updated_at = CURRENT_TIMESTAMP
-        WHERE id = ?
-    ''', (title, url, description, category, tags, bookmark_id))
-    
-    conn.commit()
-    conn.close()
+    with get_connection(DB_PATH) as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            UPDATE bookmarks
+            SET title = ?, url = ?, description = ?, category = ?, tags = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (title, url, description, category, tags, bookmark_id))
 
 def delete_bookmark(bookmark_id):
     """Delete a bookmark"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('DELETE FROM bookmarks WHERE id = ?', (bookmark_id,))
-    
-    conn.commit()
-    conn.close()
+    with get_connection(DB_PATH) as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute('DELETE FROM bookmarks WHERE id = ?', (bookmark_id,))
 
-def search_bookmarks(query):
-    """Search bookmarks by title, url, description, or tags"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    search_query = f'%{query}%'
-    cursor.execute('''
-        SELECT id, title, url, description, category, tags, created_at, updated_at
-        FROM bookmarks
-        WHERE title LIKE ? OR url LIKE ? OR description LIKE ? OR tags LIKE ?
-        ORDER BY created_at DESC
-    ''', (search_query, search_query, search_query, search_query))
-    
-    bookmarks = []
-    for row in cursor.fetchall():
-        bookmarks.append({
-            'id': row[0],
-            'title': row[1],
-            'url': row[2],
-            'description': row[3],
-            'category': row[4],
-            'tags': row[5],
-            'created_at': row[6],
-            'updated_at': row[7]
-        })
-    
-    conn.close()
+def search_bookmarks(query, limit=50):
+    """Search bookmarks by title, url, description, or tags, best matches first"""
+    match = fts_match_query(query)
+    if match is None:
+        return []
+    
+    with get_connection(DB_PATH) as conn:
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('''
+                SELECT b.id, b.title, b.url, b.description, b.category, b.tags, b.created_at, b.updated_at,
+                       snippet(bookmarks_fts, -1, '<mark>', '</mark>', '…', 16) as snippet,
+                       -bm25(bookmarks_fts, ?, ?, ?, ?) as score
+                FROM bookmarks_fts
+                JOIN bookmarks b ON b.id = bookmarks_fts.rowid
+                WHERE bookmarks_fts MATCH ?
+                ORDER BY score DESC
+                LIMIT ?
+            ''', (*SEARCH_WEIGHTS, match, limit))
+        except sqlite3.OperationalError:
+            # No FTS5 in this SQLite build
+            search_query = f'%{query}%'
+            cursor.execute('''
+                SELECT id, title, url, description, category, tags, created_at, updated_at,
+                       description as snippet, 0 as score
+                FROM bookmarks
+                WHERE title LIKE ? OR url LIKE ? OR description LIKE ? OR tags LIKE ?
+                ORDER BY created_at DESC
+                LIMIT ?
+            ''', (search_query, search_query, search_query, search_query, limit))
+        
+        bookmarks = []
+        for row in cursor.fetchall():
+            bookmarks.append({
+                'id': row[0],
+                'title': row[1],
+                'url': row[2],
+                'description': row[3],
+                'category': row[4],
+                'tags': row[5],
+                'created_at': row[6],
+                'updated_at': row[7],
+                'snippet': row[8],
+                'score': row[9]
+            })
     return bookmarks
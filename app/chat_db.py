@@ -7,43 +7,107 @@ import sqlite3
 from datetime import datetime
 import json
 
+from app.db import get_connection, fetch_page, fts_match_query, init_fts_index
+
 DB_NAME = 'jarvis_chat.db'
 
+# Characters of the first message kept on the chat row for the sidebar preview
+PREVIEW_LENGTH = 200
+
+# Fields available to chat list queries, and their keyset order (most recent first)
+LIST_COLUMNS = {
+    'id': 'c.id',
+    'title': 'c.title',
+    'created_at': 'c.created_at',
+    'updated_at': 'c.updated_at',
+    'message_count': 'c.message_count',
+    'first_message': 'c.first_message',
+    'last_message_at': 'c.last_message_at'
+}
+LIST_ORDER = [('updated_at', True), ('id', True)]
+
 def init_db():
     """Initialize the chat history database"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    with get_connection(DB_NAME) as conn:
+        cursor = conn.cursor()
+        
+        # Create chats table (conversations)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chats (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                message_count INTEGER NOT NULL DEFAULT 0,
+                first_message TEXT,
+                last_message_at TIMESTAMP
+            )
+        ''')
+        
+        # Create messages table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (chat_id) REFERENCES chats (id) ON DELETE CASCADE
+            )
+        ''')
+        
+        # Rolling summaries of older messages, used to keep LLM context short
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chat_summaries (
+                chat_id INTEGER PRIMARY KEY,
+                summary TEXT NOT NULL,
+                last_message_id INTEGER NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Create indexes for better performance
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_chat_id ON messages(chat_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_chats_updated_at ON chats(updated_at)')
+        
+        # Full-text index for search_messages
+        init_fts_index(cursor, 'messages', ['content'])
+        
+        migrate_chat_summaries(cursor)
+    print(f"✓ Chat history database initialized: {DB_NAME}")
+
+def migrate_chat_summaries(cursor):
+    """Add the per-chat summary columns to older databases and backfill them
+    
+    The chat list reads message_count, first_message and last_message_at
+    straight from the chats table; add_message and delete_chat keep them
+    up to date from then on.
+    """
+    cursor.execute('PRAGMA table_info(chats)')
+    columns = {row['name'] for row in cursor.fetchall()}
+    if 'message_count' in columns:
+        return
+    
+    cursor.execute('ALTER TABLE chats ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('ALTER TABLE chats ADD COLUMN first_message TEXT')
+    cursor.execute('ALTER TABLE chats ADD COLUMN last_message_at TIMESTAMP')
+    
+    # Messages of chats deleted before delete_chat removed them explicitly
+    cursor.execute('DELETE FROM messages WHERE chat_id NOT IN (SELECT id FROM chats)')
     
-    # Create chats table (conversations)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS chats (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Create messages table
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            chat_id INTEGER NOT NULL,
-            role TEXT NOT NULL,
-            content TEXT NOT NULL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (chat_id) REFERENCES chats (id) ON DELETE CASCADE
-        )
-    ''')
-    
-    # Create indexes for better performance
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_chat_id ON messages(chat_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_chats_updated_at ON chats(updated_at)')
-    
-    conn.commit()
-    conn.close()
-    print(f"✓ Chat history database initialized: {DB_NAME}")
+        UPDATE chats SET
+            message_count = (SELECT COUNT(*) FROM messages WHERE chat_id = chats.id),
+            first_message = (
+                SELECT substr(content, 1, ?) FROM messages
+                WHERE chat_id = chats.id
+                ORDER BY timestamp ASC, id ASC
+                LIMIT 1
+            ),
+            last_message_at = (SELECT MAX(timestamp) FROM messages WHERE chat_id = chats.id)
+    ''', (PREVIEW_LENGTH,))
+    print(f"✓ Backfilled chat summaries: {cursor.rowcount} chats")
 
 class ChatDatabase:
     def __init__(self):
@@ -52,152 +116,222 @@ class ChatDatabase:
     
     def create_chat(self, title="New Conversation"):
         """Create a new chat conversation"""
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
+        with get_connection(DB_NAME) as conn:
+            return self._insert_chat(conn.cursor(), title)
+    
+    def add_message(self, chat_id, role, content):
+        """Add a message to a chat"""
+        self.add_messages(chat_id, [{'role': role, 'content': content}])
+    
+    def add_messages(self, chat_id, messages):
+        """Add several messages to a chat in one transaction (e.g. for imports)
         
-        cursor.execute('''
-            INSERT INTO chats (title, created_at, updated_at)
-            VALUES (?, ?, ?)
-        ''', (title, datetime.now(), datetime.now()))
+        ``messages`` are dicts with role, content and an optional timestamp,
+        oldest first. Raises ValueError if the chat does not exist.
+        """
+        if not messages:
+            return
+        with get_connection(DB_NAME) as conn:
+            cursor = conn.cursor()
+            if not self._chat_exists(cursor, chat_id):
+                raise ValueError(f"Chat {chat_id} not found")
+            self._insert_messages(cursor, chat_id, messages)
+    
+    def record_turn(self, chat_id, user_message, assistant_message, title="New Conversation"):
+        """Save a user message and the assistant's reply in one transaction
         
-        chat_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        Creates the chat (with ``title``) when chat_id is None or no longer
+        exists. Returns the chat ID the turn was saved to.
+        """
+        with get_connection(DB_NAME) as conn:
+            cursor = conn.cursor()
+            
+            if not chat_id or not self._chat_exists(cursor, chat_id):
+                chat_id = self._insert_chat(cursor, title)
+            
+            self._insert_messages(cursor, chat_id, [
+                {'role': 'user', 'content': user_message},
+                {'role': 'assistant', 'content': assistant_message}
+            ])
         
         return chat_id
     
-    def add_message(self, chat_id, role, content):
-        """Add a message to a chat"""
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        
-        # Add message
+    def _chat_exists(self, cursor, chat_id):
+        cursor.execute('SELECT 1 FROM chats WHERE id = ?', (chat_id,))
+        return cursor.fetchone() is not None
+    
+    def _insert_chat(self, cursor, title):
+        now = datetime.now()
         cursor.execute('''
+            INSERT INTO chats (title, created_at, updated_at)
+            VALUES (?, ?, ?)
+        ''', (title, now, now))
+        return cursor.lastrowid
+    
+    def _insert_messages(self, cursor, chat_id, messages):
+        """Insert messages and update the chat's summary and updated_at timestamp"""
+        now = datetime.now()
+        rows = [(chat_id, message['role'], message['content'], message.get('timestamp') or now)
+                for message in messages]
+        
+        cursor.executemany('''
             INSERT INTO messages (chat_id, role, content, timestamp)
             VALUES (?, ?, ?, ?)
-        ''', (chat_id, role, content, datetime.now()))
+        ''', rows)
         
-        # Update chat's updated_at timestamp
         cursor.execute('''
-            UPDATE chats SET updated_at = ? WHERE id = ?
-        ''', (datetime.now(), chat_id))
-        
-        conn.commit()
-        conn.close()
+            UPDATE chats SET
+                message_count = message_count + ?,
+                first_message = COALESCE(first_message, ?),
+                last_message_at = ?,
+                updated_at = ?
+            WHERE id = ?
+        ''', (len(rows), rows[0][2][:PREVIEW_LENGTH], rows[-1][3], now, chat_id))
     
     def get_all_chats(self):
         """Get all chat conversations"""
-        conn = sqlite3.connect(DB_NAME)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT 
-                c.id,
-                c.title,
-                c.created_at,
-                c.updated_at,
-                COUNT(m.id) as message_count,
-                (SELECT content FROM messages WHERE chat_id = c.id ORDER BY timestamp ASC LIMIT 1) as first_message
-            FROM chats c
-            LEFT JOIN messages m ON c.id = m.chat_id
-            GROUP BY c.id
-            ORDER BY c.updated_at DESC
-        ''')
-        
-        chats = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        return chats
+        return self.get_chats_page()[0]
     
-    def get_chat_messages(self, chat_id):
-        """Get all messages from a specific chat"""
-        conn = sqlite3.connect(DB_NAME)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+    def get_chats_page(self, limit=None, cursor=None, fields=None):
+        """Get chats most recently active first, one page at a time
         
-        cursor.execute('''
-            SELECT id, role, content, timestamp
-            FROM messages
-            WHERE chat_id = ?
-            ORDER BY timestamp ASC
-        ''', (chat_id,))
-        
-        messages = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        Returns (chats, next_cursor); next_cursor is None on the last page.
+        Message counts and previews are stored on the chat rows, so this only
+        reads the chats table, in updated_at index order.
+        """
+        with get_connection(DB_NAME) as conn:
+            return fetch_page(conn.cursor(), LIST_COLUMNS, 'chats c', LIST_ORDER,
+                              limit=limit, after=cursor, fields=fields)
+    
+    def get_chat_messages(self, chat_id, after_id=None):
+        """Get all messages from a specific chat (only those after after_id, if given)"""
+        with get_connection(DB_NAME) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT id, role, content, timestamp
+                FROM messages
+                WHERE chat_id = ? AND id > ?
+                ORDER BY timestamp ASC, id ASC
+            ''', (chat_id, after_id or 0))
+            
+            messages = [dict(row) for row in cursor.fetchall()]
         
         return messages
     
     def get_chat(self, chat_id):
         """Get a specific chat by ID"""
-        conn = sqlite3.connect(DB_NAME)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM chats WHERE id = ?', (chat_id,))
-        chat = cursor.fetchone()
-        conn.close()
+        with get_connection(DB_NAME) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT * FROM chats WHERE id = ?', (chat_id,))
+            chat = cursor.fetchone()
         
         return dict(chat) if chat else None
     
+    def get_summary(self, chat_id):
+        """Get the rolling summary of a chat's older messages, if any"""
+        with get_connection(DB_NAME) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT summary, last_message_id, updated_at FROM chat_summaries WHERE chat_id = ?
+            ''', (chat_id,))
+            summary = cursor.fetchone()
+        
+        return dict(summary) if summary else None
+    
+    def save_summary(self, chat_id, summary, last_message_id):
+        """Store the summary of a chat's messages up to and including last_message_id"""
+        with get_connection(DB_NAME) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT OR REPLACE INTO chat_summaries (chat_id, summary, last_message_id, updated_at)
+                VALUES (?, ?, ?, ?)
+            ''', (chat_id, summary, last_message_id, datetime.now()))
+    
     def update_chat_title(self, chat_id, title):
         """Update a chat's title"""
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE chats SET title = ?, updated_at = ? WHERE id = ?
-        ''', (title, datetime.now(), chat_id))
-        
-        conn.commit()
-        conn.close()
+        with get_connection(DB_NAME) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                UPDATE chats SET title = ?, updated_at = ? WHERE id = ?
+            ''', (title, datetime.now(), chat_id))
     
     def delete_chat(self, chat_id):
         """Delete a chat and all its messages"""
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        
-        # Messages will be deleted automatically due to CASCADE
-        cursor.execute('DELETE FROM chats WHERE id = ?', (chat_id,))
-        
-        conn.commit()
-        conn.close()
+        with get_connection(DB_NAME) as conn:
+            cursor = conn.cursor()
+            
+            # Foreign keys are not enforced, so ON DELETE CASCADE never fires
+            cursor.execute('DELETE FROM messages WHERE chat_id = ?', (chat_id,))
+            cursor.execute('DELETE FROM chat_summaries WHERE chat_id = ?', (chat_id,))
+            cursor.execute('DELETE FROM chats WHERE id = ?', (chat_id,))
         
         return cursor.rowcount > 0
     
     def clear_all_history(self):
         """Clear all chat history"""
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        
-        cursor.execute('DELETE FROM messages')
-        cursor.execute('DELETE FROM chats')
-        
-        conn.commit()
-        conn.close()
+        with get_connection(DB_NAME) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('DELETE FROM messages')
+            cursor.execute('DELETE FROM chat_summaries')
+            cursor.execute('DELETE FROM chats')
     
-    def search_messages(self, query):
-        """Search messages by content"""
-        conn = sqlite3.connect(DB_NAME)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+    def search_messages(self, query, limit=50):
+        """Search messages by content, best matches first
         
-        cursor.execute('''
-            SELECT 
-                m.id,
-                m.chat_id,
-                m.role,
-                m.content,
-                m.timestamp,
-                c.title as chat_title
-            FROM messages m
-            JOIN chats c ON m.chat_id = c.id
-            WHERE m.content LIKE ?
-            ORDER BY m.timestamp DESC
-            LIMIT 50
-        ''', (f'%{query}%',))
-        
-        results = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        Supports ``"exact phrases"`` and ``prefix*`` terms. Each result has a
+        ``snippet`` with matches wrapped in <mark> tags and a BM25 ``score``
+        (higher is better).
+        """
+        match = fts_match_query(query)
+        if match is None:
+            return []
+        
+        with get_connection(DB_NAME) as conn:
+            cursor = conn.cursor()
+            
+            try:
+                cursor.execute('''
+                    SELECT 
+                        m.id,
+                        m.chat_id,
+                        m.role,
+                        m.content,
+                        m.timestamp,
+                        c.title as chat_title,
+                        snippet(messages_fts, 0, '<mark>', '</mark>', '…', 16) as snippet,
+                        -bm25(messages_fts) as score
+                    FROM messages_fts
+                    JOIN messages m ON m.id = messages_fts.rowid
+                    JOIN chats c ON m.chat_id = c.id
+                    WHERE messages_fts MATCH ?
+                    ORDER BY bm25(messages_fts)
+                    LIMIT ?
+                ''', (match, limit))
+            except sqlite3.OperationalError:
+                # No FTS5 in this SQLite build
+                cursor.execute('''
+                    SELECT 
+                        m.id,
+                        m.chat_id,
+                        m.role,
+                        m.content,
+                        m.timestamp,
+                        c.title as chat_title,
+                        substr(m.content, 1, 200) as snippet,
+                        0 as score
+                    FROM messages m
+                    JOIN chats c ON m.chat_id = c.id
+                    WHERE m.content LIKE ?
+                    ORDER BY m.timestamp DESC
+                    LIMIT ?
+                ''', (f'%{query}%', limit))
+            
+            results = [dict(row) for row in cursor.fetchall()]
         
         return results
@@ -0,0 +1,190 @@
+"""
+Shared SQLite Connection Layer
+Thread-local connections per database file, tuned for concurrent access
+"""
+
+import os
+import re
+import json
+import base64
+import sqlite3
+import threading
+
+# Applied to every new connection. WAL lets readers run while a write is in
+# progress; NORMAL sync is durable across application crashes in WAL mode.
+PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', '-16000')),  # Negative = KiB (16 MB)
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(128 * 1024 * 1024))),
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000  # ms to wait for a competing writer instead of "database is locked"
+}
+
+# Per-connection cache of compiled statements (sqlite3 reuses them by SQL text)
+CACHED_STATEMENTS = 256
+
+# Quoted phrases or bare terms (a trailing * marks a prefix search)
+FTS_TERM = re.compile(r'"([^"]*)"|(\S+)')
+
+_local = threading.local()
+
+def get_connection(db_path):
+    """Return this thread's connection to db_path, opening it on first use
+
+    Use it as ``with get_connection(path) as conn:`` to commit on success and
+    roll back on error; the connection stays open for reuse by the thread.
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    key = os.path.abspath(db_path)
+    conn = connections.get(key)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=PRAGMAS['busy_timeout'] / 1000,
+                               cached_statements=CACHED_STATEMENTS)
+        conn.row_factory = sqlite3.Row
+        for name, value in PRAGMAS.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        connections[key] = conn
+    return conn
+
+def close_connections():
+    """Close every connection opened by the current thread"""
+    connections = getattr(_local, 'connections', None) or {}
+    for conn in connections.values():
+        conn.close()
+    connections.clear()
+
+def fts_match_query(query):
+    """Translate a user search string into a safe FTS5 MATCH expression
+
+    Bare words are matched as terms (all must match), ``"quoted text"`` as a
+    phrase and ``word*`` as a prefix. Punctuation is dropped, so user input
+    can never produce an FTS5 syntax error. Returns None if nothing is left.
+    """
+    terms = []
+    for phrase, word in FTS_TERM.findall(query):
+        text = phrase or word
+        tokens = re.findall(r'\w+', text)
+        if not tokens:
+            continue
+        prefix = '*' if not phrase and text.endswith('*') else ''
+        terms.append('"' + ' '.join(tokens) + '"' + prefix)
+    return ' '.join(terms) or None
+
+def init_fts_index(cursor, table, columns):
+    """Create an FTS5 index over table columns, kept in sync by triggers
+
+    The index is external-content (``{table}_fts`` stores no copy of the
+    text) and is backfilled once when it is first added to an existing
+    database. Returns False if this SQLite build has no FTS5, in which case
+    callers fall back to LIKE.
+    """
+    fts = f'{table}_fts'
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'new.{column}' for column in columns)
+    old_values = ', '.join(f'old.{column}' for column in columns)
+
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,))
+    exists = cursor.fetchone() is not None
+
+    try:
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {column_list},
+                content='{table}',
+                content_rowid='id',
+                tokenize='porter unicode61',
+                prefix='2 3'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"⚠ Full-text search unavailable for {table} ({e}), using LIKE")
+        return False
+
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {column_list} ON {table} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+    ''')
+
+    # Backfill rows stored before the index was created
+    if not exists:
+        cursor.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+    return True
+
+def encode_cursor(values):
+    """Opaque pagination token holding the sort key of the last row on a page"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    """Sort key stored by encode_cursor; raises ValueError if the token is malformed"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError('Invalid pagination cursor') from e
+    if not isinstance(values, list):
+        raise ValueError('Invalid pagination cursor')
+    return values
+
+def fetch_page(cursor, columns, source, order, limit=None, after=None, fields=None):
+    """Run a keyset-paginated SELECT and return (rows, next_cursor)
+
+    ``columns`` maps output field names to SQL expressions and ``order`` is a
+    list of (field, descending) pairs ending in a unique key. Rows after the
+    ``after`` cursor are selected with a WHERE on the sort key rather than
+    OFFSET, so every page costs the same. ``fields`` limits the returned
+    fields; sort key fields are always fetched to build the next cursor.
+    """
+    selected = list(fields) if fields else list(columns)
+    unknown = [field for field in selected if field not in columns]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    fetched = selected + [field for field, _ in order if field not in selected]
+
+    sql = f"SELECT {', '.join(f'{columns[field]} AS {field}' for field in fetched)} FROM {source}"
+    params = []
+
+    if after:
+        values = decode_cursor(after)
+        if len(values) != len(order):
+            raise ValueError('Invalid pagination cursor')
+        # (a, b) after (x, y) means a past x, or a = x and b past y
+        clauses = []
+        for i, (field, descending) in enumerate(order):
+            parts = [f'{columns[previous]} = ?' for previous, _ in order[:i]]
+            parts.append(f"{columns[field]} {'<' if descending else '>'} ?")
+            clauses.append(' AND '.join(parts))
+            params.extend(values[:i + 1])
+        sql += ' WHERE (' + ') OR ('.join(clauses) + ')'
+
+    sql += ' ORDER BY ' + ', '.join(f"{columns[field]} {'DESC' if descending else 'ASC'}"
+                                    for field, descending in order)
+    if limit:
+        sql += ' LIMIT ?'
+        params.append(limit + 1)  # One extra row tells us whether there is a next page
+
+    cursor.execute(sql, params)
+    rows = [dict(row) for row in cursor.fetchall()]
+
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][field] for field, _ in order])
+
+    if len(fetched) > len(selected):
+        rows = [{field: row[field] for field in selected} for row in rows]
+    return rows, next_cursor
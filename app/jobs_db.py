@@ -0,0 +1,134 @@
+"""
+Background Jobs Database
+Persists background job state (status, progress, result) across restarts
+"""
+
+import json
+from datetime import datetime
+
+from app.db import get_connection
+
+class JobsDatabase:
+    def __init__(self, db_path="jarvis_jobs.db"):
+        self.db_path = db_path
+        self.init_db()
+    
+    def init_db(self):
+        """Initialize the database with jobs table"""
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    params TEXT,
+                    progress TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    started_at TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            ''')
+            
+            # Add indexes for better query performance
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_jobs_status
+                ON jobs(status)
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_jobs_created_at
+                ON jobs(created_at DESC)
+            ''')
+        print(f"✓ Jobs database initialized: {self.db_path}")
+    
+    def _row_to_job(self, row):
+        """Convert a jobs row to a dict with decoded JSON fields"""
+        job = dict(row)
+        for field in ('params', 'progress', 'result'):
+            job[field] = json.loads(job[field]) if job[field] else {}
+        return job
+    
+    def create_job(self, kind, params=None):
+        """Create a new queued job"""
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO jobs (kind, status, params, progress, created_at)
+                VALUES (?, 'queued', ?, ?, ?)
+            ''', (kind, json.dumps(params or {}), json.dumps({}), datetime.now()))
+            
+            job_id = cursor.lastrowid
+        
+        return job_id
+    
+    def get_job(self, job_id):
+        """Get a specific job by ID"""
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+            job = cursor.fetchone()
+        
+        return self._row_to_job(job) if job else None
+    
+    def get_recent_jobs(self, limit=20):
+        """Get the most recent jobs"""
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT * FROM jobs
+                ORDER BY created_at DESC
+                LIMIT ?
+            ''', (limit,))
+            
+            jobs = [self._row_to_job(row) for row in cursor.fetchall()]
+        
+        return jobs
+    
+    def get_unfinished_jobs(self):
+        """Get queued or running jobs, oldest first"""
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT * FROM jobs
+                WHERE status IN ('queued', 'running')
+                ORDER BY id ASC
+            ''')
+            
+            jobs = [self._row_to_job(row) for row in cursor.fetchall()]
+        
+        return jobs
+    
+    def mark_running(self, job_id):
+        """Mark a job as started"""
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?
+            ''', (datetime.now(), job_id))
+    
+    def update_progress(self, job_id, progress):
+        """Store the latest progress counters for a job"""
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                UPDATE jobs SET progress = ? WHERE id = ?
+            ''', (json.dumps(progress), job_id))
+    
+    def mark_finished(self, job_id, result=None, error=None):
+        """Mark a job as completed, or failed if an error is given"""
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?
+            ''', ('failed' if error else 'completed', json.dumps(result or {}), error, datetime.now(), job_id))
@@ -1,8 +1,17 @@
-import sqlite3
 import json
+import sqlite3
 from datetime import datetime
 from pathlib import Path
 
+from app.db import get_connection, fetch_page, fts_match_query, init_fts_index
+
+# BM25 column weights for search: title, content, category
+SEARCH_WEIGHTS = (10.0, 1.0, 3.0)
+
+# Fields available to list queries, and their keyset order (most recent first)
+LIST_COLUMNS = {name: name for name in ('id', 'title', 'content', 'category', 'created_at', 'updated_at')}
+LIST_ORDER = [('updated_at', True), ('id', True)]
+
 class NotesDatabase:
     def __init__(self, db_path="jarvis_notes.db"):
         self.db_path = db_path
@@ -10,153 +19,162 @@ class NotesDatabase:
     
     def init_db(self):
         """Initialize the database with notes table"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS notes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                content TEXT NOT NULL,
-                category TEXT DEFAULT 'General',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Add indexes for better query performance
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_notes_category 
-            ON notes(category)
-        ''')
-        
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_notes_updated_at 
-            ON notes(updated_at DESC)
-        ''')
-        
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_notes_created_at 
-            ON notes(created_at DESC)
-        ''')
-        
-        conn.commit()
-        conn.close()
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS notes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    title TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    category TEXT DEFAULT 'General',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Add indexes for better query performance
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_notes_category 
+                ON notes(category)
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_notes_updated_at 
+                ON notes(updated_at DESC)
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_notes_created_at 
+                ON notes(created_at DESC)
+            ''')
+            
+            # Full-text index for search_notes
+            init_fts_index(cursor, 'notes', ['title', 'content', 'category'])
         print(f"✓ Notes database initialized: {self.db_path}")
     
     def create_note(self, title, content, category="General"):
         """Create a new note"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO notes (title, content, category, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (title, content, category, datetime.now(), datetime.now()))
-        
-        note_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO notes (title, content, category, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (title, content, category, datetime.now(), datetime.now()))
+            
+            note_id = cursor.lastrowid
         
         return note_id
     
     def get_all_notes(self):
         """Get all notes"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id, title, content, category, created_at, updated_at
-            FROM notes
-            ORDER BY updated_at DESC
-        ''')
-        
-        notes = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        return notes
+        return self.get_notes_page()[0]
+    
+    def get_notes_page(self, limit=None, cursor=None, fields=None):
+        """Get notes most recently updated first, one page at a time
+        
+        Returns (notes, next_cursor); pass next_cursor back to get the
+        following page (it is None on the last one). ``fields`` restricts
+        the returned columns, e.g. to leave out note content in list views.
+        """
+        with get_connection(self.db_path) as conn:
+            return fetch_page(conn.cursor(), LIST_COLUMNS, 'notes', LIST_ORDER,
+                              limit=limit, after=cursor, fields=fields)
     
     def get_note_by_id(self, note_id):
         """Get a specific note by ID"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id, title, content, category, created_at, updated_at
-            FROM notes
-            WHERE id = ?
-        ''', (note_id,))
-        
-        note = cursor.fetchone()
-        conn.close()
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT id, title, content, category, created_at, updated_at
+                FROM notes
+                WHERE id = ?
+            ''', (note_id,))
+            
+            note = cursor.fetchone()
         
         return dict(note) if note else None
     
     def update_note(self, note_id, title=None, content=None, category=None):
         """Update an existing note"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Build dynamic update query
-        updates = []
-        params = []
-        
-        if title is not None:
-            updates.append("title = ?")
-            params.append(title)
-        
-        if content is not None:
-            updates.append("content = ?")
-            params.append(content)
-        
-        if category is not None:
-            updates.append("category = ?")
-            params.append(category)
-        
-        if updates:
-            updates.append("updated_at = ?")
-            params.append(datetime.now())
-            params.append(note_id)
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
             
-            query = f"UPDATE notes SET {', '.join(updates)} WHERE id = ?"
-            cursor.execute(query, params)
+            # Build dynamic update query
+            updates = []
+            params = []
             
-            conn.commit()
-        
-        conn.close()
+            if title is not None:
+                updates.append("title = ?")
+                params.append(title)
+            
+            if content is not None:
+                updates.append("content = ?")
+                params.append(content)
+            
+            if category is not None:
+                updates.append("category = ?")
+                params.append(category)
+            
+            if updates:
+                updates.append("updated_at = ?")
+                params.append(datetime.now())
+                params.append(note_id)
+                
+                query = f"UPDATE notes SET {', '.join(updates)} WHERE id = ?"
+                cursor.execute(query, params)
         
         return cursor.rowcount > 0
     
     def delete_note(self, note_id):
         """Delete a note"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('DELETE FROM notes WHERE id = ?', (note_id,))
-        
-        deleted = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('DELETE FROM notes WHERE id = ?', (note_id,))
+            
+            deleted = cursor.rowcount > 0
         
         return deleted
     
-    def search_notes(self, query):
-        """Search notes by title or content"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        search_pattern = f"%{query}%"
-        cursor.execute('''
-            SELECT id, title, content, category, created_at, updated_at
-            FROM notes
-            WHERE title LIKE ? OR content LIKE ?
-            ORDER BY updated_at DESC
-        ''', (search_pattern, search_pattern))
-        
-        notes = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+    def search_notes(self, query, limit=50):
+        """Search notes by title, content or category, best matches first
+        
+        Title matches weigh most. Each note gets a ``snippet`` with matches
+        wrapped in <mark> tags and a BM25 ``score`` (higher is better).
+        """
+        match = fts_match_query(query)
+        if match is None:
+            return []
+        
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            try:
+                cursor.execute('''
+                    SELECT n.id, n.title, n.content, n.category, n.created_at, n.updated_at,
+                           snippet(notes_fts, -1, '<mark>', '</mark>', '…', 16) as snippet,
+                           -bm25(notes_fts, ?, ?, ?) as score
+                    FROM notes_fts
+                    JOIN notes n ON n.id = notes_fts.rowid
+                    WHERE notes_fts MATCH ?
+                    ORDER BY score DESC
+                    LIMIT ?
+                ''', (*SEARCH_WEIGHTS, match, limit))
+            except sqlite3.OperationalError:
+                # No FTS5 in this SQLite build
+                search_pattern = f"%{query}%"
+                cursor.execute('''
+                    SELECT id, title, content, category, created_at, updated_at,
+                           substr(content, 1, 200) as snippet, 0 as score
+                    FROM notes
+                    WHERE title LIKE ? OR content LIKE ? OR category LIKE ?
+                    ORDER BY updated_at DESC
+                    LIMIT ?
+                ''', (search_pattern, search_pattern, search_pattern, limit))
+            
+            notes = [dict(row) for row in cursor.fetchall()]
         
         return notes
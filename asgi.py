@@ -0,0 +1,272 @@
+"""
+ASGI entry point for Nexus
+The LLM routes (/chat, /summarize, /explain, /generate-flashcards, /batch
+and the /stream variants) are served by async handlers, so a request
+waiting on Ollama holds no thread. Every other route runs on the Flask app through
+asgiref's WSGI adapter, on the event loop's default thread pool (WEB_THREADS).
+
+Run with: python serve.py  (or: uvicorn asgi:application)
+"""
+
+import os
+import json
+import asyncio
+import importlib.util
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from werkzeug.datastructures import Headers
+
+def _load_flask_module():
+    """Import app.py, which shares its name with the app/ package"""
+    spec = importlib.util.spec_from_file_location("nexus_app", Path(__file__).with_name("app.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class ThreadPoolWsgiInstance(WsgiToAsgiInstance):
+    """One WSGI call, run on the event loop's default executor
+    
+    asgiref runs WSGI apps thread-sensitively, which puts every request on
+    a single shared thread; Flask views are thread-safe, so they can run
+    side by side on the WEB_THREADS pool instead.
+    """
+    
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False)
+
+class ThreadPoolWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await ThreadPoolWsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+nexus = _load_flask_module()
+wsgi_application = ThreadPoolWsgiToAsgi(nexus.app)
+
+# Match the Flask app's flask-cors defaults
+RESPONSE_HEADERS = [(b'access-control-allow-origin', b'*')]
+
+def request_headers(scope):
+    return Headers([(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope['headers']])
+
+async def read_json(receive):
+    """Read and decode a JSON request body"""
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    return json.loads(body or b'{}')
+
+def client_address(scope):
+    client = scope.get('client')
+    return client[0] if client else None
+
+async def send_json(send, payload, status=200, headers=()):
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': RESPONSE_HEADERS + list(headers) + [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode())
+        ]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def send_busy(send, e):
+    """429/503 with Retry-After for a request the scheduler refused"""
+    await send_json(send, {'error': e.message, 'retry_after': e.retry_after}, e.status,
+                    [(b'retry-after', str(e.retry_after).encode())])
+
+async def acquire_slot(priority, scope):
+    """Wait for a scheduler slot; returns None when the LLM is unavailable"""
+    if not nexus.llm_scheduler:
+        return None
+    return await nexus.llm_scheduler.acquire_async(priority, client_address(scope))
+
+def release_slot(ticket):
+    if ticket:
+        nexus.llm_scheduler.release(ticket)
+
+async def llm_route(build_task, name, scope, receive, send):
+    """Async counterpart of app.run_llm_task"""
+    try:
+        data = await read_json(receive)
+        ticket = await acquire_slot(nexus.LLM_PRIORITIES[name], scope)
+        try:
+            # Retrieval and database reads block, so they run in a worker thread
+            task = await asyncio.to_thread(build_task, data, request_headers(scope))
+            response = None
+            if task.pipeline:
+                # Pipeline steps take slots of their own
+                release_slot(ticket)
+                complete = nexus.pipeline_completion(name, client_address(scope))
+                response = await asyncio.to_thread(task.pipeline, complete)
+            elif task.prompt is not None:
+                if ticket and nexus.llm_client.is_generating(**task.completion_args()):
+                    # Joining an identical generation in progress needs no slot
+                    release_slot(ticket)
+                response = await nexus.llm_client.get_completion_async(**task.completion_args())
+        finally:
+            release_slot(ticket)
+        payload = await asyncio.to_thread(task.finish, response)
+        await send_json(send, payload)
+    except nexus.SchedulerBusy as e:
+        await send_busy(send, e)
+    except nexus.RequestError as e:
+        await send_json(send, {'error': e.message}, e.status)
+    except nexus.LLMError as e:
+        await send_json(send, {'error': str(e)}, 502)
+    except Exception as e:
+        print(f"Error in {name} endpoint: {e}")
+        await send_json(send, {'error': str(e)}, 500)
+
+async def chat_stream(scope, receive, send):
+    """Async counterpart of the /chat/stream view"""
+    ticket = None
+    try:
+        data = await read_json(receive)
+        ticket = await acquire_slot(nexus.INTERACTIVE, scope)
+        task = await asyncio.to_thread(nexus.chat_task, data, request_headers(scope), True)
+        if ticket and nexus.llm_client.is_generating(**task.completion_args()):
+            release_slot(ticket)
+            ticket = None
+    except nexus.SchedulerBusy as e:
+        return await send_busy(send, e)
+    except nexus.RequestError as e:
+        release_slot(ticket)
+        return await send_json(send, {'error': e.message}, e.status)
+    except Exception as e:
+        release_slot(ticket)
+        print(f"Error in chat stream endpoint: {e}")
+        return await send_json(send, {'error': str(e)}, 500)
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': RESPONSE_HEADERS + [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no')
+        ]
+    })
+
+    async def emit(payload):
+        await send({'type': 'http.response.body', 'body': nexus.sse_event(payload).encode('utf-8'), 'more_body': True})
+
+    formatter = nexus.StreamingResponseFormatter()
+    parts = []
+    try:
+        if data.get('chat_id'):
+            await emit({'chat_id': data['chat_id']})
+        async for token in nexus.llm_client.stream_completion_async(**task.completion_args()):
+            text = formatter.feed(token)
+            if text:
+                parts.append(text)
+                await emit({'token': text})
+        text = formatter.flush()
+        if text:
+            parts.append(text)
+            await emit({'token': text})
+
+        # Save the whole turn to the database once generation completes
+        await emit(await asyncio.to_thread(task.finish, ''.join(parts)))
+    except nexus.LLMError as e:
+        # A failed or cut-off generation is reported, never saved
+        await emit({'error': str(e)})
+    except Exception as e:
+        print(f"Error in chat stream endpoint: {e}")
+        await emit({'error': str(e)})
+    finally:
+        # Also runs when the client disconnects mid-stream
+        release_slot(ticket)
+    await send({'type': 'http.response.body', 'body': b''})
+
+async def flashcards_stream(scope, receive, send):
+    """Async counterpart of the /generate-flashcards/stream view"""
+    ticket = None
+    try:
+        data = await read_json(receive)
+        ticket = await acquire_slot(nexus.BATCH, scope)
+        task = await asyncio.to_thread(nexus.flashcards_task, data, request_headers(scope), True)
+        if ticket and (task.pipeline or nexus.llm_client.is_generating(**task.completion_args())):
+            release_slot(ticket)
+            ticket = None
+    except nexus.SchedulerBusy as e:
+        return await send_busy(send, e)
+    except nexus.RequestError as e:
+        release_slot(ticket)
+        return await send_json(send, {'error': e.message}, e.status)
+    except Exception as e:
+        release_slot(ticket)
+        print(f"Error in flashcards stream endpoint: {e}")
+        return await send_json(send, {'error': str(e)}, 500)
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': RESPONSE_HEADERS + [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no')
+        ]
+    })
+
+    async def emit(payload):
+        await send({'type': 'http.response.body', 'body': nexus.sse_event(payload).encode('utf-8'), 'more_body': True})
+
+    try:
+        if task.pipeline:
+            complete = nexus.pipeline_completion('generate-flashcards', client_address(scope))
+            cards = await asyncio.to_thread(task.pipeline, complete)
+            for card in cards:
+                await emit({'flashcard': card})
+        else:
+            parser = nexus.FlashcardStreamParser()
+            parts = []
+            async for token in nexus.llm_client.stream_completion_async(**task.completion_args()):
+                parts.append(token)
+                for card in parser.feed(token):
+                    await emit({'flashcard': card})
+            cards = parser.cards or nexus.parse_flashcards(''.join(parts))
+            if not parser.cards:
+                for card in cards:
+                    await emit({'flashcard': card})
+        await emit(await asyncio.to_thread(task.finish, cards))
+    except Exception as e:
+        print(f"Error in flashcards stream endpoint: {e}")
+        await emit({'error': str(e)})
+    finally:
+        release_slot(ticket)
+    await send({'type': 'http.response.body', 'body': b''})
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Thread pool for Flask routes and blocking work (WEB_THREADS, default 32)
+            threads = int(os.getenv('WEB_THREADS', '32'))
+            asyncio.get_running_loop().set_default_executor(
+                ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi'))
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    """Route LLM requests to the async handlers and everything else to Flask"""
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    if scope['type'] == 'http' and scope['method'] == 'POST':
+        if scope['path'] == '/chat/stream':
+            return await chat_stream(scope, receive, send)
+        if scope['path'] == '/generate-flashcards/stream':
+            return await flashcards_stream(scope, receive, send)
+        build_task = nexus.LLM_TASKS.get(scope['path'])
+        if build_task:
+            return await llm_route(build_task, scope['path'].lstrip('/'), scope, receive, send)
+
+    await wsgi_application(scope, receive, send)
@@ -3,7 +3,16 @@ Nexus AI Models Package
 
 This package contains all AI/ML model-related components:
 - llm_client: Ollama LLM integration
-- retriever: Pinecone vector search for RAG
+- retriever: Hybrid (vector + BM25) search for RAG
+- vector_store: Local NumPy and Pinecone vector store backends
+- lexical_index: BM25 index over chunk text
+- reranker: Optional cross-encoder reranking of retrieved chunks
+- embeddings: Shared sentence-transformer embedding service
+- completion_cache: Persistent LLM completion cache
+- scheduler: Admission control and priorities for LLM requests
+- map_reduce: Chunked map-reduce helpers for long texts
+- flashcards: Flashcard JSON schema, validation and streaming parser
+- conversation: Token-budgeted chat history with rolling summaries
 - ingest: Document ingestion pipeline
 - document_manager: Document management utilities
 """
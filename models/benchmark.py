@@ -0,0 +1,347 @@
+"""
+Retrieval Benchmark
+Recall@k, MRR, latency, build time and memory for each retrieval backend
+
+Run from the project root:
+    python -m models.benchmark --output results.json
+    python -m models.benchmark --compare results.json
+
+Everything runs offline: the corpus and labeled queries are synthetic and
+the embedding model is replaced by a hashing embedder, so results measure
+the index, chunking and fusion code rather than the sentence-transformer.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import platform
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+import numpy as np
+
+from .ingest import DocumentIngestor, CHUNK_SIZE, CHUNK_OVERLAP
+from .retriever import Retriever
+from .lexical_index import LexicalIndex, LEXICAL_INDEX_FILE, tokenize
+from .vector_store import LocalVectorStore, DEFAULT_DIMENSION
+
+BACKENDS = ("local", "pinecone")
+MODES = ("dense", "hybrid", "hybrid+rerank")
+RECALL_AT = (1, 3, 5, 10)
+
+# Metrics compared between runs, with whether a higher value is better
+COMPARED_METRICS = {
+    "recall@1": True, "recall@3": True, "recall@5": True, "recall@10": True, "mrr": True,
+    "latency_p50_ms": False, "latency_p95_ms": False, "latency_p99_ms": False,
+    "build_seconds": False, "index_bytes": False, "build_peak_bytes": False
+}
+
+class HashingEmbedder:
+    """Offline stand-in for EmbeddingService
+    
+    Embeds text as a signed, feature-hashed bag of words, so texts sharing
+    words get similar vectors. Deterministic across runs and machines.
+    """
+    
+    available = True
+    
+    def __init__(self, dimension=DEFAULT_DIMENSION):
+        self.dimension = dimension
+        self._features = {}
+    
+    def _feature(self, token):
+        feature = self._features.get(token)
+        if feature is None:
+            digest = hashlib.md5(token.encode('utf-8')).digest()
+            feature = (int.from_bytes(digest[:4], "little") % self.dimension, 1.0 if digest[4] & 1 else -1.0)
+            self._features[token] = feature
+        return feature
+    
+    def _embed(self, text):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in tokenize(text):
+            position, sign = self._feature(token)
+            vector[position] += sign
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    def encode(self, texts, batch_size=32):
+        return np.stack([self._embed(text) for text in texts])
+    
+    def encode_query(self, text):
+        return self._embed(text)
+
+# ----- Synthetic corpus -----
+
+SYLLABLES = ["ka", "lo", "mi", "ren", "tu", "vas", "po", "ex", "dri", "nal", "qua", "sel", "bor", "fin", "gu", "zo"]
+COMMON_WORDS = ["the", "of", "and", "a", "in", "is", "to", "for", "with", "as", "on", "by", "this", "that"]
+
+def _word(rng, syllables):
+    return "".join(rng.choice(SYLLABLES) for _ in range(syllables))
+
+def build_corpus(documents=40, facts_per_document=5, sentences_per_document=60, topics=8, seed=13):
+    """Synthetic documents with planted facts, and labeled queries for them
+    
+    Each document belongs to a topic and is filler text from that topic's
+    vocabulary. Facts are sentences with a unique code term; every fact
+    gets two queries: "keyword" names the code term, "descriptive" only
+    uses the fact's topical words, which other chunks share.
+    
+    Returns ({file name: text}, [{"query", "kind", "term"}]).
+    """
+    rng = random.Random(seed)
+    vocabularies = [sorted({_word(rng, 2) for _ in range(120)}) for _ in range(topics)]
+    used_terms = set()
+    
+    files = {}
+    queries = []
+    for doc_index in range(documents):
+        vocabulary = vocabularies[doc_index % topics]
+        sentences = []
+        for _ in range(sentences_per_document):
+            words = [rng.choice(vocabulary if rng.random() < 0.6 else COMMON_WORDS) for _ in range(rng.randint(8, 16))]
+            sentences.append(" ".join(words).capitalize() + ".")
+        
+        for _ in range(facts_per_document):
+            term = _word(rng, 4)
+            while term in used_terms:
+                term = _word(rng, 4)
+            used_terms.add(term)
+            described = rng.sample(vocabulary, 5)
+            fact = f"The {term} {' '.join(described[:3])} is {' '.join(described[3:])}."
+            sentences.insert(rng.randrange(len(sentences) + 1), fact)
+            
+            queries.append({"query": f"what is {term}", "kind": "keyword", "term": term})
+            queries.append({"query": " ".join(rng.sample(described, 4)), "kind": "descriptive", "term": term})
+        
+        files[f"doc_{doc_index:03d}.txt"] = " ".join(sentences)
+    return files, queries
+
+# ----- Measurement -----
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+def directory_bytes(path):
+    total = 0
+    for root, _, names in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in names)
+    return total
+
+def _create_store(backend, index_dir):
+    if backend == "local":
+        return LocalVectorStore(index_dir)
+    from .vector_store import PineconeVectorStore
+    return PineconeVectorStore(index_name=os.getenv("PINECONE_BENCHMARK_INDEX", "nexus-benchmark"),
+                               create_if_missing=True)
+
+def _wait_for_count(store, expected, timeout=60):
+    """Remote indexes are eventually consistent; wait until writes are visible"""
+    deadline = time.monotonic() + timeout
+    while store.count() < expected and time.monotonic() < deadline:
+        time.sleep(1)
+
+def build_index(backend, files, workdir, chunk_size, chunk_overlap, embedder):
+    """Ingest the corpus into a fresh index; returns (store, lexical index, build stats)"""
+    data_dir = os.path.join(workdir, "data")
+    index_dir = os.path.join(workdir, "index")
+    os.makedirs(data_dir)
+    for name, text in files.items():
+        with open(os.path.join(data_dir, name), 'w', encoding='utf-8') as f:
+            f.write(text)
+    
+    store = _create_store(backend, index_dir)
+    lexical = LexicalIndex(os.path.join(index_dir, LEXICAL_INDEX_FILE), store.identity)
+    ingestor = DocumentIngestor(vector_store=store, embedding_service=embedder, lexical_index=lexical,
+                                chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    
+    tracemalloc.start()
+    start = time.perf_counter()
+    stats = ingestor.ingest_documents(data_dir=data_dir, force=True)
+    build_seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    if backend != "local":
+        _wait_for_count(store, stats["chunks_embedded"])
+    return store, lexical, {
+        "chunks": stats["chunks_embedded"],
+        "build_seconds": round(build_seconds, 3),
+        "build_peak_bytes": peak,
+        "index_bytes": directory_bytes(index_dir)
+    }
+
+def label_queries(queries, lexical):
+    """Relevant chunk IDs for each query: the chunks containing its fact's term"""
+    chunks_by_term = {}
+    for chunk_id, document in lexical.documents.items():
+        for term in document["terms"]:
+            chunks_by_term.setdefault(term, set()).add(chunk_id)
+    return [dict(query, relevant=chunks_by_term.get(query["term"], set())) for query in queries]
+
+def evaluate(retriever, queries, top_k):
+    """Recall@k and MRR over labeled queries, and per-query latency with cold caches"""
+    hits = {k: 0 for k in sorted({k for k in RECALL_AT if k < top_k} | {top_k})}
+    by_kind = {}
+    reciprocal_ranks = []
+    latencies = []
+    
+    retriever.retrieve(queries[0]["query"], top_k=top_k)  # Warm-up
+    for query in queries:
+        retriever.results_cache.clear()
+        retriever.embedding_cache.clear()
+        start = time.perf_counter()
+        results = retriever.retrieve(query["query"], top_k=top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        
+        rank = next((i + 1 for i, result in enumerate(results) if result["id"] in query["relevant"]), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+        for k in hits:
+            if rank and rank <= k:
+                hits[k] += 1
+        kind = by_kind.setdefault(query["kind"], {"queries": 0, "hits": 0})
+        kind["queries"] += 1
+        kind["hits"] += 1 if rank else 0
+    
+    count = len(queries)
+    metrics = {f"recall@{k}": round(hits[k] / count, 4) for k in hits}
+    metrics["mrr"] = round(sum(reciprocal_ranks) / count, 4)
+    metrics.update({
+        "latency_p50_ms": round(percentile(latencies, 50), 3),
+        "latency_p95_ms": round(percentile(latencies, 95), 3),
+        "latency_p99_ms": round(percentile(latencies, 99), 3),
+        "latency_mean_ms": round(sum(latencies) / count, 3),
+        f"recall@{top_k}_by_kind": {
+            kind: round(values["hits"] / values["queries"], 4) for kind, values in sorted(by_kind.items())
+        }
+    })
+    return metrics
+
+def available_backends(requested):
+    """Requested backends that can run here (Pinecone needs an API key)"""
+    backends = []
+    for backend in requested:
+        if backend == "pinecone" and not os.getenv("PINECONE_API_KEY"):
+            print("⚠ Skipping pinecone: PINECONE_API_KEY is not set")
+            continue
+        backends.append(backend)
+    return backends
+
+def run_benchmark(backends=("local",), modes=("dense", "hybrid"), top_k=10, chunk_size=CHUNK_SIZE,
+                  chunk_overlap=CHUNK_OVERLAP, documents=40, facts_per_document=5, seed=13):
+    """Build each backend's index once and evaluate every retrieval mode on it"""
+    files, queries = build_corpus(documents=documents, facts_per_document=facts_per_document, seed=seed)
+    embedder = HashingEmbedder()
+    
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__
+        },
+        "config": {
+            "documents": documents,
+            "facts_per_document": facts_per_document,
+            "queries": len(queries),
+            "seed": seed,
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "top_k": top_k,
+            "embedder": "hashing"
+        },
+        "results": []
+    }
+    
+    for backend in available_backends(backends):
+        workdir = tempfile.mkdtemp(prefix=f"nexus-benchmark-{backend}-")
+        store = lexical = None
+        try:
+            store, lexical, build = build_index(backend, files, workdir, chunk_size, chunk_overlap, embedder)
+            labeled = label_queries(queries, lexical)
+            for mode in modes:
+                retriever = Retriever(vector_store=store, embedding_service=embedder, lexical_index=lexical,
+                                      mode=mode.split("+")[0], rerank=mode.endswith("+rerank"))
+                result = {"backend": backend, "mode": mode}
+                result.update(build)
+                result.update(evaluate(retriever, labeled, top_k))
+                result["stage_timeouts"] = retriever.cache_stats()["stage_timeouts"]
+                report["results"].append(result)
+                print(f"✓ {backend}/{mode}: recall@{top_k}={result[f'recall@{top_k}']} "
+                      f"mrr={result['mrr']} p95={result['latency_p95_ms']} ms")
+        finally:
+            if store is not None and backend != "local":
+                # Leave the remote benchmark index empty for the next run
+                store.delete([chunk_id for chunk_id in lexical.documents])
+            shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+def compare(previous, current):
+    """Relative change of each metric for the (backend, mode) pairs in both reports"""
+    earlier = {(result["backend"], result["mode"]): result for result in previous["results"]}
+    changes = []
+    for result in current["results"]:
+        before = earlier.get((result["backend"], result["mode"]))
+        if before is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            if metric not in result or metric not in before:
+                continue
+            old, new = before[metric], result[metric]
+            change = (new - old) / old if old else 0.0
+            changes.append({
+                "backend": result["backend"],
+                "mode": result["mode"],
+                "metric": metric,
+                "previous": old,
+                "current": new,
+                "change": round(change, 4),
+                "better": (new > old) == higher_is_better if new != old else None
+            })
+    return changes
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Benchmark retrieval quality and latency offline")
+    parser.add_argument("--backends", default="local", help=f"Comma-separated, from {', '.join(BACKENDS)}")
+    parser.add_argument("--modes", default="dense,hybrid", help=f"Comma-separated, from {', '.join(MODES)}")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP)
+    parser.add_argument("--documents", type=int, default=40)
+    parser.add_argument("--facts", type=int, default=5, help="Labeled facts per document (two queries each)")
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="Previous JSON report to compare against")
+    args = parser.parse_args()
+    
+    backends = [backend.strip() for backend in args.backends.split(",") if backend.strip()]
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    for value, allowed in [(b, BACKENDS) for b in backends] + [(m, MODES) for m in modes]:
+        if value not in allowed:
+            parser.error(f"unknown value '{value}' (expected one of {', '.join(allowed)})")
+    
+    # Progress goes to stderr so stdout stays valid JSON
+    with redirect_stdout(sys.stderr):
+        report = run_benchmark(backends=backends, modes=modes, top_k=args.top_k, chunk_size=args.chunk_size,
+                               chunk_overlap=args.chunk_overlap, documents=args.documents,
+                               facts_per_document=args.facts, seed=args.seed)
+    
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            report["comparison"] = compare(json.load(f), report)
+    
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+        print(f"✓ Report written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
@@ -0,0 +1,191 @@
+"""
+LLM Completion Cache
+Persists LLM responses keyed by a hash of model, options and messages
+"""
+
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from app.db import get_connection
+
+def _hash(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+class CompletionCache:
+    """SQLite-backed cache of LLM completions
+    
+    Exact lookups use a hash of the full request (model, options, messages).
+    When a similarity threshold is configured, a miss falls back to comparing
+    the embedding of the final user message against cached entries that share
+    the same model, options, system prompt and history.
+    """
+    
+    def __init__(self, db_path="jarvis_llm_cache.db", max_entries=None, similarity_threshold=None,
+                 embedder=None, similarity_candidates=500):
+        self.db_path = db_path
+        self.max_entries = max_entries or int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+        self.similarity_threshold = similarity_threshold or float(os.getenv("LLM_CACHE_SIMILARITY", "0")) or None
+        self.similarity_candidates = similarity_candidates
+        self.embedder = embedder
+        
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        
+        self.init_db()
+    
+    def init_db(self):
+        """Initialize the database with completions table"""
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS completions (
+                    key TEXT PRIMARY KEY,
+                    context_key TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    embedding BLOB,
+                    hits INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Add indexes for similarity candidates and LRU eviction
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_completions_context_key
+                ON completions(context_key, last_used_at DESC)
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_completions_last_used_at
+                ON completions(last_used_at DESC)
+            ''')
+        print(f"✓ Completion cache initialized: {self.db_path}")
+    
+    @staticmethod
+    def make_keys(payload):
+        """Return (exact key, context key) for an /api/chat request body"""
+        request = {k: v for k, v in payload.items() if k != "stream"}
+        messages = request.get("messages", [])
+        context = dict(request, messages=messages[:-1])
+        return _hash(request), _hash(context)
+    
+    def _embed(self, payload):
+        """Embedding of the final user message, or None if similarity is off"""
+        if not self.similarity_threshold:
+            return None
+        if self.embedder is None:
+            from .embeddings import get_embedding_service
+            self.embedder = get_embedding_service()
+        if not self.embedder.available:
+            return None
+        vector = np.asarray(self.embedder.encode_query(payload["messages"][-1]["content"]), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    def get(self, payload):
+        """Return a cached response for the request, or None"""
+        key, context_key = self.make_keys(payload)
+        
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT response FROM completions WHERE key = ?', (key,))
+            row = cursor.fetchone()
+            similar = False
+            
+            if row is None and self.similarity_threshold:
+                row, key = self._find_similar(cursor, payload, context_key)
+                similar = row is not None
+            
+            if row is not None:
+                cursor.execute('''
+                    UPDATE completions SET hits = hits + 1, last_used_at = ? WHERE key = ?
+                ''', (datetime.now(), key))
+        
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            elif similar:
+                self.similar_hits += 1
+            else:
+                self.hits += 1
+        
+        return row[0] if row else None
+    
+    def _find_similar(self, cursor, payload, context_key):
+        """Best cached response in the same context above the threshold"""
+        query = self._embed(payload)
+        if query is None:
+            return None, None
+        
+        cursor.execute('''
+            SELECT key, response, embedding FROM completions
+            WHERE context_key = ? AND embedding IS NOT NULL
+            ORDER BY last_used_at DESC
+            LIMIT ?
+        ''', (context_key, self.similarity_candidates))
+        candidates = cursor.fetchall()
+        if not candidates:
+            return None, None
+        
+        matrix = np.stack([np.frombuffer(embedding, dtype=np.float32) for _, _, embedding in candidates])
+        scores = matrix @ query
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None, None
+        return (candidates[best][1],), candidates[best][0]
+    
+    def set(self, payload, response):
+        """Store a response and evict the least recently used entries over the limit"""
+        key, context_key = self.make_keys(payload)
+        embedding = self._embed(payload)
+        
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT OR REPLACE INTO completions (key, context_key, model, response, embedding, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (key, context_key, payload.get("model", ""), response,
+                  embedding.tobytes() if embedding is not None else None, datetime.now(), datetime.now()))
+            
+            cursor.execute('''
+                DELETE FROM completions WHERE key IN (
+                    SELECT key FROM completions ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_entries,))
+    
+    def clear(self):
+        """Remove every cached completion"""
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('DELETE FROM completions')
+    
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with get_connection(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT COUNT(*) FROM completions')
+            size = cursor.fetchone()[0]
+        
+        with self._lock:
+            lookups = self.hits + self.similar_hits + self.misses
+            return {
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.similar_hits) / lookups, 3) if lookups else 0.0,
+                "size": size,
+                "max_entries": self.max_entries,
+                "similarity_threshold": self.similarity_threshold
+            }
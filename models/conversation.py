@@ -0,0 +1,89 @@
+import os
+
+from models.llm_client import LLMError
+
+# Rough size of a token for English text; close enough for budgeting
+CHARS_PER_TOKEN = 4
+
+SUMMARY_SYSTEM_PROMPT = """You keep a running summary of a study conversation between a user and an assistant.
+Merge the new messages into the existing summary. Keep facts, definitions, examples and open
+questions the user may refer back to; drop greetings and repetition.
+Reply with the updated summary only, in under 200 words."""
+
+def estimate_tokens(text):
+    """Approximate token count of a string"""
+    return len(text or "") // CHARS_PER_TOKEN + 1
+
+def truncate_to_tokens(text, token_budget):
+    """Text cut at a word boundary to roughly token_budget tokens"""
+    max_chars = max(0, token_budget - 1) * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(" ", 1)[0] + " ..."
+
+def trim_history(history, token_budget):
+    """Newest messages of a history list that fit in the token budget"""
+    kept = []
+    used = 0
+    for message in reversed(history):
+        used += estimate_tokens(message.get("content"))
+        if used > token_budget:
+            break
+        kept.append(message)
+    return kept[::-1]
+
+class ConversationContext:
+    """Builds the history sent to the LLM for a stored chat
+
+    Recent messages are sent verbatim while they fit in the token budget.
+    When they no longer do, the older half is folded into a rolling summary
+    of the conversation, which is stored with the chat so each message is
+    only ever summarized once. Summarizing down to half the budget means it
+    happens once every few turns rather than on every message. The summary
+    itself is held to the other half, so it can never crowd out the recent
+    messages.
+
+    Configuration (environment variables):
+    - CHAT_HISTORY_TOKENS: token budget for summary plus recent messages
+    """
+
+    def __init__(self, chat_db, llm_client, token_budget=None):
+        self.chat_db = chat_db
+        self.llm_client = llm_client
+        self.token_budget = token_budget or int(os.getenv("CHAT_HISTORY_TOKENS", "2000"))
+
+    def build_history(self, chat_id):
+        """Ollama message list for a chat: summary of older turns plus recent messages"""
+        summary = self.chat_db.get_summary(chat_id)
+        summary_text = summary["summary"] if summary else None
+        if summary_text:
+            summary_text = truncate_to_tokens(summary_text, self.token_budget // 2)
+        messages = self.chat_db.get_chat_messages(chat_id, after_id=summary["last_message_id"] if summary else None)
+        history = [{"role": message["role"], "content": message["content"]} for message in messages]
+
+        used = estimate_tokens(summary_text) + sum(estimate_tokens(message["content"]) for message in history)
+        if used > self.token_budget:
+            recent = trim_history(history, self.token_budget // 2)
+            folded = messages[:len(messages) - len(recent)]
+            if folded:
+                updated = self._summarize(summary_text, folded)
+                if updated:
+                    summary_text = truncate_to_tokens(updated, self.token_budget // 2)
+                    self.chat_db.save_summary(chat_id, summary_text, folded[-1]["id"])
+            history = recent
+
+        if summary_text:
+            history.insert(0, {"role": "system", "content": f"Summary of the earlier conversation:\n{summary_text}"})
+        return history
+
+    def _summarize(self, summary_text, messages):
+        """Fold messages into the summary; returns None if the LLM call fails"""
+        transcript = "\n\n".join(f"{message['role'].capitalize()}: {message['content']}" for message in messages)
+        prompt = f"Current summary:\n{summary_text or '(none yet)'}\n\nNew messages:\n{transcript}"
+
+        try:
+            response = self.llm_client.get_completion_sync(prompt, system_prompt=SUMMARY_SYSTEM_PROMPT)
+        except LLMError as e:
+            print(f"Warning: Could not summarize chat history: {e}")
+            return None
+        return response.strip() or None
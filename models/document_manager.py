@@ -43,6 +43,13 @@ class DocumentManager:
         """Get list of all documents"""
         return self.metadata["documents"]
     
+    def get_document(self, doc_id):
+        """Get a document's metadata by ID"""
+        for doc in self.metadata["documents"]:
+            if doc["id"] == doc_id:
+                return doc
+        return None
+    
     def delete_document(self, doc_id):
         """Delete a document"""
         for i, doc in enumerate(self.metadata["documents"]):
@@ -0,0 +1,138 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+DEFAULT_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+DEFAULT_ONNX_QUANTIZED_FILE = 'onnx/model_qint8_avx512.onnx'
+
+class EmbeddingService:
+    """Process-wide sentence-transformer shared by ingestion and retrieval
+    
+    The model is loaded on first use. Concurrent single-query encodes are
+    merged by a background batcher into one forward pass, while ingestion
+    encodes its own batches directly.
+    
+    Configuration (environment variables):
+    - EMBEDDING_THREADS: intra-op CPU threads for torch
+    - EMBEDDING_BACKEND: 'torch' (default) or 'onnx'
+    - EMBEDDING_QUANTIZE=1: int8 inference (dynamic quantization for torch,
+      a pre-quantized model file for onnx, see EMBEDDING_ONNX_FILE)
+    - EMBEDDING_BATCH_WINDOW_MS / EMBEDDING_MAX_BATCH: query micro-batching
+    """
+    
+    def __init__(self, model_name=DEFAULT_MODEL_NAME, device='cpu', num_threads=None, backend=None,
+                 quantize=None, batch_window_ms=None, max_batch_size=None):
+        self.model_name = model_name
+        self.device = device
+        self.num_threads = num_threads or int(os.getenv("EMBEDDING_THREADS", "0")) or None
+        self.backend = (backend or os.getenv("EMBEDDING_BACKEND", "torch")).lower()
+        self.quantize = quantize if quantize is not None else os.getenv("EMBEDDING_QUANTIZE") == "1"
+        self.batch_window = (batch_window_ms if batch_window_ms is not None
+                             else float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))) / 1000
+        self.max_batch_size = max_batch_size or int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+        
+        self.model = None
+        self.error = None
+        self._load_lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._batcher = None
+    
+    def load(self):
+        """Load the model once; return True if it is available"""
+        if self.model is not None:
+            return True
+        with self._load_lock:
+            if self.model is None and self.error is None:
+                try:
+                    self.model = self._create_model()
+                    print(f"✓ Embedding model loaded: {self.model_name} ({self.backend}"
+                          f"{', int8' if self.quantize else ''})")
+                except Exception as e:
+                    self.error = e
+                    print(f"⚠ Could not load sentence-transformers: {e}")
+                    print("Document search will not be available")
+        return self.model is not None
+    
+    def _create_model(self):
+        from sentence_transformers import SentenceTransformer
+        
+        if self.num_threads:
+            import torch
+            torch.set_num_threads(self.num_threads)
+        
+        if self.backend == "onnx":
+            model_kwargs = {}
+            if self.quantize:
+                model_kwargs["file_name"] = os.getenv("EMBEDDING_ONNX_FILE", DEFAULT_ONNX_QUANTIZED_FILE)
+            return SentenceTransformer(self.model_name, device=self.device, backend="onnx",
+                                       model_kwargs=model_kwargs)
+        
+        model = SentenceTransformer(self.model_name, device=self.device)
+        if self.quantize:
+            import torch
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+    
+    @property
+    def available(self):
+        """Whether the model is (or can be) loaded"""
+        return self.load()
+    
+    def encode(self, texts, batch_size=32):
+        """Encode a list of texts in batches (used for ingestion)"""
+        if not self.load():
+            raise RuntimeError(f"Embedding model not available: {self.error}")
+        return np.asarray(self.model.encode(texts, batch_size=batch_size), dtype=np.float32)
+    
+    def encode_query(self, text):
+        """Encode one query, sharing a forward pass with concurrent callers"""
+        if not self.load():
+            raise RuntimeError(f"Embedding model not available: {self.error}")
+        self._ensure_batcher()
+        
+        future = Future()
+        self._requests.put((text, future))
+        return future.result()
+    
+    def _ensure_batcher(self):
+        if self._batcher is None:
+            with self._load_lock:
+                if self._batcher is None:
+                    self._batcher = threading.Thread(target=self._batch_loop, name="embedding-batcher", daemon=True)
+                    self._batcher.start()
+    
+    def _batch_loop(self):
+        """Collect queued queries for up to batch_window and encode them together"""
+        while True:
+            batch = [self._requests.get()]
+            deadline = time.monotonic() + self.batch_window
+            try:
+                while len(batch) < self.max_batch_size:
+                    batch.append(self._requests.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                pass
+            
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = self.encode(texts, batch_size=len(texts))
+                for (_, future), embedding in zip(batch, embeddings):
+                    future.set_result(embedding)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_embedding_service():
+    """Return the process-wide embedding service, creating it on first call"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = EmbeddingService()
+    return _service
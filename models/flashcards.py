@@ -0,0 +1,110 @@
+"""
+Structured Flashcard Output
+JSON schema for constrained generation, validation and incremental parsing
+"""
+
+import json
+
+# Passed to Ollama as "format" so generation can only produce this shape
+FLASHCARD_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "question": {"type": "string"},
+            "answer": {"type": "string"}
+        },
+        "required": ["question", "answer"]
+    }
+}
+
+def validate_flashcard(card):
+    """Return a clean {question, answer} dict, or None if the card is unusable"""
+    if not isinstance(card, dict):
+        return None
+    question = card.get("question")
+    answer = card.get("answer")
+    if not isinstance(question, str) or not isinstance(answer, str):
+        return None
+    question, answer = question.strip(), answer.strip()
+    if not question or not answer:
+        return None
+    return {"question": question, "answer": answer}
+
+def parse_flashcards_json(text):
+    """Valid flashcards from a JSON response, or None if it is not flashcard JSON
+
+    Accepts a bare array or an object with a "flashcards" array.
+    """
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        return None
+    if isinstance(data, dict):
+        data = data.get("flashcards", [data])
+    if not isinstance(data, list):
+        return None
+    cards = [card for card in map(validate_flashcard, data) if card]
+    return cards or None
+
+class FlashcardStreamParser:
+    """Pick complete flashcards out of a JSON response while it streams
+
+    Tracks string and brace state across chunks; whenever an object closes
+    it is parsed and validated, so each card can be sent the moment its
+    closing brace arrives instead of after the whole array.
+    """
+
+    def __init__(self):
+        self.cards = []
+        self.rejected = 0
+        self._text = ""
+        self._pos = 0
+        self._in_string = False
+        self._escape = False
+        self._objects = []  # Start offset of each open brace
+
+    def feed(self, chunk):
+        """Consume a chunk of the response; returns cards completed by it"""
+        self._text += chunk
+        completed = []
+        text = self._text
+        while self._pos < len(text):
+            char = text[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._objects.append(self._pos)
+            elif char == "}" and self._objects:
+                start = self._objects.pop()
+                data = self._parse(text[start:self._pos + 1])
+                card = validate_flashcard(data)
+                if card:
+                    completed.append(card)
+                elif isinstance(data, dict) and ("question" in data or "answer" in data):
+                    self.rejected += 1
+            self._pos += 1
+
+        # Nothing before the first open object is needed again
+        cut = self._objects[0] if self._objects else self._pos
+        if cut:
+            self._text = text[cut:]
+            self._pos -= cut
+            self._objects = [start - cut for start in self._objects]
+
+        self.cards.extend(completed)
+        return completed
+
+    @staticmethod
+    def _parse(text):
+        try:
+            return json.loads(text)
+        except ValueError:
+            return None
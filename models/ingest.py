@@ -1,171 +1,474 @@
 import os
+import json
+import queue
+import hashlib
+import threading
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 from dotenv import load_dotenv
 import glob
 from pathlib import Path
 
-# Import Pinecone with proper error handling
-try:
-    from pinecone.grpc import PineconeGRPC as Pinecone
-    from pinecone import ServerlessSpec
-except ImportError:
-    try:
-        from pinecone import Pinecone, ServerlessSpec
-    except ImportError:
-        print("Warning: Pinecone not available. Install with: pip install pinecone")
-        Pinecone = None
-        ServerlessSpec = None
-
-# Import sentence transformers with lazy loading
-SentenceTransformer = None
+from models.vector_store import create_vector_store
+from models.lexical_index import create_lexical_index
+from models.embeddings import EmbeddingService, get_embedding_service
 
 # Import langchain components with fallback
 try:
-    from langchain_community.document_loaders import DirectoryLoader, TextLoader, PyPDFLoader
+    from langchain_community.document_loaders import TextLoader, PyPDFLoader
     from langchain_text_splitters import RecursiveCharacterTextSplitter
 except ImportError:
     print("Warning: langchain_community not available. Install with: pip install langchain-community langchain-text-splitters")
-    DirectoryLoader = None
     TextLoader = None
     PyPDFLoader = None
     RecursiveCharacterTextSplitter = None
 
 load_dotenv()
 
+MANIFEST_FILE = "ingest_manifest.json"
+LOADERS = {".txt": "text", ".pdf": "pdf"}
+
+# Splitter settings for retrieval chunks (also the overlap used for LLM map steps)
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+# Chunks embedded and upserted together
+BATCH_SIZE = 100
+
+def file_hash(path):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_loader(path):
+    """Langchain loader for a TXT or PDF file"""
+    if LOADERS[Path(path).suffix.lower()] == "pdf":
+        return PyPDFLoader(path)
+    return TextLoader(path, autodetect_encoding=True)
+
+def load_file(path):
+    """Load a single TXT or PDF file into langchain documents"""
+    return file_loader(path).load()
+
+def iter_file_chunks(path, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """Chunk texts of a file, loading and splitting one page at a time"""
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    for document in file_loader(path).lazy_load():
+        yield from text_splitter.split_text(document.page_content)
+
+def split_file(path, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """All chunk texts of a file (run in worker processes)"""
+    return list(iter_file_chunks(path, chunk_size, chunk_overlap))
+
+# Embedding model of an embedding worker process
+_worker_embedder = None
+
+def _init_embedding_worker(model_name, backend, quantize, num_threads):
+    global _worker_embedder
+    _worker_embedder = EmbeddingService(model_name=model_name, backend=backend, quantize=quantize,
+                                        num_threads=num_threads)
+
+def _embed_in_worker(texts):
+    return _worker_embedder.encode(texts, batch_size=len(texts))
+
+def resolve_workers(workers):
+    """Worker process count; 0 means one per CPU core"""
+    return workers if workers > 0 else (os.cpu_count() or 1)
+
+_STAGE_DONE = object()
+
+def prefetch(items, maxsize):
+    """Iterate items on a background thread, running at most maxsize ahead
+    
+    One stage of the ingestion pipeline: the bounded queue is the
+    backpressure that stops a fast stage from buffering the whole corpus
+    in front of a slow one. Exceptions are re-raised in the consumer, and
+    a consumer that stops early also stops (and closes) the producer.
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    
+    def put(entry):
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+    
+    def produce():
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+            put((_STAGE_DONE, None))
+        except BaseException as e:
+            put((_STAGE_DONE, e))
+        finally:
+            close = getattr(items, "close", None)
+            if close:
+                close()
+    
+    threading.Thread(target=produce, name="ingest-stage", daemon=True).start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is _STAGE_DONE:
+                if error:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+def _future_chunks(future):
+    yield from future.result()
+
+def chunk_id(doc_id, text):
+    """Stable vector ID for a chunk, derived from its document and content"""
+    return f"{doc_id}_{hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]}"
+
 class DocumentIngestor:
-    def __init__(self):
-        global SentenceTransformer
-        
-        self.api_key = os.getenv("PINECONE_API_KEY")
-        self.index_name = "jarvis-index"
+    """Incremental ingestion of TXT and PDF files into the vector store
+    
+    Files stream through load/split, embed and upsert stages that run
+    concurrently with bounded queues between them (queue_size batches of
+    BATCH_SIZE chunks), so memory does not grow with the size of the
+    corpus and network upserts overlap with embedding. PDFs are read a page
+    at a time.
+    
+    With workers > 1, files are loaded and split in a pool of processes and
+    embedding batches are sharded across processes that each load the model
+    with an equal share of the CPU threads (only for the sentence-transformer
+    service; other embedders encode in-process). Chunks, vector IDs and the
+    upsert order are the same as with a single worker.
+    """
+    
+    def __init__(self, vector_store=None, embedding_service=None, lexical_index=None,
+                 chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, workers=1, queue_size=4):
         self.dimension = 384  # all-MiniLM-L6-v2 dimension
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.workers = resolve_workers(workers)
+        self.queue_size = queue_size
         
-        if not self.api_key:
-            raise ValueError("PINECONE_API_KEY not found in environment variables")
+        # Vector store backend (creates the Pinecone index if missing)
+        self.store = vector_store or create_vector_store(create_if_missing=True)
         
-        # Initialize Pinecone
-        self.pc = Pinecone(api_key=self.api_key)
+        # Shared embedding model (loaded on first use, reused by the retriever)
+        self.embedder = embedding_service or get_embedding_service()
         
-        # Initialize embedding model (lazy loading)
-        print("Loading embedding model...")
-        try:
-            if SentenceTransformer is None:
-                from sentence_transformers import SentenceTransformer as ST
-                SentenceTransformer = ST
-            self.embedder = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-        except Exception as e:
-            print(f"Warning: Could not load sentence transformers: {e}")
-            self.embedder = None
-        
-        # Create or get index
-        self._setup_index()
-    
-    def _setup_index(self):
-        """Create Pinecone index if it doesn't exist"""
-        existing_indexes = [index.name for index in self.pc.list_indexes()]
-        
-        if self.index_name not in existing_indexes:
-            print(f"Creating Pinecone index: {self.index_name}")
-            self.pc.create_index(
-                name=self.index_name,
-                dimension=self.dimension,
-                metric='cosine',
-                spec=ServerlessSpec(
-                    cloud='aws',
-                    region='us-east-1'
-                )
-            )
-            print(f"✓ Index '{self.index_name}' created successfully")
-        else:
-            print(f"✓ Using existing index: {self.index_name}")
+        # BM25 index kept in step with the vectors for hybrid retrieval
+        self.lexical = lexical_index or create_lexical_index(self.store)
+    
+    def _backfill_lexical(self):
+        """Build the BM25 index from stored chunks when it is missing
         
-        self.index = self.pc.Index(self.index_name)
+        Only the local store keeps chunk text locally; a remote index needs
+        one run with --force to fill it.
+        """
+        if self.lexical.exists():
+            return
+        if not hasattr(self.store, "metadata"):
+            if self.store.count():
+                print("Note: No BM25 index for this vector store yet; run with --force to build it")
+            return
+        documents = [
+            {"id": vector_id, "text": metadata["text"], "metadata": metadata}
+            for vector_id, metadata in zip(self.store.ids, self.store.metadata)
+            if metadata and "text" in metadata
+        ]
+        if documents:
+            print(f"Building BM25 index for {len(documents)} existing chunks...")
+            self.lexical.upsert(documents)
+            self.lexical.flush()
+    
+    def _manifest_path(self, data_dir):
+        return os.path.join(data_dir, MANIFEST_FILE)
     
-    def ingest_documents(self, data_dir="data"):
-        """Ingest documents from a directory"""
-        if DirectoryLoader is None or RecursiveCharacterTextSplitter is None:
-            print("Error: langchain components not available. Please install:")
-            print("pip install langchain-community langchain-text-splitters")
+    def _load_manifest(self, data_dir):
+        """Load the ingestion manifest for the current vector store"""
+        path = self._manifest_path(data_dir)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            # A manifest written for a different store says nothing about this one
+            if manifest.get("store") == self.store.identity:
+                return manifest["files"]
+        return {}
+    
+    def _save_manifest(self, data_dir, files):
+        """Atomically write the ingestion manifest"""
+        path = self._manifest_path(data_dir)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"store": self.store.identity, "files": files}, f, indent=2)
+        os.replace(tmp_path, path)
+    
+    def _discover_files(self, data_dir):
+        """Find all TXT and PDF files under data_dir, keyed by relative path"""
+        files = {}
+        for extension in LOADERS:
+            for path in glob.glob(os.path.join(data_dir, "**", f"*{extension}"), recursive=True):
+                files[Path(os.path.relpath(path, data_dir)).as_posix()] = path
+        return dict(sorted(files.items()))
+    
+    def _process_pool(self, tasks, **kwargs):
+        # Spawned rather than forked: the parent may hold torch threads and locks
+        return ProcessPoolExecutor(max_workers=min(self.workers, tasks),
+                                   mp_context=multiprocessing.get_context("spawn"), **kwargs)
+    
+    def _parse_files(self, paths):
+        """An iterable of chunk texts for each file, in order
+        
+        Iterating one raises whatever loading that file raised.
+        """
+        if self.workers > 1 and len(paths) > 1:
+            with self._process_pool(len(paths)) as pool:
+                # Each worker parses at most one file ahead of the consumer
+                remaining = iter(paths)
+                pending = deque(
+                    pool.submit(split_file, path, self.chunk_size, self.chunk_overlap)
+                    for path in itertools.islice(remaining, self.workers)
+                )
+                while pending:
+                    future = pending.popleft()
+                    path = next(remaining, None)
+                    if path is not None:
+                        pending.append(pool.submit(split_file, path, self.chunk_size, self.chunk_overlap))
+                    yield _future_chunks(future)
             return
+        
+        for path in paths:
+            yield iter_file_chunks(path, self.chunk_size, self.chunk_overlap)
+    
+    def _chunk_batches(self, to_ingest, manifest, new_manifest, stale_ids, stats):
+        """Batches of (vector_id, source, text) for the files to ingest, in order
+        
+        A file is recorded in new_manifest, and its dropped chunks in
+        stale_ids, once all of its chunks have been produced; chunks of a
+        file that fails part-way are marked stale instead.
+        """
+        batch = []
+        parsed = self._parse_files([path for _, path, _, _ in to_ingest])
+        for (rel_path, path, stat, content_hash), texts in zip(to_ingest, parsed):
+            doc_id = hashlib.sha256(f"{rel_path}:{content_hash}".encode('utf-8')).hexdigest()[:16]
+            chunk_ids = []
+            seen = set()
+            try:
+                for text in texts:
+                    vector_id = chunk_id(doc_id, text)
+                    if vector_id in seen:
+                        continue  # Identical text in the same file embeds identically
+                    seen.add(vector_id)
+                    chunk_ids.append(vector_id)
+                    batch.append((vector_id, rel_path, text))
+                    stats["chunks_total"] += 1
+                    if len(batch) >= BATCH_SIZE:
+                        yield batch
+                        batch = []
+            except Exception as e:
+                print(f"Note: Could not load {rel_path}: {e}")
+                stats["files_processed"] += 1
+                # The previous version stays recorded (and searchable) until a run succeeds
+                old_entry = manifest.get(rel_path)
+                kept_ids = set(old_entry["chunk_ids"]) if old_entry else set()
+                if old_entry:
+                    new_manifest[rel_path] = old_entry
+                stale_ids.extend(i for i in chunk_ids if i not in kept_ids)
+                continue
             
+            old_entry = manifest.get(rel_path)
+            if old_entry:
+                stale_ids.extend(i for i in old_entry["chunk_ids"] if i not in seen)
+                stats["files_updated"] += 1
+            else:
+                stats["files_added"] += 1
+            
+            new_manifest[rel_path] = {
+                "size": stat.st_size,
+                "mtime": stat.st_mtime_ns,
+                "hash": content_hash,
+                "chunk_ids": chunk_ids
+            }
+            stats["files_processed"] += 1
+        
+        if batch:
+            yield batch
+    
+    def _embed_batches(self, batches):
+        """(batch, embeddings) for each chunk batch, in order"""
+        if self.workers > 1 and isinstance(self.embedder, EmbeddingService):
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            config = (self.embedder.model_name, self.embedder.backend, self.embedder.quantize, threads)
+            with self._process_pool(self.workers, initializer=_init_embedding_worker, initargs=config) as pool:
+                # Two batches per worker in flight keeps every worker busy
+                pending = deque()
+                for batch in batches:
+                    pending.append((batch, pool.submit(_embed_in_worker, [text for _, _, text in batch])))
+                    if len(pending) >= 2 * self.workers:
+                        batch, future = pending.popleft()
+                        yield batch, future.result()
+                while pending:
+                    batch, future = pending.popleft()
+                    yield batch, future.result()
+            return
+        
+        for batch in batches:
+            texts = [text for _, _, text in batch]
+            yield batch, self.embedder.encode(texts, batch_size=len(texts))
+    
+    def ingest_documents(self, data_dir="data", force=False, paths=None, progress=None):
+        """Ingest new and changed documents from a directory
+        
+        Files whose size and mtime match the manifest are skipped without
+        reading them; otherwise the content hash decides. Vectors belonging
+        to changed or removed files are deleted from the store.
+        
+        If paths is given, only those files are considered. progress, if
+        given, is called with the running counters as work proceeds.
+        """
+        stats = {
+            "files_added": 0,
+            "files_updated": 0,
+            "files_removed": 0,
+            "files_unchanged": 0,
+            "files_to_ingest": 0,
+            "files_processed": 0,
+            "chunks_total": 0,
+            "chunks_embedded": 0,
+            "chunks_deleted": 0
+        }
+        
+        def report():
+            if progress:
+                progress(dict(stats))
+        
+        if TextLoader is None or RecursiveCharacterTextSplitter is None:
+            raise ImportError("langchain components not available. Install with: "
+                              "pip install langchain-community langchain-text-splitters")
+        
         if not os.path.exists(data_dir):
             print(f"Creating data directory: {data_dir}")
             os.makedirs(data_dir)
             print("Please add PDF or TXT files to the data/ directory and run again")
-            return
+            return stats
         
-        # Load documents (both TXT and PDF)
-        print(f"Loading documents from {data_dir}...")
-        documents = []
+        self._backfill_lexical()
         
-        # Load TXT files
-        try:
-            txt_loader = DirectoryLoader(
-                data_dir,
-                glob="**/*.txt",
-                loader_cls=TextLoader,
-                show_progress=True
-            )
-            txt_docs = txt_loader.load()
-            documents.extend(txt_docs)
-            print(f"Loaded {len(txt_docs)} TXT files")
-        except Exception as e:
-            print(f"Note: Could not load TXT files: {e}")
-        
-        # Load PDF files
-        try:
-            pdf_loader = DirectoryLoader(
-                data_dir,
-                glob="**/*.pdf",
-                loader_cls=PyPDFLoader,
-                show_progress=True
-            )
-            pdf_docs = pdf_loader.load()
-            documents.extend(pdf_docs)
-            print(f"Loaded {len(pdf_docs)} PDF files")
-        except Exception as e:
-            print(f"Note: Could not load PDF files: {e}")
-        
-        if not documents:
-            print("No documents found. Add PDF or TXT files to the data/ directory")
-            return
-        
-        print(f"Loaded {len(documents)} documents")
+        # Work out what changed since the last run
+        print(f"Scanning documents in {data_dir}...")
+        manifest = self._load_manifest(data_dir)
+        files = self._discover_files(data_dir)
         
-        # Split documents
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
-        )
-        chunks = text_splitter.split_documents(documents)
-        print(f"Split into {len(chunks)} chunks")
+        new_manifest = {}
+        wanted = None
+        if paths is not None:
+            # Restrict to the given files and leave every other entry untouched
+            wanted = {
+                Path(os.path.relpath(os.path.abspath(path), os.path.abspath(data_dir))).as_posix()
+                for path in paths
+            }
+            files = {rel_path: path for rel_path, path in files.items() if rel_path in wanted}
+            new_manifest = {rel_path: entry for rel_path, entry in manifest.items() if rel_path not in wanted}
         
-        # Generate embeddings and upsert to Pinecone
-        print("Generating embeddings and uploading to Pinecone...")
-        batch_size = 100
-        
-        for i in tqdm(range(0, len(chunks), batch_size)):
-            batch = chunks[i:i + batch_size]
+        to_ingest = []
+        for rel_path, path in files.items():
+            stat = os.stat(path)
+            entry = manifest.get(rel_path)
+            
+            if force:
+                to_ingest.append((rel_path, path, stat, file_hash(path)))
+                continue
             
-            # Generate embeddings
-            texts = [doc.page_content for doc in batch]
-            embeddings = self.embedder.encode(texts).tolist()
+            # Fast pre-check: size and mtime unchanged means content unchanged
+            if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+                new_manifest[rel_path] = entry
+                stats["files_unchanged"] += 1
+                continue
             
-            # Prepare vectors for upsert
-            vectors = []
-            for j, (text, embedding) in enumerate(zip(texts, embeddings)):
-                vector_id = f"doc_{i+j}"
-                vectors.append({
-                    "id": vector_id,
-                    "values": embedding,
-                    "metadata": {"text": text}
-                })
+            content_hash = file_hash(path)
+            if entry and entry["hash"] == content_hash:
+                new_manifest[rel_path] = dict(entry, size=stat.st_size, mtime=stat.st_mtime_ns)
+                stats["files_unchanged"] += 1
+                continue
             
-            # Upsert to Pinecone
-            self.index.upsert(vectors=vectors)
+            to_ingest.append((rel_path, path, stat, content_hash))
         
-        print(f"✓ Successfully ingested {len(chunks)} chunks to Pinecone!")
+        # Vectors of removed files are purged
+        stale_ids = []
+        for rel_path, entry in manifest.items():
+            if rel_path not in files and (wanted is None or rel_path in wanted):
+                stale_ids.extend(entry["chunk_ids"])
+                stats["files_removed"] += 1
+        
+        stats["files_to_ingest"] = len(to_ingest)
+        report()
+        
+        # Stream new or changed files through load/split -> embed -> upsert,
+        # each stage on its own thread with bounded queues in between
+        if to_ingest:
+            print(f"Loading, embedding and uploading {len(to_ingest)} files...")
+            batches = prefetch(self._chunk_batches(to_ingest, manifest, new_manifest, stale_ids, stats),
+                               self.queue_size)
+            for batch, embeddings in tqdm(prefetch(self._embed_batches(batches), self.queue_size), unit="batch"):
+                embeddings = embeddings.tolist()
+                
+                # Prepare vectors for upsert
+                vectors = []
+                for (vector_id, source, text), embedding in zip(batch, embeddings):
+                    vectors.append({
+                        "id": vector_id,
+                        "values": embedding,
+                        "metadata": {"text": text, "source": source}
+                    })
+                
+                # Upsert to the vector store and the BM25 index
+                self.store.upsert(vectors)
+                self.lexical.upsert([
+                    {"id": vector["id"], "text": vector["metadata"]["text"], "metadata": vector["metadata"]}
+                    for vector in vectors
+                ])
+                stats["chunks_embedded"] += len(vectors)
+                report()
+        
+        print(f"{stats['files_added']} new, {stats['files_updated']} changed, "
+              f"{stats['files_removed']} removed, {stats['files_unchanged']} unchanged")
+        
+        # Old vectors are only removed once their replacements are in
+        if stale_ids:
+            print(f"Deleting {len(stale_ids)} stale vectors...")
+            self.store.delete(stale_ids)
+            self.lexical.delete(stale_ids)
+            stats["chunks_deleted"] = len(stale_ids)
+        
+        self.store.flush()
+        self.lexical.flush()
+        self._save_manifest(data_dir, new_manifest)
+        
+        report()
+        if stats["chunks_embedded"] or stale_ids:
+            print(f"✓ Successfully ingested {stats['chunks_embedded']} chunks to the vector store!")
+        else:
+            print("✓ Vector store is already up to date")
+        return stats
 
 if __name__ == "__main__":
-    ingestor = DocumentIngestor()
-    ingestor.ingest_documents()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Ingest documents into the vector store")
+    parser.add_argument("--data-dir", default="data", help="Directory containing PDF and TXT files")
+    parser.add_argument("--force", action="store_true", help="Re-embed every file, ignoring the manifest")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INGEST_WORKERS", "1")),
+                        help="Processes for parsing and embedding (0 = one per CPU core)")
+    args = parser.parse_args()
+    
+    ingestor = DocumentIngestor(workers=args.workers)
+    ingestor.ingest_documents(data_dir=args.data_dir, force=args.force)
@@ -0,0 +1,68 @@
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+class IngestionJobQueue:
+    """Run document ingestion jobs on a background worker thread
+    
+    Jobs are persisted in a JobsDatabase so their status and progress can be
+    polled, and unfinished jobs are resumed after a restart. Ingestion jobs
+    share one manifest and vector store, so they run one at a time on a
+    single worker; the ingestor (and its embedding model) is created once and
+    reused across jobs.
+    """
+    
+    def __init__(self, jobs_db, data_dir="data", ingestor_factory=None):
+        self.jobs_db = jobs_db
+        self.data_dir = data_dir
+        self.ingestor_factory = ingestor_factory
+        self._ingestor = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+        self._lock = threading.Lock()
+        
+        # Ingestion is idempotent, so interrupted jobs are simply run again
+        for job in self.jobs_db.get_unfinished_jobs():
+            self._executor.submit(self._run, job["id"], job["params"])
+    
+    def submit(self, paths=None, force=False):
+        """Queue an ingestion job and return its ID"""
+        params = {"paths": paths, "force": force}
+        job_id = self.jobs_db.create_job("ingest", params)
+        self._executor.submit(self._run, job_id, params)
+        return job_id
+    
+    def get_job(self, job_id):
+        """Get a job's status, progress and result"""
+        return self.jobs_db.get_job(job_id)
+    
+    def _get_ingestor(self):
+        """Create the ingestor on first use, on the worker thread"""
+        with self._lock:
+            if self._ingestor is None:
+                if self.ingestor_factory is None:
+                    from models.ingest import DocumentIngestor
+                    self.ingestor_factory = DocumentIngestor
+                self._ingestor = self.ingestor_factory()
+            return self._ingestor
+    
+    def _run(self, job_id, params):
+        """Execute one ingestion job and record the outcome"""
+        self.jobs_db.mark_running(job_id)
+        try:
+            ingestor = self._get_ingestor()
+            result = ingestor.ingest_documents(
+                data_dir=self.data_dir,
+                force=params.get("force", False),
+                paths=params.get("paths"),
+                progress=lambda counters: self.jobs_db.update_progress(job_id, counters)
+            )
+            self.jobs_db.update_progress(job_id, result)
+            self.jobs_db.mark_finished(job_id, result=result)
+        except Exception as e:
+            print(f"Error in ingestion job {job_id}: {e}")
+            traceback.print_exc()
+            self.jobs_db.mark_finished(job_id, error=str(e))
+    
+    def shutdown(self, wait=True):
+        """Stop accepting jobs and optionally wait for the current one"""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,181 @@
+import os
+import re
+import json
+import math
+import heapq
+import threading
+from collections import Counter
+
+from .vector_store import DEFAULT_LOCAL_INDEX_DIR
+
+LEXICAL_INDEX_FILE = "lexical.json"
+
+# Word characters only: formula names, acronyms ("LCM") and numbers stay whole
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def tokenize(text):
+    """Lowercased word tokens of a text"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+class LexicalIndex:
+    """BM25 inverted index over chunk text, persisted next to the vectors
+    
+    Dense embeddings match meaning but often miss exact terms such as
+    formula names, acronyms and chapter titles; BM25 ranks by those terms.
+    Each chunk is stored with its term counts, so loading the index only
+    rebuilds the postings lists and never re-tokenizes text. The file is
+    tied to a vector store identity and replaced atomically on flush;
+    readers pick up new versions the same way LocalVectorStore does.
+    """
+    
+    def __init__(self, path, store_identity, k1=1.5, b=0.75):
+        self.path = path
+        self.store_identity = store_identity
+        self.k1 = k1
+        self.b = b
+        
+        self.documents = {}  # id -> {"terms": {term: tf}, "length", "metadata"}
+        # (documents, postings, average length) swapped in whole for readers
+        self._snapshot = ({}, {}, 0.0)
+        self._version = 0
+        self._loaded_mtime = None
+        self._dirty = False
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._load()
+    
+    def _load(self):
+        """Load documents written for this vector store and rebuild the postings"""
+        if not os.path.exists(self.path):
+            return
+        
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        
+        # An index built for a different store says nothing about this one
+        documents = {}
+        if data.get("store") == self.store_identity:
+            documents = data["documents"]
+            self._version = data["version"]
+        self.documents = dict(documents)
+        self._snapshot = self._build(documents)
+        self._loaded_mtime = mtime
+    
+    @staticmethod
+    def _build(documents):
+        """Postings lists (term -> [(id, tf)]) and average length for a set of chunks"""
+        postings = {}
+        total_length = 0
+        for doc_id, document in documents.items():
+            total_length += document["length"]
+            for term, tf in document["terms"].items():
+                postings.setdefault(term, []).append((doc_id, tf))
+        return documents, postings, (total_length / len(documents) if documents else 0.0)
+    
+    def _changed(self):
+        return os.path.exists(self.path) and os.stat(self.path).st_mtime_ns != self._loaded_mtime
+    
+    def _reload_if_changed(self):
+        """Pick up writes made by another instance (e.g. an ingestor)"""
+        if not self._dirty and self._changed():
+            with self._lock:
+                # Writes take the lock too, so none can start before the reload
+                if not self._dirty and self._changed():
+                    self._load()
+    
+    def exists(self):
+        """Whether an index for this store has been written"""
+        self._reload_if_changed()
+        return self._loaded_mtime is not None and bool(self._version)
+    
+    def upsert(self, documents):
+        """Insert or replace chunks given as {"id", "text", "metadata"} dicts"""
+        entries = {}
+        for document in documents:
+            tokens = tokenize(document["text"])
+            entries[document["id"]] = {
+                "terms": dict(Counter(tokens)),
+                "length": len(tokens),
+                "metadata": document.get("metadata", {})
+            }
+        if entries:
+            with self._lock:
+                # A batch starts from the latest file another instance wrote
+                if not self._dirty and self._changed():
+                    self._load()
+                self.documents.update(entries)
+                self._dirty = True
+    
+    def delete(self, ids):
+        """Remove chunks by ID"""
+        with self._lock:
+            if not self._dirty and self._changed():
+                self._load()
+            for doc_id in ids:
+                if self.documents.pop(doc_id, None) is not None:
+                    self._dirty = True
+    
+    def flush(self):
+        """Persist pending writes and rebuild the postings"""
+        with self._lock:
+            if not self._dirty:
+                return
+            
+            version = self._version + 1
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    "store": self.store_identity,
+                    "version": version,
+                    "documents": self.documents
+                }, f)
+            os.replace(tmp_path, self.path)
+            
+            self._version = version
+            self._dirty = False
+            self._load()
+    
+    def query(self, text, top_k=10):
+        """Return the top_k BM25 matches as {"id", "score", "metadata"} dicts"""
+        self._reload_if_changed()
+        documents, postings, avg_length = self._snapshot
+        if not documents or top_k <= 0:
+            return []
+        
+        count = len(documents)
+        scores = {}
+        for term in set(tokenize(text)):
+            matches = postings.get(term)
+            if not matches:
+                continue
+            idf = math.log(1 + (count - len(matches) + 0.5) / (len(matches) + 0.5))
+            for doc_id, tf in matches:
+                norm = self.k1 * (1 - self.b + self.b * documents[doc_id]["length"] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        
+        top = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [
+            {"id": doc_id, "score": score, "metadata": documents[doc_id]["metadata"]}
+            for doc_id, score in top
+        ]
+    
+    def count(self):
+        """Number of chunks in the index"""
+        self._reload_if_changed()
+        return len(self._snapshot[0])
+    
+    def version(self):
+        """Token that changes whenever the persisted index changes"""
+        self._reload_if_changed()
+        return self._version
+
+def create_lexical_index(store):
+    """Lexical index for a vector store: in the local index directory, or
+    LEXICAL_INDEX_DIR for remote backends"""
+    index_dir = getattr(store, "index_dir", None) or os.getenv(
+        "LEXICAL_INDEX_DIR", os.getenv("VECTOR_INDEX_DIR", DEFAULT_LOCAL_INDEX_DIR))
+    return LexicalIndex(os.path.join(index_dir, LEXICAL_INDEX_FILE), store.identity)
@@ -1,24 +1,204 @@
-import requests
+import os
 import json
+import asyncio
+import hashlib
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+class LLMError(Exception):
+    """A completion that failed: Ollama unreachable, an error status or an error reply"""
+
+class _Flight:
+    """One upstream generation shared by identical concurrent requests
+    
+    Tokens are published as they arrive and the final text once generation
+    ends. Threads wait on a condition; event loop subscribers register a
+    listener that wakes them through call_soon_threadsafe.
+    """
+    
+    def __init__(self, key):
+        self.key = key
+        self.tokens = []
+        self.result = None
+        self.error = None  # LLMError when the generation failed
+        self.done = False
+        self.subscribers = 0
+        self.task = None  # Producer task for async streams (keeps a reference)
+        self._cond = threading.Condition()
+        self._listeners = set()
+    
+    def join(self):
+        with self._cond:
+            self.subscribers += 1
+    
+    def leave(self):
+        with self._cond:
+            self.subscribers -= 1
+    
+    def _notify(self):
+        self._cond.notify_all()
+        for listener in list(self._listeners):
+            listener()
+    
+    def publish(self, token):
+        with self._cond:
+            self.tokens.append(token)
+            self._notify()
+    
+    def finish(self, result, error=None):
+        with self._cond:
+            self.result = result
+            self.error = error
+            self.done = True
+            self._notify()
+    
+    def wait(self, position):
+        """Block until there are tokens past position or the flight is done"""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self.tokens) > position or self.done)
+            return self.tokens[position:], self.done
+    
+    async def wait_async(self, position):
+        """Async counterpart of wait"""
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        listener = lambda: loop.call_soon_threadsafe(event.set)
+        with self._cond:
+            self._listeners.add(listener)
+        try:
+            while True:
+                with self._cond:
+                    if len(self.tokens) > position or self.done:
+                        return self.tokens[position:], self.done
+                    event.clear()
+                await event.wait()
+        finally:
+            with self._cond:
+                self._listeners.discard(listener)
+    
+    def wait_result(self):
+        """Block until the flight is done and return the full text (raises its LLMError)"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.done)
+        if self.error:
+            raise self.error
+        return self.result
+    
+    async def wait_result_async(self):
+        """Async counterpart of wait_result"""
+        position = 0
+        while True:
+            tokens, done = await self.wait_async(position)
+            position += len(tokens)
+            if done:
+                if self.error:
+                    raise self.error
+                return self.result
 
 class LLMClient:
-    def __init__(self, base_url="http://localhost:11434"):
+    def __init__(self, base_url="http://localhost:11434", pool_size=None,
+                 max_retries=None, backoff_factor=None, timeout=None, connect_timeout=None, cache=None):
         self.base_url = base_url
         self.model = "llama3.2:latest"
         
-        # Check if Ollama is running
+        # Optional CompletionCache for repeated prompts
+        self.cache = cache
+        
+        # Connection settings (environment variables override the defaults)
+        self.pool_size = pool_size or int(os.getenv("OLLAMA_POOL_SIZE", "10"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("OLLAMA_MAX_RETRIES", "3"))
+        self.backoff_factor = backoff_factor if backoff_factor is not None else float(os.getenv("OLLAMA_BACKOFF_FACTOR", "0.5"))
+        self.timeout = timeout or float(os.getenv("OLLAMA_TIMEOUT", "60"))
+        self.connect_timeout = connect_timeout or float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+        
+        # Keep-alive connection pool shared by all requests from this client
+        self.session = self._create_session()
+        
+        # httpx client for the async methods, created on first use in the event loop
+        self._async_client = None
+        self._async_loop = None
+        
+        # Identical requests in flight at the same time share one generation
+        self.coalesce = os.getenv("LLM_COALESCE", "1") != "0"
+        self.coalesced = 0
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        
+        # Ollama health is probed on first use instead of at import time
+        self._checked = False
+        self._check_lock = threading.Lock()
+    
+    def _create_session(self):
+        """Create a pooled HTTP session with retries and backoff"""
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=0,  # Never replay a generation that was already sent
+            status=self.max_retries,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET", "POST"]),
+            backoff_factor=self.backoff_factor,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=retry
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+    
+    def _get_async_client(self):
+        """Pooled httpx client bound to the running event loop"""
+        import httpx
+        
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                transport=httpx.AsyncHTTPTransport(retries=self.max_retries)  # Connection errors only
+            )
+            self._async_loop = loop
+        return self._async_client
+    
+    def _async_timeout(self, timeout=None):
+        import httpx
+        return httpx.Timeout(timeout or self.timeout, connect=self.connect_timeout)
+    
+    def _timeout(self, timeout=None):
+        """Build a (connect, read) timeout tuple for a request"""
+        return (self.connect_timeout, timeout or self.timeout)
+    
+    def check_connection(self):
+        """Check if Ollama is running"""
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
+            response = self.session.get(f"{self.base_url}/api/tags", timeout=self._timeout(5))
             if response.status_code == 200:
                 print(f"✓ Connected to Ollama at {self.base_url}")
-            else:
-                print(f"⚠ Ollama responded with status {response.status_code}")
+                return True
+            print(f"⚠ Ollama responded with status {response.status_code}")
         except Exception as e:
             print(f"⚠ Could not connect to Ollama: {e}")
             print("Make sure Ollama is running with: ollama serve")
+        return False
+    
+    def _ensure_checked(self):
+        """Run the health probe once, on the first request"""
+        if self._checked:
+            return
+        with self._check_lock:
+            if not self._checked:
+                self._checked = True
+                self.check_connection()
     
-    def get_completion_sync(self, prompt, history=None, system_prompt=None):
-        """Get a completion from the LLM synchronously"""
+    def _build_messages(self, prompt, history=None, system_prompt=None):
+        """Build the Ollama messages array for a prompt"""
         if system_prompt is None:
             # Default system prompt if none provided
             system_prompt = "You are Nexus, a helpful AI assistant. Provide clear, concise, and accurate responses."
@@ -34,26 +214,379 @@ class LLMClient:
         # Add current user message
         messages.append({"role": "user", "content": prompt})
         
+        return messages
+    
+    def _build_payload(self, messages, stream, format=None):
+        """Build the /api/chat request body"""
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": stream,
+            "options": {
+                "num_predict": 2000,  # Allow longer responses
+                "temperature": 0.7
+            }
+        }
+        # Structured output: "json" or a JSON schema the response must match
+        if format is not None:
+            payload["format"] = format
+        return payload
+    
+    def _cached(self, payload, use_cache):
+        """Look up a cached response for a request body"""
+        if not (self.cache and use_cache):
+            return None
+        try:
+            return self.cache.get(payload)
+        except Exception as e:
+            print(f"⚠ Completion cache lookup failed: {e}")
+            return None
+    
+    def _store(self, payload, response, use_cache):
+        """Cache a successful response for a request body"""
+        if not (self.cache and use_cache):
+            return
         try:
-            response = requests.post(
+            self.cache.set(payload, response)
+        except Exception as e:
+            print(f"⚠ Completion cache write failed: {e}")
+    
+    # ----- Request coalescing -----
+    
+    def _flight_key(self, payload):
+        """Identical requests (model, options, messages) share a key, streamed or not"""
+        request = {k: v for k, v in payload.items() if k != "stream"}
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode("utf-8")).hexdigest()
+    
+    def _join_flight(self, payload, use_cache):
+        """Return (flight, leader) for a request, or (None, True) if it is not shared
+        
+        The caller is counted as a subscriber and must call flight.leave().
+        """
+        # A request that skips the cache wants a fresh generation of its own
+        if not (self.coalesce and use_cache):
+            return None, True
+        key = self._flight_key(payload)
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight(key)
+            flight.join()
+        if not leader:
+            self.coalesced += 1
+        return flight, leader
+    
+    def _land(self, flight, result, error=None):
+        """Publish the final result and let new requests start a fresh generation"""
+        with self._flights_lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        flight.finish(result, error)
+    
+    def is_generating(self, prompt, history=None, system_prompt=None, use_cache=True, format=None):
+        """True if an identical request is already being generated and would be joined"""
+        if not (self.coalesce and use_cache):
+            return False
+        payload = self._build_payload(self._build_messages(prompt, history, system_prompt), stream=False, format=format)
+        with self._flights_lock:
+            return self._flight_key(payload) in self._flights
+    
+    # ----- Upstream requests -----
+    
+    def _request_completion(self, payload, timeout, use_cache):
+        """POST a non-streaming request to Ollama; returns the content or raises LLMError"""
+        self._ensure_checked()
+        try:
+            response = self.session.post(
                 f"{self.base_url}/api/chat",
-                json={
-                    "model": self.model,
-                    "messages": messages,
-                    "stream": False,
-                    "options": {
-                        "num_predict": 2000,  # Allow longer responses
-                        "temperature": 0.7
-                    }
-                },
-                timeout=60
+                json=payload,
+                timeout=self._timeout(timeout)
             )
             
-            if response.status_code == 200:
-                result = response.json()
-                return result["message"]["content"]
+            if response.status_code != 200:
+                raise LLMError(f"Ollama returned status {response.status_code}")
+            content = response.json()["message"]["content"]
+                
+        except LLMError:
+            raise
+        except Exception as e:
+            raise LLMError(f"Error communicating with Ollama: {str(e)}") from e
+        
+        self._store(payload, content, use_cache)
+        return content
+    
+    def _request_stream(self, payload, timeout, use_cache):
+        """Yield tokens from a streaming request to Ollama
+        
+        Raises LLMError when the request fails or the stream ends before
+        Ollama reports it done, so a cut-off answer is never taken as whole.
+        """
+        self._ensure_checked()
+        tokens = []
+        try:
+            # Read timeout applies between chunks, not to the whole generation
+            with self.session.post(
+                f"{self.base_url}/api/chat",
+                json=payload,
+                stream=True,
+                timeout=self._timeout(timeout)
+            ) as response:
+                if response.status_code != 200:
+                    raise LLMError(f"Ollama returned status {response.status_code}")
+                
+                # Ollama streams one JSON object per line
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise LLMError(f"Error from Ollama: {chunk['error']}")
+                    token = chunk.get("message", {}).get("content", "")
+                    if token:
+                        tokens.append(token)
+                        yield token
+                    if chunk.get("done"):
+                        self._store(payload, "".join(tokens), use_cache)
+                        return
+                        
+        except LLMError:
+            raise
+        except Exception as e:
+            raise LLMError(f"Error communicating with Ollama: {str(e)}") from e
+        raise LLMError("Ollama ended the stream before the answer was done")
+    
+    def _produce_stream(self, flight, payload, timeout, use_cache):
+        """Feed a shared flight from a streaming request (runs in its own thread)"""
+        error = LLMError("Error communicating with Ollama: request interrupted")
+        try:
+            for token in self._request_stream(payload, timeout, use_cache):
+                flight.publish(token)
+                # Stop generating once every subscriber has disconnected
+                if not flight.subscribers:
+                    break
             else:
-                return f"Error: Ollama returned status {response.status_code}"
+                error = None
+        except LLMError as e:
+            error = e
+        finally:
+            self._land(flight, "".join(flight.tokens), error)
+    
+    # ----- Completions -----
+    
+    def get_completion_sync(self, prompt, history=None, system_prompt=None, timeout=None, use_cache=True,
+                             format=None):
+        """Get a completion from the LLM synchronously; raises LLMError if it fails"""
+        messages = self._build_messages(prompt, history, system_prompt)
+        payload = self._build_payload(messages, stream=False, format=format)
+        
+        cached = self._cached(payload, use_cache)
+        if cached is not None:
+            return cached
+        
+        flight, leader = self._join_flight(payload, use_cache)
+        if flight is None:
+            return self._request_completion(payload, timeout, use_cache)
+        try:
+            if not leader:
+                return flight.wait_result()
+            result = None
+            error = LLMError("Error communicating with Ollama: request interrupted")
+            try:
+                result = self._request_completion(payload, timeout, use_cache)
+                error = None
+            except LLMError as e:
+                error = e
+                raise
+            finally:
+                self._land(flight, result, error)
+            return result
+        finally:
+            flight.leave()
+    
+    def stream_completion(self, prompt, history=None, system_prompt=None, timeout=None, use_cache=True,
+                           format=None):
+        """Yield completion tokens from the LLM as Ollama generates them
+        
+        Identical concurrent requests share one generation: the first starts
+        it in a background thread and every subscriber, including the first,
+        reads the same tokens, so a subscriber disconnecting early does not
+        cut the stream short for the others. Raises LLMError after the last
+        token if the generation failed or was cut off.
+        """
+        messages = self._build_messages(prompt, history, system_prompt)
+        payload = self._build_payload(messages, stream=True, format=format)
+        
+        # A cached answer is sent as a single chunk
+        cached = self._cached(payload, use_cache)
+        if cached is not None:
+            yield cached
+            return
+        
+        flight, leader = self._join_flight(payload, use_cache)
+        if flight is None:
+            yield from self._request_stream(payload, timeout, use_cache)
+            return
+        try:
+            if leader:
+                threading.Thread(target=self._produce_stream, args=(flight, payload, timeout, use_cache),
+                                 name="llm-stream", daemon=True).start()
+            position = 0
+            while True:
+                tokens, done = flight.wait(position)
+                for token in tokens:
+                    yield token
+                position += len(tokens)
+                if done:
+                    break
+            if flight.error:
+                raise flight.error
+            # Joined a non-streaming generation: send its answer as one chunk
+            if position == 0 and flight.result:
+                yield flight.result
+        finally:
+            flight.leave()
+    
+    async def _post_async(self, payload, timeout=None):
+        """POST to /api/chat, retrying 502/503/504 with backoff like the sync session"""
+        client = self._get_async_client()
+        for attempt in range(self.max_retries + 1):
+            request = client.build_request("POST", "/api/chat", json=payload, timeout=self._async_timeout(timeout))
+            response = await client.send(request, stream=True)
+            if response.status_code not in (502, 503, 504) or attempt == self.max_retries:
+                return response
+            await response.aclose()
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+    
+    async def _request_completion_async(self, payload, timeout, use_cache):
+        """Async counterpart of _request_completion"""
+        await asyncio.to_thread(self._ensure_checked)
+        try:
+            response = await self._post_async(payload, timeout)
+            try:
+                if response.status_code != 200:
+                    raise LLMError(f"Ollama returned status {response.status_code}")
+                result = json.loads(await response.aread())
+            finally:
+                await response.aclose()
+            
+            content = result["message"]["content"]
+                
+        except LLMError:
+            raise
+        except Exception as e:
+            raise LLMError(f"Error communicating with Ollama: {str(e)}") from e
+        
+        await asyncio.to_thread(self._store, payload, content, use_cache)
+        return content
+    
+    async def _request_stream_async(self, payload, timeout, use_cache):
+        """Async counterpart of _request_stream"""
+        await asyncio.to_thread(self._ensure_checked)
+        tokens = []
+        try:
+            response = await self._post_async(payload, timeout)
+            try:
+                if response.status_code != 200:
+                    raise LLMError(f"Ollama returned status {response.status_code}")
+                
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise LLMError(f"Error from Ollama: {chunk['error']}")
+                    token = chunk.get("message", {}).get("content", "")
+                    if token:
+                        tokens.append(token)
+                        yield token
+                    if chunk.get("done"):
+                        await asyncio.to_thread(self._store, payload, "".join(tokens), use_cache)
+                        return
+            finally:
+                await response.aclose()
                 
+        except LLMError:
+            raise
         except Exception as e:
-            return f"Error communicating with Ollama: {str(e)}"
+            raise LLMError(f"Error communicating with Ollama: {str(e)}") from e
+        raise LLMError("Ollama ended the stream before the answer was done")
+    
+    async def _produce_stream_async(self, flight, payload, timeout, use_cache):
+        """Feed a shared flight from a streaming request (runs as its own task)"""
+        error = LLMError("Error communicating with Ollama: request interrupted")
+        try:
+            async for token in self._request_stream_async(payload, timeout, use_cache):
+                flight.publish(token)
+                if not flight.subscribers:
+                    break
+            else:
+                error = None
+        except LLMError as e:
+            error = e
+        finally:
+            self._land(flight, "".join(flight.tokens), error)
+    
+    async def get_completion_async(self, prompt, history=None, system_prompt=None, timeout=None, use_cache=True,
+                                    format=None):
+        """Get a completion from the LLM without blocking the event loop; raises LLMError if it fails"""
+        messages = self._build_messages(prompt, history, system_prompt)
+        payload = self._build_payload(messages, stream=False, format=format)
+        
+        cached = await asyncio.to_thread(self._cached, payload, use_cache)
+        if cached is not None:
+            return cached
+        
+        flight, leader = self._join_flight(payload, use_cache)
+        if flight is None:
+            return await self._request_completion_async(payload, timeout, use_cache)
+        try:
+            if not leader:
+                return await flight.wait_result_async()
+            result = None
+            error = LLMError("Error communicating with Ollama: request interrupted")
+            try:
+                result = await self._request_completion_async(payload, timeout, use_cache)
+                error = None
+            except LLMError as e:
+                error = e
+                raise
+            finally:
+                self._land(flight, result, error)
+            return result
+        finally:
+            flight.leave()
+    
+    async def stream_completion_async(self, prompt, history=None, system_prompt=None, timeout=None, use_cache=True,
+                                       format=None):
+        """Async generator of completion tokens (see stream_completion)"""
+        messages = self._build_messages(prompt, history, system_prompt)
+        payload = self._build_payload(messages, stream=True, format=format)
+        
+        cached = await asyncio.to_thread(self._cached, payload, use_cache)
+        if cached is not None:
+            yield cached
+            return
+        
+        flight, leader = self._join_flight(payload, use_cache)
+        if flight is None:
+            async for token in self._request_stream_async(payload, timeout, use_cache):
+                yield token
+            return
+        try:
+            if leader:
+                flight.task = asyncio.create_task(self._produce_stream_async(flight, payload, timeout, use_cache))
+            position = 0
+            while True:
+                tokens, done = await flight.wait_async(position)
+                for token in tokens:
+                    yield token
+                position += len(tokens)
+                if done:
+                    break
+            if flight.error:
+                raise flight.error
+            if position == 0 and flight.result:
+                yield flight.result
+        finally:
+            flight.leave()
@@ -0,0 +1,128 @@
+"""
+Chunked LLM Pipelines
+Map-reduce helpers for running LLM tasks over texts too long for one prompt
+"""
+
+import os
+import re
+from itertools import zip_longest
+from concurrent.futures import ThreadPoolExecutor
+
+from models.ingest import RecursiveCharacterTextSplitter, CHUNK_OVERLAP, load_file
+from models.llm_client import LLMError
+
+# Source text per map step; ~1000 tokens keeps prompt evaluation fast
+MAP_CHUNK_CHARS = int(os.getenv("LLM_MAP_CHUNK_CHARS", "4000"))
+
+def split_text(text, chunk_size=None):
+    """Split text into map chunks with the ingestion splitter's overlap"""
+    chunk_size = chunk_size or MAP_CHUNK_CHARS
+    if len(text) <= chunk_size:
+        return [text]
+    if RecursiveCharacterTextSplitter is not None:
+        splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=CHUNK_OVERLAP)
+        return splitter.split_text(text)
+    # Plain character windows when langchain is not installed
+    step = chunk_size - CHUNK_OVERLAP
+    return [text[i:i + chunk_size] for i in range(0, len(text) - CHUNK_OVERLAP, step)]
+
+def document_text(path):
+    """Full text of an uploaded TXT or PDF file"""
+    return "\n\n".join(document.page_content for document in load_file(path))
+
+def map_parallel(fn, items, max_workers):
+    """Apply fn to every item on a thread pool, keeping order"""
+    if len(items) == 1:
+        return [fn(items[0])]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix="llm-map") as pool:
+        return list(pool.map(fn, items))
+
+def map_completions(fn, items, max_workers):
+    """map_parallel for LLM calls, leaving out the ones that failed
+
+    Returns the results of the calls that succeeded, in order; if every
+    call failed, raises the first one's LLMError.
+    """
+    def attempt(item):
+        try:
+            return fn(item), None
+        except LLMError as e:
+            return None, e
+
+    outcomes = map_parallel(attempt, items, max_workers)
+    results = [result for result, error in outcomes if error is None]
+    if not results:
+        raise outcomes[0][1]
+    return results
+
+def _pack(texts, max_chars):
+    """Group consecutive texts so each group fits max_chars (at least two per group)"""
+    groups = [[]]
+    size = 0
+    for text in texts:
+        if len(groups[-1]) >= 2 and size + len(text) > max_chars:
+            groups.append([])
+            size = 0
+        groups[-1].append(text)
+        size += len(text)
+    # A lone trailing text joins the previous group instead of waiting a round
+    if len(groups) > 1 and len(groups[-1]) == 1:
+        groups[-2].extend(groups.pop())
+    return groups
+
+def reduce_texts(texts, combine, max_workers, max_chars=None):
+    """Combine texts into one with combine(list_of_texts), in parallel rounds
+
+    Each round combines groups that fit in one prompt, so any number of
+    partial results reduces in a logarithmic number of rounds.
+    """
+    max_chars = max_chars or MAP_CHUNK_CHARS
+    while len(texts) > 1:
+        texts = map_completions(combine, _pack(texts, max_chars), max_workers)
+    return texts[0]
+
+def allocate(total, weights):
+    """Split a total across weighted parts; the counts add up to total
+
+    With fewer items than parts, evenly spaced parts get one each and the
+    rest none, so the work follows the number of items asked for rather
+    than the length of the text. Otherwise every part gets one and the
+    remainder is shared by weight.
+    """
+    parts = len(weights)
+    if total < parts:
+        picked = {(2 * i + 1) * parts // (2 * total) for i in range(total)}
+        return [1 if i in picked else 0 for i in range(parts)]
+
+    weight_sum = sum(weights) or 1
+    shares = [(total - parts) * weight / weight_sum for weight in weights]
+    counts = [1 + int(share) for share in shares]
+    # Largest remainders take what rounding down left over
+    by_remainder = sorted(range(parts), key=lambda i: shares[i] - int(shares[i]), reverse=True)
+    for i in by_remainder[:total - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+def _card_key(card):
+    return re.sub(r"\W+", " ", str(card.get("question", "")).lower()).strip()
+
+def merge_flashcards(card_lists, limit):
+    """Merge per-chunk flashcards, dropping duplicate questions
+
+    Cards are taken round-robin across chunks so a trimmed set still covers
+    the whole text rather than just its beginning.
+    """
+    merged = []
+    seen = set()
+    for round_cards in zip_longest(*card_lists):
+        for card in round_cards:
+            if not isinstance(card, dict):
+                continue
+            key = _card_key(card)
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(card)
+            if len(merged) >= limit:
+                return merged
+    return merged
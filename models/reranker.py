@@ -0,0 +1,80 @@
+import os
+import time
+import threading
+
+DEFAULT_RERANKER_MODEL = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+
+class CrossEncoderReranker:
+    """CPU cross-encoder that rescores (query, chunk) pairs
+    
+    A cross-encoder reads the query and chunk together, so it ranks far more
+    precisely than embedding similarity, at a cost per pair. It is only run
+    over the fused top candidates, in small batches, and stops when its
+    latency budget is spent; candidates it did not reach keep their order
+    after the rescored ones.
+    
+    Configuration (environment variables):
+    - RERANKER_MODEL: sentence-transformers cross-encoder to load
+    - RERANKER_BATCH: pairs scored per forward pass
+    """
+    
+    def __init__(self, model_name=None, batch_size=None, device='cpu'):
+        self.model_name = model_name or os.getenv("RERANKER_MODEL", DEFAULT_RERANKER_MODEL)
+        self.batch_size = batch_size or int(os.getenv("RERANKER_BATCH", "8"))
+        self.device = device
+        
+        self.model = None
+        self.error = None
+        self._load_lock = threading.Lock()
+    
+    def load(self):
+        """Load the model once; return True if it is available"""
+        if self.model is not None:
+            return True
+        with self._load_lock:
+            if self.model is None and self.error is None:
+                try:
+                    from sentence_transformers import CrossEncoder
+                    self.model = CrossEncoder(self.model_name, device=self.device)
+                    print(f"✓ Reranker loaded: {self.model_name}")
+                except Exception as e:
+                    self.error = e
+                    print(f"⚠ Could not load reranker: {e}")
+        return self.model is not None
+    
+    @property
+    def available(self):
+        return self.load()
+    
+    def rerank(self, query, documents, budget=None):
+        """Reorder documents (dicts with "text") by cross-encoder score
+        
+        Scored documents get the score in "score"; returns the documents
+        and whether every candidate was scored within the budget.
+        """
+        if not documents or not self.load():
+            return documents, False
+        
+        deadline = time.monotonic() + budget if budget else None
+        scored = []
+        for start in range(0, len(documents), self.batch_size):
+            if deadline and scored and time.monotonic() >= deadline:
+                break
+            batch = documents[start:start + self.batch_size]
+            scores = self.model.predict([(query, document["text"]) for document in batch])
+            scored.extend(dict(document, score=float(score)) for document, score in zip(batch, scores))
+        
+        scored.sort(key=lambda document: document["score"], reverse=True)
+        return scored + documents[len(scored):], len(scored) == len(documents)
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+def get_reranker():
+    """Return the process-wide reranker, creating it on first call"""
+    global _reranker
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = CrossEncoderReranker()
+    return _reranker
@@ -1,75 +1,213 @@
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 
-# Import Pinecone with proper error handling
-try:
-    from pinecone.grpc import PineconeGRPC as Pinecone
-except ImportError:
-    try:
-        from pinecone import Pinecone
-    except ImportError:
-        print("Warning: Pinecone not available. Install with: pip install pinecone")
-        Pinecone = None
+from .vector_store import create_vector_store
+from .lexical_index import create_lexical_index
+from .embeddings import get_embedding_service
+from .reranker import get_reranker
+from .cache import LRUCache
+
+# Constant of reciprocal-rank fusion; 60 is the value from the original paper
+RRF_K = 60
 
 class Retriever:
-    def __init__(self):
-        self.api_key = os.getenv("PINECONE_API_KEY")
-        self.index_name = "jarvis-index"
-        self.embedder = None
+    """Hybrid retrieval: dense vectors and BM25, fused, optionally reranked
+    
+    Both searches run side by side and their rankings are combined with
+    reciprocal-rank fusion, which needs no score calibration between them.
+    Each stage has a latency budget: a search that overruns it is left out
+    of the fusion, and the reranker stops scoring when its budget is spent.
+    
+    Configuration (environment variables):
+    - RETRIEVAL_MODE: 'hybrid' (default) or 'dense'
+    - RETRIEVAL_CANDIDATES: matches taken from each search for fusion
+    - RETRIEVAL_LEXICAL_FLOOR: BM25 matches below this fraction of the best
+      score are left out of the fusion
+    - RETRIEVAL_RERANK=1: rerank the fused candidates with a cross-encoder
+    - RETRIEVAL_DENSE_BUDGET_MS / RETRIEVAL_LEXICAL_BUDGET_MS /
+      RETRIEVAL_RERANK_BUDGET_MS: per-stage latency budgets
+    """
+    
+    def __init__(self, vector_store=None, embedding_service=None, lexical_index=None, reranker=None,
+                 mode=None, rerank=None):
+        # Vector store backend (local NumPy index by default, see VECTOR_BACKEND)
+        self.store = vector_store or create_vector_store()
+        
+        # Shared embedding model (loaded in the background, see _warm_up)
+        self.embedder = embedding_service or get_embedding_service()
         
-        if not self.api_key:
-            raise ValueError("PINECONE_API_KEY not found in environment variables")
+        # BM25 index written by the ingestor next to the vectors
+        self.mode = (mode or os.getenv("RETRIEVAL_MODE", "hybrid")).lower()
+        self.lexical = None
+        if self.mode == "hybrid":
+            self.lexical = lexical_index or create_lexical_index(self.store)
         
-        # Initialize Pinecone
-        self.pc = Pinecone(api_key=self.api_key)
+        # Optional cross-encoder over the fused candidates
+        if rerank is None:
+            rerank = os.getenv("RETRIEVAL_RERANK") == "1"
+        self.reranker = (reranker or get_reranker()) if rerank else None
         
-        # Initialize embedding model (lazy loading)
-        self._init_embedder()
+        self.candidates = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+        self.lexical_floor = float(os.getenv("RETRIEVAL_LEXICAL_FLOOR", "0.1"))
+        self.budgets = {
+            "dense": float(os.getenv("RETRIEVAL_DENSE_BUDGET_MS", "1000")) / 1000,
+            "lexical": float(os.getenv("RETRIEVAL_LEXICAL_BUDGET_MS", "200")) / 1000,
+            "rerank": float(os.getenv("RETRIEVAL_RERANK_BUDGET_MS", "300")) / 1000
+        }
+        self.timeouts = {"dense": 0, "lexical": 0, "rerank": 0}
+        self._pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="retrieval")
+        self._pool.submit(self._warm_up)
         
-        # Get index (will create later if needed)
+        # Caches keyed on normalized query text; results are also tied to the
+        # index version so they are dropped as soon as ingestion changes it
+        cache_size = int(os.getenv("RETRIEVAL_CACHE_SIZE", "256"))
+        cache_ttl = float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))
+        self.embedding_cache = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+        self.results_cache = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+        self._index_version = None
+    
+    def _warm_up(self):
+        """Load the embedding model and run one query through it
+        
+        Done at startup so neither the model load nor the first forward
+        pass is charged to the dense budget of a user's query.
+        """
         try:
-            self.index = self.pc.Index(self.index_name)
-            print(f"✓ Connected to Pinecone index: {self.index_name}")
+            if self.embedder.available:
+                self.embedder.encode_query("warm up")
         except Exception as e:
-            print(f"⚠ Could not connect to Pinecone index '{self.index_name}': {e}")
-            print(f"You may need to create the index first with dimension=384")
-            self.index = None
+            print(f"⚠ Embedding warm-up failed: {e}")
+    
+    @staticmethod
+    def _normalize_query(query):
+        return " ".join(query.lower().split())
+    
+    def _current_index_version(self):
+        """Index version, clearing cached results when it has changed"""
+        version = (self.store.version(), self.lexical.version() if self.lexical else None)
+        if version != self._index_version:
+            self.results_cache.clear()
+            self._index_version = version
+        return version
+    
+    def cache_stats(self):
+        """Hit/miss counters for the embedding and results caches"""
+        return {
+            "embeddings": self.embedding_cache.stats(),
+            "results": self.results_cache.stats(),
+            "stage_timeouts": dict(self.timeouts)
+        }
+    
+    def _dense_search(self, query, normalized, top_k):
+        """Vector matches for a query, embedding it unless cached"""
+        query_embedding = self.embedding_cache.get(normalized)
+        if query_embedding is None:
+            query_embedding = self.embedder.encode_query(query)
+            self.embedding_cache.set(normalized, query_embedding)
+        return self.store.query(query_embedding, top_k=top_k)
     
-    def _init_embedder(self):
-        """Lazy load the sentence transformer model"""
-        if self.embedder is None:
+    def _lexical_search(self, query, top_k):
+        """BM25 matches scoring at least lexical_floor of the best one
+        
+        Common words in a query ("what", "is") match nearly every chunk with
+        a negligible score; ranked by RRF those matches would still outvote
+        the chunk that contains the query's rare term.
+        """
+        matches = self.lexical.query(query, top_k)
+        if not matches:
+            return matches
+        cutoff = matches[0]["score"] * self.lexical_floor
+        return [match for match in matches if match["score"] >= cutoff]
+    
+    def _search(self, query, normalized, top_k, dense):
+        """Run the enabled searches in parallel
+        
+        Returns the rankings of the searches that finished within budget and
+        whether all of them did. A search running alone has nothing to fall
+        back on, so it is waited for without a budget.
+        """
+        start = time.monotonic()
+        futures = {}
+        if dense:
+            futures["dense"] = self._pool.submit(self._dense_search, query, normalized, top_k)
+        if self.lexical:
+            futures["lexical"] = self._pool.submit(self._lexical_search, query, top_k)
+        
+        rankings = []
+        complete = True
+        for stage, future in futures.items():
+            timeout = None
+            if len(futures) > 1:
+                timeout = max(0, self.budgets[stage] - (time.monotonic() - start))
             try:
-                from sentence_transformers import SentenceTransformer
-                self.embedder = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2', device='cpu')
+                rankings.append(future.result(timeout=timeout))
+            except FutureTimeout:
+                self.timeouts[stage] += 1
+                complete = False
+                print(f"⚠ {stage.capitalize()} search exceeded its {self.budgets[stage] * 1000:.0f} ms budget")
             except Exception as e:
-                print(f"⚠ Could not load sentence-transformers: {e}")
-                print("Document search will not be available")
-                self.embedder = None
+                complete = False
+                print(f"Error in {stage} search: {e}")
+        return rankings, complete
     
-    def get_relevant_documents(self, query, top_k=3):
-        """Retrieve relevant documents from Pinecone"""
-        if not self.index or not self.embedder:
+    @staticmethod
+    def _fuse(rankings):
+        """Reciprocal-rank fusion of several rankings of {"id", "metadata"} matches"""
+        fused = {}
+        for matches in rankings:
+            for rank, match in enumerate(matches):
+                metadata = match["metadata"]
+                if not metadata or "text" not in metadata:
+                    continue
+                document = fused.setdefault(match["id"], {"id": match["id"], "score": 0.0, "text": metadata["text"]})
+                document["score"] += 1 / (RRF_K + rank + 1)
+        return sorted(fused.values(), key=lambda document: document["score"], reverse=True)
+    
+    def retrieve(self, query, top_k=3):
+        """Retrieve relevant chunks with their IDs and relevance scores"""
+        if not self.store:
+            return []
+        # Without the embedding model, hybrid mode still has BM25
+        dense = self.embedder.available
+        if not dense and not self.lexical:
             return []
         
         try:
-            # Generate embedding for query
-            query_embedding = self.embedder.encode(query).tolist()
-            
-            # Query Pinecone
-            results = self.index.query(
-                vector=query_embedding,
-                top_k=top_k,
-                include_metadata=True
-            )
+            normalized = self._normalize_query(query)
+            results_key = (normalized, top_k, self._current_index_version())
+            documents = self.results_cache.get(results_key)
+            if documents is not None:
+                return list(documents)
             
-            # Extract text from results
-            documents = []
-            if hasattr(results, 'matches'):
-                for match in results.matches:
-                    if hasattr(match, 'metadata') and match.metadata and 'text' in match.metadata:
-                        documents.append(match.metadata['text'])
+            # Fusion and reranking choose from a wider candidate set
+            fetch = top_k if self.lexical is None and not self.reranker else max(top_k, self.candidates)
+            rankings, complete = self._search(query, normalized, fetch, dense)
+            if len(rankings) == 1 and self.lexical is None:
+                # Dense-only mode keeps cosine similarity as the score
+                documents = [
+                    {"id": match["id"], "score": match["score"], "text": match["metadata"]["text"]}
+                    for match in rankings[0]
+                    if match["metadata"] and "text" in match["metadata"]
+                ]
+            else:
+                documents = self._fuse(rankings)
             
-            return documents
+            if self.reranker and len(documents) > 1:
+                documents, reranked = self.reranker.rerank(query, documents, self.budgets["rerank"])
+                if not reranked:
+                    self.timeouts["rerank"] += 1
             
+            documents = documents[:top_k]
+            # Results cut short by a budget are not cached
+            if complete:
+                self.results_cache.set(results_key, documents)
+            return list(documents)
+        
         except Exception as e:
-            print(f"Error querying Pinecone: {e}")
+            print(f"Error querying vector store: {e}")
             return []
+    
+    def get_relevant_documents(self, query, top_k=3):
+        """Retrieve relevant document texts from the vector store"""
+        return [doc["text"] for doc in self.retrieve(query, top_k=top_k)]
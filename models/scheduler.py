@@ -0,0 +1,261 @@
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Request priorities: interactive chat is served before batch-style jobs
+INTERACTIVE = 0
+BATCH = 1
+
+class SchedulerBusy(Exception):
+    """Raised when a request is not admitted; carries the HTTP status and Retry-After"""
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.retry_after = retry_after
+
+class _Ticket:
+    """One admitted or queued request"""
+    __slots__ = ("priority", "client", "admitted", "wake", "granted", "error", "started_at", "released")
+
+    def __init__(self, priority, client, admitted, wake):
+        self.priority = priority
+        self.client = client
+        self.admitted = admitted
+        self.wake = wake
+        self.granted = False
+        self.error = None
+        self.started_at = None
+        self.released = False
+
+class LLMScheduler:
+    """Admission control for requests to the local LLM
+
+    At most max_in_flight requests run at once; the rest wait in a bounded
+    queue instead of piling up inside Ollama, where every request would slow
+    down every other one. Queued interactive requests always go first, and
+    one slot is kept free of batch work so a chat never waits behind a long
+    summary. Within a priority the next slot goes to the client with the
+    fewest running requests, so one busy client cannot starve the others.
+
+    Requests that cannot be served soon are refused straight away: 429 when
+    a client already has max_per_client requests, 503 when the queue is full
+    or a request has waited queue_timeout seconds. Both carry a Retry-After
+    estimated from recent service times. Steps of an already admitted
+    request (admitted=True) wait for slots like any other batch work but do
+    not count against the per-client or queue limits.
+
+    Works from worker threads (acquire) and event loops (acquire_async).
+
+    Configuration (environment variables):
+    - LLM_MAX_IN_FLIGHT: concurrent requests sent to Ollama
+    - LLM_QUEUE_SIZE: requests allowed to wait for a slot
+    - LLM_MAX_PER_CLIENT: running plus queued requests per client
+    - LLM_QUEUE_TIMEOUT: seconds a request may wait before a 503
+    - LLM_INTERACTIVE_RESERVE: slots batch requests may not use
+    """
+
+    def __init__(self, max_in_flight=None, max_queue=None, max_per_client=None,
+                 queue_timeout=None, interactive_reserve=None):
+        self.max_in_flight = max_in_flight or int(os.getenv("LLM_MAX_IN_FLIGHT", "2"))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("LLM_QUEUE_SIZE", "16"))
+        self.max_per_client = max_per_client or int(os.getenv("LLM_MAX_PER_CLIENT", "4"))
+        self.queue_timeout = queue_timeout or float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+        if interactive_reserve is None:
+            interactive_reserve = int(os.getenv("LLM_INTERACTIVE_RESERVE", "1"))
+        # Batch work always gets at least one slot
+        self.batch_slots = max(1, self.max_in_flight - interactive_reserve)
+
+        self._queues = {INTERACTIVE: deque(), BATCH: deque()}
+        self._running = {INTERACTIVE: 0, BATCH: 0}
+        self._per_client = {}  # client -> (running, queued)
+        self._lock = threading.Lock()
+
+        # Moving average of how long a request holds its slot, for Retry-After
+        self._service_time = 5.0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    # ----- Admission -----
+
+    def _retry_after(self):
+        """Seconds until a slot is likely to be free"""
+        queued = sum(len(queue) for queue in self._queues.values())
+        wait = self._service_time * (queued / self.max_in_flight + 1)
+        return max(1, min(60, math.ceil(wait)))
+
+    def _reject(self, message, status):
+        self.rejected += 1
+        return SchedulerBusy(message, status, self._retry_after())
+
+    def _client_counts(self, client):
+        return self._per_client.get(client, (0, 0))
+
+    def _adjust_client(self, ticket, running=0, queued=0):
+        # Steps of an admitted request were counted when it was admitted
+        if ticket.admitted:
+            return
+        client = ticket.client
+        current_running, current_queued = self._client_counts(client)
+        counts = (current_running + running, current_queued + queued)
+        if counts == (0, 0):
+            self._per_client.pop(client, None)
+        else:
+            self._per_client[client] = counts
+
+    def _queued_requests(self):
+        """Queued new requests; admitted steps do not take queue places"""
+        return sum(1 for queue in self._queues.values() for ticket in queue if not ticket.admitted)
+
+    def _has_capacity(self, priority):
+        if sum(self._running.values()) >= self.max_in_flight:
+            return False
+        return priority == INTERACTIVE or self._running[BATCH] < self.batch_slots
+
+    def _admit(self, ticket):
+        """Grant a slot, queue the ticket or raise SchedulerBusy (lock held)"""
+        running, queued = self._client_counts(ticket.client)
+        if not ticket.admitted and running + queued >= self.max_per_client:
+            raise self._reject("Too many requests in progress for this client", 429)
+
+        if not self._queues[ticket.priority] and self._has_capacity(ticket.priority):
+            self._grant(ticket)
+            return
+
+        if not ticket.admitted and self._queued_requests() >= self.max_queue:
+            # An interactive request takes the place of the newest queued batch request
+            evictable = [queued for queued in self._queues[BATCH] if not queued.admitted]
+            if ticket.priority != INTERACTIVE or not evictable:
+                raise self._reject("LLM is busy, please retry shortly", 503)
+            evicted = evictable[-1]
+            self._queues[BATCH].remove(evicted)
+            self._adjust_client(evicted, queued=-1)
+            evicted.error = self._reject("LLM is busy, please retry shortly", 503)
+            evicted.wake()
+
+        self._queues[ticket.priority].append(ticket)
+        self._adjust_client(ticket, queued=1)
+
+    def _grant(self, ticket):
+        ticket.granted = True
+        ticket.started_at = time.monotonic()
+        self._running[ticket.priority] += 1
+        self._adjust_client(ticket, running=1)
+
+    def _next_ticket(self, priority):
+        """Queued ticket whose client has the fewest running requests (FIFO on ties)"""
+        queue = self._queues[priority]
+        best = min(range(len(queue)), key=lambda i: (self._client_counts(queue[i].client)[0], i))
+        ticket = queue[best]
+        del queue[best]
+        return ticket
+
+    def _dispatch(self):
+        """Hand free slots to queued tickets (lock held)"""
+        for priority in (INTERACTIVE, BATCH):
+            while self._queues[priority] and self._has_capacity(priority):
+                ticket = self._next_ticket(priority)
+                self._adjust_client(ticket, queued=-1)
+                self._grant(ticket)
+                ticket.wake()
+
+    def _abandon(self, ticket):
+        """Give up on a ticket that stopped waiting; True if it holds a slot anyway"""
+        with self._lock:
+            if ticket.granted:
+                return True
+            if ticket.error is None:
+                self._queues[ticket.priority].remove(ticket)
+                self._adjust_client(ticket, queued=-1)
+            return False
+
+    def _timed_out(self):
+        with self._lock:
+            self.timed_out += 1
+            return self._reject("Timed out waiting for the LLM, please retry", 503)
+
+    # ----- Public API -----
+
+    def acquire(self, priority, client, admitted=False):
+        """Wait for a slot from a worker thread; returns a ticket for release()
+
+        admitted marks a step of a request that was already admitted (such as
+        one chunk of a map-reduce); it queues normally but is never refused,
+        evicted or timed out.
+        """
+        event = threading.Event()
+        ticket = _Ticket(priority, client, admitted, event.set)
+        with self._lock:
+            self._admit(ticket)
+
+        timeout = None if admitted else self.queue_timeout
+        if not ticket.granted and not event.wait(timeout):
+            if not self._abandon(ticket):
+                raise ticket.error or self._timed_out()
+        if ticket.error:
+            raise ticket.error
+        return ticket
+
+    async def acquire_async(self, priority, client, admitted=False):
+        """Wait for a slot from an event loop; returns a ticket for release()"""
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        ticket = _Ticket(priority, client, admitted, lambda: loop.call_soon_threadsafe(event.set))
+        with self._lock:
+            self._admit(ticket)
+
+        if not ticket.granted:
+            try:
+                await asyncio.wait_for(event.wait(), None if admitted else self.queue_timeout)
+            except asyncio.TimeoutError:
+                if not self._abandon(ticket):
+                    raise ticket.error or self._timed_out()
+            except asyncio.CancelledError:
+                # The client went away while queued
+                if self._abandon(ticket):
+                    self.release(ticket)
+                raise
+        if ticket.error:
+            raise ticket.error
+        return ticket
+
+    def release(self, ticket):
+        """Free a ticket's slot for the next queued request (safe to call twice)"""
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            self._running[ticket.priority] -= 1
+            self._adjust_client(ticket, running=-1)
+            self.completed += 1
+            elapsed = time.monotonic() - ticket.started_at
+            self._service_time += 0.2 * (elapsed - self._service_time)
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority, client, admitted=False):
+        """Hold a slot for the duration of a with block"""
+        ticket = self.acquire(priority, client, admitted)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self):
+        """Current load and admission counters"""
+        with self._lock:
+            return {
+                "in_flight": sum(self._running.values()),
+                "queued": sum(len(queue) for queue in self._queues.values()),
+                "max_in_flight": self.max_in_flight,
+                "max_queue": self.max_queue,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "avg_service_time": round(self._service_time, 2)
+            }
@@ -0,0 +1,468 @@
+import os
+import json
+import glob
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+
+# Import Pinecone with proper error handling
+try:
+    from pinecone.grpc import PineconeGRPC as Pinecone
+    from pinecone import ServerlessSpec
+except ImportError:
+    try:
+        from pinecone import Pinecone, ServerlessSpec
+    except ImportError:
+        Pinecone = None
+        ServerlessSpec = None
+
+DEFAULT_INDEX_NAME = "jarvis-index"
+DEFAULT_LOCAL_INDEX_DIR = "vector_index"
+DEFAULT_DIMENSION = 384  # all-MiniLM-L6-v2 dimension
+
+# Write counters per Pinecone index, shared by every store in this process
+_pinecone_generations = {}
+_pinecone_generations_lock = threading.Lock()
+
+# Pinecone request limits: 2 MB per upsert, 1000 vectors per upsert or delete
+PINECONE_MAX_REQUEST_BYTES = 2 * 1024 * 1024
+PINECONE_MAX_BATCH = 1000
+
+# Throttling and transient failures, retried with exponential backoff and full jitter
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RETRYABLE_GRPC_CODES = {"RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED"}
+# Client exception classes (by name, as they move between SDK versions)
+RETRYABLE_ERRORS = {"PineconeConnectionError", "PineconeTimeoutError", "RateLimitError", "RateLimitException",
+                    "ServiceError", "ServiceException", "ProtocolError", "MaxRetryError"}
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 20
+
+def _is_retryable(error):
+    """Whether a failed Pinecone request is worth retrying"""
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUSES
+    code = getattr(error, "code", None)
+    if callable(code):
+        # gRPC errors carry a status code instead of an HTTP status
+        try:
+            return getattr(code(), "name", None) in RETRYABLE_GRPC_CODES
+        except Exception:
+            pass
+    if any(cls.__name__ in RETRYABLE_ERRORS for cls in type(error).__mro__):
+        return True
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+def _payload_bytes(vector):
+    """Upper estimate of one vector's size in an upsert request (JSON floats)"""
+    return len(vector["id"]) + 22 * len(vector["values"]) + len(json.dumps(vector.get("metadata") or {})) + 64
+
+
+class LocalVectorStore:
+    """In-process vector index backed by a memory-mapped NumPy matrix
+    
+    Embeddings are L2-normalized float32 rows, so cosine similarity is a
+    single matrix-vector product. Brute-force search is exact and fast for
+    corpora of a few thousand chunks.
+    
+    Queries read one snapshot of IDs, metadata and vectors that reloads and
+    flushes replace whole. Upserts and deletes are held until flush(),
+    which merges them into the matrix in one pass.
+    """
+    
+    def __init__(self, index_dir=DEFAULT_LOCAL_INDEX_DIR, dimension=DEFAULT_DIMENSION):
+        self.index_dir = index_dir
+        self.dimension = dimension
+        self.manifest_path = os.path.join(index_dir, "index.json")
+        self.identity = f"local:{os.path.abspath(index_dir)}"
+        
+        # (ids, metadata, vectors) as last loaded or flushed
+        self._snapshot = ([], [], np.zeros((0, dimension), dtype=np.float32))
+        # Writes since the last flush: ID -> (row, metadata), and deleted IDs
+        self._pending = {}
+        self._deleted = set()
+        self._version = 0
+        self._loaded_mtime = None
+        self._lock = threading.Lock()
+        
+        os.makedirs(index_dir, exist_ok=True)
+        with self._lock:
+            self._load()
+    
+    @property
+    def ids(self):
+        return self._snapshot[0]
+    
+    @property
+    def metadata(self):
+        return self._snapshot[1]
+    
+    @property
+    def vectors(self):
+        return self._snapshot[2]
+    
+    def _vectors_path(self, version):
+        return os.path.join(self.index_dir, f"vectors-{version}.npy")
+    
+    def _manifest_changed(self):
+        return (os.path.exists(self.manifest_path)
+                and os.stat(self.manifest_path).st_mtime_ns != self._loaded_mtime)
+    
+    def _load(self):
+        """Load the manifest and memory-map the current embeddings file (lock held)"""
+        if not os.path.exists(self.manifest_path):
+            return
+        
+        mtime = os.stat(self.manifest_path).st_mtime_ns
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        
+        dimension = manifest["dimension"]
+        ids = manifest["ids"]
+        if ids:
+            try:
+                vectors = np.load(self._vectors_path(manifest["version"]), mmap_mode='r')
+            except FileNotFoundError:
+                # A newer flush replaced this version mid-read; keep the
+                # current snapshot and pick up the new manifest next query
+                return
+        else:
+            vectors = np.zeros((0, dimension), dtype=np.float32)
+        
+        self.dimension = dimension
+        self._snapshot = (ids, manifest["metadata"], vectors)
+        self._version = manifest["version"]
+        self._loaded_mtime = mtime
+    
+    def _reload_if_changed(self):
+        """Pick up writes made by another store instance (e.g. an ingestor)"""
+        if self._manifest_changed():
+            with self._lock:
+                if self._manifest_changed():
+                    self._load()
+    
+    @staticmethod
+    def _normalize(matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+    
+    def upsert(self, vectors):
+        """Insert or replace vectors given as {"id", "values", "metadata"} dicts"""
+        if not vectors:
+            return
+        
+        values = self._normalize([vector["values"] for vector in vectors])
+        if values.shape[1] != self.dimension:
+            raise ValueError(f"Expected {self.dimension}-dimensional vectors, got {values.shape[1]}")
+        
+        with self._lock:
+            for vector, row in zip(vectors, values):
+                self._deleted.discard(vector["id"])
+                self._pending[vector["id"]] = (row, vector.get("metadata", {}))
+    
+    def delete(self, ids):
+        """Remove vectors by ID"""
+        with self._lock:
+            for vector_id in ids:
+                self._pending.pop(vector_id, None)
+                self._deleted.add(vector_id)
+    
+    def flush(self):
+        """Persist pending writes to disk"""
+        with self._lock:
+            if not (self._pending or self._deleted):
+                return
+            
+            # Merge onto the latest manifest, which another store instance
+            # may have written since this one loaded
+            if self._manifest_changed():
+                self._load()
+            current_ids, current_metadata, current_vectors = self._snapshot
+            
+            keep = [i for i, vector_id in enumerate(current_ids) if vector_id not in self._deleted]
+            if not self._pending and len(keep) == len(current_ids):
+                self._deleted.clear()
+                return
+            
+            # One copy out of the read-only memory map for the whole batch
+            ids = [current_ids[i] for i in keep]
+            metadata = [current_metadata[i] for i in keep]
+            matrix = np.asarray(current_vectors[keep], dtype=np.float32).reshape(-1, self.dimension)
+            positions = {vector_id: i for i, vector_id in enumerate(ids)}
+            new_rows = []
+            for vector_id, (row, vector_metadata) in self._pending.items():
+                position = positions.get(vector_id)
+                if position is None:
+                    ids.append(vector_id)
+                    metadata.append(vector_metadata)
+                    new_rows.append(row)
+                else:
+                    matrix[position] = row
+                    metadata[position] = vector_metadata
+            if new_rows:
+                matrix = np.vstack([matrix, np.stack(new_rows)])
+            
+            # Write a new versioned embeddings file so readers holding a memory
+            # map of the old one are never affected, then swap the manifest
+            version = self._version + 1
+            np.save(self._vectors_path(version), np.ascontiguousarray(matrix, dtype=np.float32))
+            
+            tmp_path = self.manifest_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    "version": version,
+                    "dimension": self.dimension,
+                    "ids": ids,
+                    "metadata": metadata
+                }, f)
+            os.replace(tmp_path, self.manifest_path)
+            
+            self._pending.clear()
+            self._deleted.clear()
+            self._load()
+        
+        # Clean up older embeddings files (may still be mapped on Windows)
+        for path in glob.glob(os.path.join(self.index_dir, "vectors-*.npy")):
+            if path != self._vectors_path(version):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+    
+    def query(self, vector, top_k=3):
+        """Return the top_k matches as {"id", "score", "metadata"} dicts"""
+        self._reload_if_changed()
+        ids, metadata, vectors = self._snapshot
+        if not ids or top_k <= 0:
+            return []
+        
+        query_vector = self._normalize(vector).reshape(-1)
+        scores = vectors @ query_vector
+        
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        
+        return [
+            {"id": ids[i], "score": float(scores[i]), "metadata": metadata[i]}
+            for i in top
+        ]
+    
+    def count(self):
+        """Number of vectors in the index"""
+        self._reload_if_changed()
+        return len(self._snapshot[0])
+    
+    def version(self):
+        """Token that changes whenever the persisted index changes"""
+        self._reload_if_changed()
+        return self._version
+
+
+class PineconeVectorStore:
+    """Vector store backed by a remote Pinecone index
+    
+    Writes are buffered and sent as upsert requests packed up to batch_bytes
+    of payload, with up to parallelism requests in flight, so uploads are
+    limited by bandwidth instead of one round-trip per batch. Throttled and
+    transiently failed requests are retried with jittered exponential
+    backoff. upsert() returns once its vectors are queued, blocking while
+    too many requests are outstanding; flush() sends the rest, waits for
+    every request and raises the first error.
+    
+    Configuration (environment variables):
+    - PINECONE_HOST: index host, skipping the lookup by name (e.g. a local
+      stand-in server)
+    - PINECONE_PARALLELISM: concurrent write requests
+    - PINECONE_BATCH_BYTES: target payload per upsert request (max 2 MB)
+    - PINECONE_MAX_RETRIES: retries of a throttled or failed request
+    """
+    
+    def __init__(self, api_key=None, index_name=DEFAULT_INDEX_NAME, dimension=DEFAULT_DIMENSION,
+                 create_if_missing=False, parallelism=None, batch_bytes=None, max_retries=None):
+        self.api_key = api_key or os.getenv("PINECONE_API_KEY")
+        self.index_name = index_name
+        self.dimension = dimension
+        self.identity = f"pinecone:{index_name}"
+        
+        self.parallelism = parallelism or int(os.getenv("PINECONE_PARALLELISM", "8"))
+        self.batch_bytes = min(batch_bytes or int(os.getenv("PINECONE_BATCH_BYTES", "1500000")),
+                               PINECONE_MAX_REQUEST_BYTES)
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("PINECONE_MAX_RETRIES", "5"))
+        self.retries = 0
+        
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._buffer_lock = threading.Lock()
+        self._outstanding = set()
+        self._error = None
+        self._write_lock = threading.Lock()
+        # Requests queued behind the running ones; beyond that upsert() waits
+        self._slots = threading.BoundedSemaphore(2 * self.parallelism)
+        self._pool = None
+        
+        if Pinecone is None:
+            raise ImportError("Pinecone not available. Install with: pip install pinecone")
+        
+        if not self.api_key:
+            raise ValueError("PINECONE_API_KEY not found in environment variables")
+        
+        # Initialize Pinecone
+        self.pc = Pinecone(api_key=self.api_key)
+        
+        if create_if_missing:
+            self._setup_index()
+        
+        host = os.getenv("PINECONE_HOST")
+        self.index = self.pc.Index(self.index_name, host=host) if host else self.pc.Index(self.index_name)
+        print(f"✓ Connected to Pinecone index: {self.index_name}")
+    
+    def _setup_index(self):
+        """Create Pinecone index if it doesn't exist"""
+        existing_indexes = [index.name for index in self.pc.list_indexes()]
+        
+        if self.index_name not in existing_indexes:
+            print(f"Creating Pinecone index: {self.index_name}")
+            self.pc.create_index(
+                name=self.index_name,
+                dimension=self.dimension,
+                metric='cosine',
+                spec=ServerlessSpec(
+                    cloud='aws',
+                    region='us-east-1'
+                )
+            )
+            print(f"✓ Index '{self.index_name}' created successfully")
+        else:
+            print(f"✓ Using existing index: {self.index_name}")
+    
+    def _call(self, request, **kwargs):
+        """Run one index request, retrying throttling and transient errors"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return request(**kwargs)
+            except Exception as e:
+                if attempt == self.max_retries or not _is_retryable(e):
+                    raise
+                self.retries += 1
+                time.sleep(random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)))
+    
+    def _write(self, request, kwargs):
+        """Run a write on the pool; its outcome is recorded before the future completes"""
+        try:
+            self._call(request, **kwargs)
+            self._bump_generation()
+        except Exception as e:
+            with self._write_lock:
+                if self._error is None:
+                    self._error = e
+        finally:
+            self._slots.release()
+    
+    def _submit(self, request, **kwargs):
+        """Send a write request from the pool, waiting while too many are outstanding"""
+        self._slots.acquire()
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.parallelism, thread_name_prefix="pinecone")
+        future = self._pool.submit(self._write, request, kwargs)
+        with self._write_lock:
+            self._outstanding.add(future)
+        future.add_done_callback(self._finished)
+    
+    def _finished(self, future):
+        with self._write_lock:
+            self._outstanding.discard(future)
+    
+    def _raise_error(self):
+        """Raise (once) the first error of a background write"""
+        with self._write_lock:
+            error, self._error = self._error, None
+        if error is not None:
+            raise error
+    
+    def _send_buffer(self):
+        """Submit the buffered vectors as one upsert request (buffer lock held)"""
+        if self._buffer:
+            self._submit(self.index.upsert, vectors=self._buffer)
+            self._buffer = []
+            self._buffer_bytes = 0
+    
+    def upsert(self, vectors):
+        """Queue vectors given as {"id", "values", "metadata"} dicts for upload"""
+        self._raise_error()
+        with self._buffer_lock:
+            for vector in vectors:
+                size = _payload_bytes(vector)
+                if self._buffer_bytes + size > self.batch_bytes or len(self._buffer) >= PINECONE_MAX_BATCH:
+                    self._send_buffer()
+                self._buffer.append(vector)
+                self._buffer_bytes += size
+    
+    def delete(self, ids):
+        """Remove vectors by ID, in parallel requests of up to 1000 IDs"""
+        ids = list(ids)
+        if not ids:
+            return
+        # A delete must not overtake a queued upsert of the same ID
+        self.flush()
+        for start in range(0, len(ids), PINECONE_MAX_BATCH):
+            self._submit(self.index.delete, ids=ids[start:start + PINECONE_MAX_BATCH])
+        self.flush()
+    
+    def flush(self):
+        """Send buffered vectors and wait for all outstanding writes"""
+        with self._buffer_lock:
+            self._send_buffer()
+        with self._write_lock:
+            outstanding = list(self._outstanding)
+        wait(outstanding)
+        self._raise_error()
+    
+    def query(self, vector, top_k=3):
+        """Return the top_k matches as {"id", "score", "metadata"} dicts"""
+        if hasattr(vector, "tolist"):
+            vector = vector.tolist()
+        
+        results = self.index.query(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=True
+        )
+        
+        matches = []
+        for match in getattr(results, 'matches', []):
+            matches.append({
+                "id": match.id,
+                "score": match.score,
+                "metadata": getattr(match, 'metadata', None) or {}
+            })
+        return matches
+    
+    def count(self):
+        """Number of vectors in the index"""
+        stats = self.index.describe_index_stats()
+        return stats.total_vector_count
+    
+    def _bump_generation(self):
+        with _pinecone_generations_lock:
+            _pinecone_generations[self.index_name] = _pinecone_generations.get(self.index_name, 0) + 1
+    
+    def version(self):
+        """Token that changes whenever this process writes to the index"""
+        return _pinecone_generations.get(self.index_name, 0)
+
+
+def create_vector_store(backend=None, create_if_missing=False):
+    """Create the vector store selected by VECTOR_BACKEND ('local' or 'pinecone')"""
+    backend = (backend or os.getenv("VECTOR_BACKEND", "local")).lower()
+    
+    if backend == "local":
+        return LocalVectorStore(os.getenv("VECTOR_INDEX_DIR", DEFAULT_LOCAL_INDEX_DIR))
+    if backend == "pinecone":
+        return PineconeVectorStore(create_if_missing=create_if_missing)
+    raise ValueError(f"Unknown VECTOR_BACKEND '{backend}' (expected 'local' or 'pinecone')")
@@ -0,0 +1,37 @@
+"""
+Production server for Nexus
+
+SERVER_MODE=asgi (default): uvicorn serving asgi.py, where LLM routes are
+async and do not tie up threads while Ollama generates.
+SERVER_MODE=wsgi: waitress serving the Flask app from a thread pool.
+
+Settings (environment variables): HOST, PORT, WEB_WORKERS, WEB_THREADS.
+Background ingestion jobs and the local vector index live in each worker
+process, so keep WEB_WORKERS at 1 unless those are disabled.
+"""
+
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HOST = os.getenv('HOST', '0.0.0.0')
+PORT = int(os.getenv('PORT', '5000'))
+WORKERS = int(os.getenv('WEB_WORKERS', '1'))
+THREADS = int(os.getenv('WEB_THREADS', '32'))
+
+def serve_asgi():
+    import uvicorn
+    uvicorn.run('asgi:application', host=HOST, port=PORT, workers=WORKERS, lifespan='on')
+
+def serve_wsgi():
+    from waitress import serve
+    from asgi import nexus  # app.py is shadowed by the app/ package, so load it the same way
+    serve(nexus.app, host=HOST, port=PORT, threads=THREADS)
+
+if __name__ == '__main__':
+    mode = os.getenv('SERVER_MODE', 'asgi').lower()
+    print(f"🔮 Starting Nexus ({mode}, {WORKERS if mode == 'asgi' else 1} worker(s), {THREADS} threads)")
+    print(f"🌐 Server running at: http://{HOST}:{PORT}")
+    serve_asgi() if mode == 'asgi' else serve_wsgi()
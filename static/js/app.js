@@ -40,8 +40,8 @@ function sendMessage() {
     // Show typing indicator
     showTypingIndicator();
     
-    // Send to backend
-    fetch('/chat', {
+    // Send to backend (tokens are streamed back as server-sent events)
+    fetch('/chat/stream', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json'
@@ -52,27 +52,71 @@ function sendMessage() {
             chat_id: window.currentChatId || null
         })
     })
-    .then(response => response.json())
-    .then(data => {
-        // Remove typing indicator
-        removeTypingIndicator();
-        
-        // Store chat_id if returned
-        if (data.chat_id) {
-            window.currentChatId = data.chat_id;
+    .then(async response => {
+        if (!response.ok || !response.body) {
+            const data = await response.json();
+            throw new Error(data.error || `Server returned ${response.status}`);
         }
         
-        // Add assistant response
-        if (data.response) {
-            addMessage(data.response, 'assistant');
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let streamedText = '';
+        let contentDiv = null;
+        let finished = false;
+        
+        const handleEvent = (data) => {
+            // Store chat_id as soon as the server assigns it
+            if (data.chat_id) {
+                window.currentChatId = data.chat_id;
+            }
             
-            // Update conversation history
-            conversationHistory.push(
-                { role: 'user', content: message },
-                { role: 'assistant', content: data.response }
-            );
-        } else if (data.error) {
-            addMessage('Sorry, I encountered an error: ' + data.error, 'assistant');
+            if (data.token) {
+                // Replace typing indicator with the message on the first token
+                if (!contentDiv) {
+                    removeTypingIndicator();
+                    contentDiv = createMessageElement('assistant');
+                }
+                streamedText += data.token;
+                contentDiv.innerHTML = streamedText.replace(/\n/g, '<br>');
+                chatMessages.scrollTop = chatMessages.scrollHeight;
+            } else if (data.done) {
+                finished = true;
+                removeTypingIndicator();
+                if (!contentDiv) {
+                    contentDiv = createMessageElement('assistant');
+                }
+                contentDiv.innerHTML = data.response.replace(/\n/g, '<br>');
+                captureLastMessage(data.response);
+                
+                // Update conversation history
+                conversationHistory.push(
+                    { role: 'user', content: message },
+                    { role: 'assistant', content: data.response }
+                );
+            } else if (data.error) {
+                finished = true;
+                removeTypingIndicator();
+                addMessage('Sorry, I encountered an error: ' + data.error, 'assistant');
+            }
+        };
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+            events.forEach(event => {
+                if (event.startsWith('data: ')) {
+                    handleEvent(JSON.parse(event.slice(6)));
+                }
+            });
+        }
+        
+        if (!finished) {
+            removeTypingIndicator();
         }
         
         // Re-enable send button
@@ -88,7 +132,7 @@ function sendMessage() {
     });
 }
 
-function addMessage(text, sender) {
+function createMessageElement(sender) {
     const messageDiv = document.createElement('div');
     messageDiv.className = `message ${sender}`;
     
@@ -98,9 +142,6 @@ function addMessage(text, sender) {
     
     const content = document.createElement('div');
     content.className = 'message-content';
-    // Convert newlines to <br> tags for proper formatting
-    const formattedText = text.replace(/\n/g, '<br>');
-    content.innerHTML = formattedText;
     
     messageDiv.appendChild(avatar);
     messageDiv.appendChild(content);
@@ -108,6 +149,15 @@ function addMessage(text, sender) {
     chatMessages.appendChild(messageDiv);
     chatMessages.scrollTop = chatMessages.scrollHeight;
     
+    return content;
+}
+
+function addMessage(text, sender) {
+    const content = createMessageElement(sender);
+    // Convert newlines to <br> tags for proper formatting
+    const formattedText = text.replace(/\n/g, '<br>');
+    content.innerHTML = formattedText;
+    
     // Capture assistant messages for summary/flashcard features
     if (sender === 'assistant') {
         captureLastMessage(text);
@@ -183,19 +233,54 @@ document.getElementById('flashcardsBtn').addEventListener('click', async () => {
     }
     
     try {
-        const response = await fetch('/generate-flashcards', {
+        // Cards are streamed back one by one as server-sent events
+        const response = await fetch('/generate-flashcards/stream', {
             method: 'POST',
             headers: {'Content-Type': 'application/json'},
             body: JSON.stringify({text: lastAssistantMessage, num_cards: 5})
         });
         
-        const data = await response.json();
-        if (data.flashcards && data.flashcards.length > 0) {
-            let flashcardsHTML = '🎴 **Flashcards Generated:**\n\n';
-            data.flashcards.forEach((card, index) => {
-                flashcardsHTML += `**Card ${index + 1}:**\nQ: ${card.question}\nA: ${card.answer}\n\n`;
+        if (!response.ok || !response.body) {
+            const data = await response.json();
+            throw new Error(data.error || `Server returned ${response.status}`);
+        }
+        
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let flashcardsHTML = '🎴 **Flashcards Generated:**\n\n';
+        let cardCount = 0;
+        let contentDiv = null;
+        
+        const handleEvent = (data) => {
+            if (data.flashcard) {
+                // Show each card as soon as it is complete
+                if (!contentDiv) {
+                    contentDiv = createMessageElement('assistant');
+                }
+                cardCount += 1;
+                flashcardsHTML += `**Card ${cardCount}:**\nQ: ${data.flashcard.question}\nA: ${data.flashcard.answer}\n\n`;
+                contentDiv.innerHTML = flashcardsHTML.replace(/\n/g, '<br>');
+                chatMessages.scrollTop = chatMessages.scrollHeight;
+            } else if (data.done && contentDiv) {
+                captureLastMessage(flashcardsHTML);
+            } else if (data.error) {
+                throw new Error(data.error);
+            }
+        };
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+            events.forEach(event => {
+                if (event.startsWith('data: ')) {
+                    handleEvent(JSON.parse(event.slice(6)));
+                }
             });
-            addMessage(flashcardsHTML, 'assistant');
         }
     } catch (error) {
         console.error('Flashcards error:', error);
@@ -255,6 +255,7 @@ async function searchChatHistory() {
                 <div class="chat-history-icon">🔍</div>
                 <div class="chat-history-info">
                     <div class="chat-history-title">${escapeHtml(chat.title)}</div>
+                    <div class="chat-history-preview">${highlightSnippet(chat.messages[0].snippet)}</div>
                     <div class="chat-history-preview">${chat.messages.length} matching message(s)</div>
                 </div>
                 <button onclick="loadChatConversation(${chat.id})" class="load-chat-btn">Load</button>
@@ -267,6 +268,13 @@ async function searchChatHistory() {
     }
 }
 
+// Escape a search snippet but keep the <mark> highlights added by the server
+function highlightSnippet(snippet) {
+    return escapeHtml(snippet || '')
+        .replace(/&lt;mark&gt;/g, '<mark>')
+        .replace(/&lt;\/mark&gt;/g, '</mark>');
+}
+
 // Setup function called when chat history panel opens
 function setupChatHistoryEventListeners() {
     console.log('Setting up chat history listeners...');
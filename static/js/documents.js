@@ -70,6 +70,17 @@ async function uploadFile(file) {
         
         if (response.ok) {
             showNotification(`✅ ${file.name} uploaded successfully`, 'success');
+            
+            // The server may queue ingestion of the new file in the background
+            if (data.job_id) {
+                waitForJob(data.job_id).then(job => {
+                    if (job.status === 'completed') {
+                        showNotification(`🔎 ${file.name} is now searchable`, 'success');
+                    } else {
+                        showNotification(`❌ Could not index ${file.name}: ${job.error}`, 'error');
+                    }
+                }).catch(error => console.error('Job status error:', error));
+            }
         } else {
             let errorMsg = data.error || 'Upload failed';
             if (errorMsg.includes('Permission denied')) {
@@ -173,7 +184,37 @@ function showNotification(message, type = 'info') {
     }
 }
 
-// Re-ingest all documents to Pinecone
+// Poll a background job until it completes or fails
+async function waitForJob(jobId, onProgress = () => {}, interval = 1000) {
+    while (true) {
+        const response = await fetch(`/jobs/${jobId}`);
+        const data = await response.json();
+        
+        if (!response.ok) {
+            throw new Error(data.error || 'Could not get job status');
+        }
+        
+        onProgress(data.job.progress || {});
+        if (data.job.status === 'completed' || data.job.status === 'failed') {
+            return data.job;
+        }
+        
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+}
+
+// Describe ingestion progress counters for the loading modal
+function describeIngestProgress(progress) {
+    if (progress.chunks_embedded > 0 && progress.chunks_total) {
+        return `Embedding chunks... ${progress.chunks_embedded} / ${progress.chunks_total}`;
+    }
+    if (progress.files_to_ingest) {
+        return `Processing files... ${progress.files_processed} / ${progress.files_to_ingest}`;
+    }
+    return 'Ingesting documents... Please wait.';
+}
+
+// Re-ingest all documents into the vector store
 async function reIngestDocuments() {
     console.log('reIngestDocuments function called');
     
@@ -202,15 +243,30 @@ async function reIngestDocuments() {
                 const data = await response.json();
                 console.log('Response data:', data);
                 
+                if (!response.ok) {
+                    loadingModal.remove();
+                    showErrorModal(data.error || 'Ingestion failed. Please check your vector store configuration and try again.');
+                    showToast(data.error || 'Ingestion failed', 'error');
+                    return;
+                }
+                
+                // Ingestion runs in the background - poll the job until it finishes
+                const job = await waitForJob(data.job_id, (progress) => {
+                    const message = loadingModal.querySelector('.modal-message');
+                    if (message) {
+                        message.textContent = describeIngestProgress(progress);
+                    }
+                });
+                
                 // Remove loading modal
                 loadingModal.remove();
                 
-                if (response.ok) {
+                if (job.status === 'completed') {
                     showSuccessModal('All documents have been ingested successfully! You can now search across all uploaded documents.');
                     showToast('Documents ingested successfully!', 'success');
                 } else {
-                    showErrorModal(data.error || 'Ingestion failed. Please check your Pinecone configuration and try again.');
-                    showToast(data.error || 'Ingestion failed', 'error');
+                    showErrorModal(job.error || 'Ingestion failed. Please check your vector store configuration and try again.');
+                    showToast(job.error || 'Ingestion failed', 'error');
                 }
             } catch (error) {
                 console.error('Catch block error:', error);